@@ -0,0 +1,79 @@
+"""Time to bring a follower that is far behind up to date from the log.
+
+Two nodes start with the same log of --entries entries, the third with an
+empty one. Once a leader is elected the time until the third node has
+committed all the entries is measured. Snapshots are turned off, so the
+follower is caught up from the log alone. Compares a fixed batch of 4
+entries, one message at a time (how followers used to be caught up), a
+fixed batch of 256 entries with a window of messages in flight, and the
+adaptive batch size. Every run is a fresh process (and cluster).
+
+    PYTHONPATH=. python benchmarks/catch_up.py --entries 100000
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from raftnode import cfg
+
+CONFIGS = {
+    'fixed-4': dict(PROPOSAL_BATCH_SIZE=4, REPLICATION_BATCH_TIME=0, REPLICATION_WINDOW=1),
+    'fixed-256': dict(PROPOSAL_BATCH_SIZE=256, REPLICATION_BATCH_TIME=0),
+    'adaptive': dict(),
+}
+
+
+def fill(data_dir: str, addr: str, entries: int):
+    from raftnode.wal import WriteAheadLog
+    log = WriteAheadLog(os.path.join(data_dir, f'wal-{addr.replace(":", "-")}'), fsync='never')
+    for commit_id in range(1, entries + 1):
+        log.append({'key': f'key-{commit_id}', 'value': 'x' * 64, 'term': 1,
+                    'commit_id': commit_id})
+    log.close()
+
+
+def child(name: str, entries: int, port: int):
+    cfg.SNAPSHOT_ENTRIES = 0
+    for key, value in CONFIGS[name].items():
+        setattr(cfg, key, value)
+    from raftnode.raftnode import RaftNode
+    addrs = [f'127.0.0.1:{port + i}' for i in range(3)]
+    data_dir = tempfile.mkdtemp()
+    for addr in addrs[:2]:
+        fill(data_dir, addr, entries)
+    nodes = [RaftNode(my_ip=a, peers=[p for p in addrs if p != a], timeout=1,
+                      data_dir=data_dir) for a in addrs]
+    stores = [node._RaftNode__store for node in nodes]
+    for node in nodes:
+        node.run()
+    while not any(addrs[2] in store.replicators for store in stores[:2]):
+        time.sleep(0.01)
+    start = time.perf_counter()
+    while stores[2].commit_id < entries:
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    print(f'{name:<18} {entries} entries behind   caught up in {elapsed:>7.2f} s'
+          f'   {entries / elapsed:>8.0f} entries/s', flush=True)
+    os._exit(0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--entries', type=int, default=100000)
+    parser.add_argument('--configs', default=','.join(CONFIGS))
+    parser.add_argument('--port', type=int, default=5500)
+    parser.add_argument('--child', default=None)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        child(args.child, args.entries, args.port)
+    for i, name in enumerate(args.configs.split(',')):
+        subprocess.run([sys.executable, __file__, '--child', name,
+                        '--entries', str(args.entries), '--port', str(args.port + 10 * i)])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Encode/decode time and size of the peer messages for every available codec.
+
+Measures the heartbeat, log and commit messages the leader sends to its
+followers, with every codec of `raftnode.codec` (msgpack only when the
+msgpack package is installed).
+
+    PYTHONPATH=. python benchmarks/codec.py --rounds 20000
+"""
+import argparse
+import time
+
+from raftnode.codec import CODECS
+
+MESSAGES = {
+    'heartbeat': {'type': 'heartbeat', 'term': 12, 'addr': '10.0.0.1:5000'},
+    'log': {
+        'type': 'heartbeat', 'term': 12, 'addr': '10.0.0.1:5000',
+        'action': 'log', 'commit_id': 48213,
+        'payload': {'key': 'user:1842', 'value': 'some value of a few bytes',
+                    'namespace': 'default'},
+    },
+    'commit': {
+        'type': 'heartbeat', 'term': 12, 'addr': '10.0.0.1:5000',
+        'action': 'commit', 'commit_id': 48213,
+        'payload': [{'key': f'user:{i}', 'value': f'value {i}', 'namespace': 'default',
+                     'commit_id': 48209 + i} for i in range(4)],
+    },
+}
+
+
+def measure(fn, arg, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn(arg)
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rounds', type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f'{"message":<10} {"codec":<8} {"bytes":>6} {"encode us":>10} {"decode us":>10}')
+    for name, msg in MESSAGES.items():
+        for codec in CODECS.values():
+            payload = codec.encode(msg)
+            assert codec.decode(payload) == msg
+            encode = measure(codec.encode, msg, args.rounds)
+            decode = measure(codec.decode, payload, args.rounds)
+            print(f'{name:<10} {codec.name:<8} {len(payload):>6} {encode:>10.2f} {decode:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
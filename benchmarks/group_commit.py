@@ -0,0 +1,65 @@
+"""Sustained write throughput of the log with and without group commit.
+
+Many writer threads append entries to a `WriteAheadLog` and wait until
+their entry is durable, the way concurrent puts do. Compares one fsync per
+entry (batch size 1) with group commit under every fsync policy.
+
+    PYTHONPATH=. python benchmarks/group_commit.py --writers 32 --seconds 3
+"""
+import argparse
+import tempfile
+import time
+from itertools import count
+from threading import Lock, Thread
+
+from raftnode.wal import WriteAheadLog
+
+CONFIGS = (
+    ('fsync per entry', dict(fsync='batch', batch_size=1)),
+    ('group, batch', dict(fsync='batch')),
+    ('group, interval', dict(fsync='interval')),
+    ('group, never', dict(fsync='never')),
+)
+
+
+def run(name: str, options: dict, writers: int, seconds: float):
+    with tempfile.TemporaryDirectory() as directory:
+        log = WriteAheadLog(directory, **options)
+        ids, lock = count(1), Lock()
+        deadline = time.time() + seconds
+        written = [0] * writers
+
+        def writer(n):
+            while time.time() < deadline:
+                # commit ids are handed out in order, like the Store does
+                with lock:
+                    commit_id = next(ids)
+                    durable = log.append({'key': f'key-{commit_id}', 'value': 'x' * 64,
+                                          'commit_id': commit_id})
+                durable.wait()
+                written[n] += 1
+
+        threads = [Thread(target=writer, args=(n,)) for n in range(writers)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+        log.close()
+    print(f'{name:<18} {sum(written) / elapsed:>10.0f} entries/s')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--writers', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=3)
+    args = parser.parse_args()
+
+    print(f'--- {args.writers} writers')
+    for name, options in CONFIGS:
+        run(name, options, args.writers, args.seconds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Peer RPC latency and throughput: pooled connections vs connect-per-call.
+
+Starts a single transport server on localhost and sends heartbeat RPCs to it,
+once over the pooled connections of `Transport.heartbeat` and once the old
+way (new TCP connection per message).
+
+    PYTHONPATH=. python benchmarks/peer_rpc.py --requests 5000 --threads 8
+"""
+import argparse
+import os
+import socket
+import time
+from json import dumps, loads
+from queue import Queue
+from statistics import median
+from threading import Thread
+
+from raftnode import cfg
+from raftnode.transport import Transport
+
+
+class StubElection:
+    status = cfg.FOLLOWER
+
+    def heartbeat_handler(self, message):
+        return message['term'], 0
+
+
+def connect_per_call(peer, message):
+    host, port = peer.split(':')
+    client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    client.connect((host, int(port)))
+    client.send(bytes(dumps(message), encoding='utf-8'))
+    reply = loads(client.recv(1024).decode('utf-8'))
+    client.close()
+    return reply
+
+
+def run(name, rpc, peer, requests, threads):
+    latencies = []
+
+    def worker(count):
+        for _ in range(count):
+            start = time.perf_counter()
+            rpc(peer, {'type': 'heartbeat', 'term': 1, 'addr': 'bench'})
+            latencies.append(time.perf_counter() - start)
+
+    workers = [Thread(target=worker, args=(requests // threads,))
+               for _ in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f'{name:<18} {len(latencies) / elapsed:>10.0f} req/s   '
+          f'p50 {median(latencies) * 1e6:>7.0f} us   p99 {p99 * 1e6:>7.0f} us')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--port', type=int, default=5100)
+    args = parser.parse_args()
+
+    q = Queue()
+    peer = f'127.0.0.1:{args.port}'
+    server = Transport(peer, timeout=3600, queue=q)
+    q.put({'election': StubElection()})
+    Thread(target=server.serve, daemon=True).start()
+    client = Transport(f'127.0.0.1:{args.port + 1}', timeout=3600, queue=Queue())
+
+    for threads in sorted({1, args.threads}):
+        print(f'--- {threads} thread(s), {args.requests} heartbeats')
+        run('connect-per-call', connect_per_call, peer, args.requests, threads)
+        run('pooled', client.heartbeat, peer, args.requests, threads)
+    os._exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Write throughput of a 3 node cluster for different proposal batch sizes.
+
+Starts a cluster on localhost, waits for a leader and has many clients put
+keys concurrently, each over its own connection to the leader. Every batch
+size runs in a fresh process (and cluster).
+
+    PYTHONPATH=. python benchmarks/proposal_batching.py --writers 32 --batch-sizes 1,8,32,256
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from json import dumps, loads
+from threading import Thread
+
+from raftnode import cfg
+
+
+def call(conn: socket.socket, message: dict) -> dict:
+    conn.sendall(bytes(dumps(message), encoding='utf-8'))
+    return loads(conn.recv(65536).decode('utf-8'))
+
+
+def find_leader(addrs: list) -> int:
+    '''
+    :returns: port of the leader, the one node missing from the
+              peers the leader reports
+    '''
+    while True:
+        host, port = addrs[0].split(':')
+        conn = socket.create_connection((host, int(port)))
+        peers = call(conn, {'type': 'peers'}).get('peers')
+        conn.close()
+        if peers and len(peers) == len(addrs) - 1:
+            leader, = set(addrs) - set(peers)
+            return int(leader.split(':')[1])
+        time.sleep(0.2)
+
+
+def child(batch_size: int, writers: int, seconds: float, port: int):
+    cfg.PROPOSAL_BATCH_SIZE = batch_size
+    from raftnode.raftnode import RaftNode
+    addrs = [f'127.0.0.1:{port + i}' for i in range(3)]
+    data_dir = tempfile.mkdtemp()
+    nodes = [RaftNode(my_ip=a, peers=[p for p in addrs if p != a], timeout=1,
+                      data_dir=data_dir) for a in addrs]
+    for node in nodes:
+        node.run()
+    time.sleep(3)
+    leader = find_leader(addrs)
+    deadline = time.time() + seconds
+    done = [0] * writers
+
+    def writer(n):
+        conn = socket.create_connection(('127.0.0.1', leader))
+        i = 0
+        while time.time() < deadline:
+            reply = call(conn, {'type': 'put', 'key': f'w{n}-{i}', 'value': 'x' * 32})
+            if reply.get('data') is True:
+                done[n] += 1
+            i += 1
+        conn.close()
+
+    threads = [Thread(target=writer, args=(n,)) for n in range(writers)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    print(f'batch size {batch_size:>4}   {sum(done) / elapsed:>8.0f} writes/s', flush=True)
+    os._exit(0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--writers', type=int, default=32)
+    parser.add_argument('--batch-sizes', default='1,8,32,256')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--port', type=int, default=5300)
+    parser.add_argument('--child', type=int, default=None)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        child(args.child, args.writers, args.seconds, args.port)
+    print(f'--- {args.writers} writers')
+    for i, size in enumerate(int(s) for s in args.batch_sizes.split(',')):
+        subprocess.run([sys.executable, __file__, '--child', str(size),
+                        '--writers', str(args.writers), '--seconds', str(args.seconds),
+                        '--port', str(args.port + 10 * i)])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Put latency of 3, 5 and 7 node clusters, with and without a slow peer.
+
+Starts a cluster on localhost, waits for a leader and has a few clients put
+keys. In the slow runs one follower sleeps --delay ms before it handles an
+append message from the leader. The leader replicates to all followers in
+parallel and a put returns as soon as the majority has the entry, so the
+latency should follow the majority and not the slow peer. Every run is a
+fresh process (and cluster).
+
+    PYTHONPATH=. python benchmarks/quorum_latency.py --sizes 3,5,7 --delay 100
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from json import dumps, loads
+from statistics import median
+from threading import Thread
+
+
+def call(conn: socket.socket, message: dict) -> dict:
+    conn.sendall(bytes(dumps(message), encoding='utf-8'))
+    return loads(conn.recv(65536).decode('utf-8'))
+
+
+def find_leader(addrs: list) -> str:
+    '''
+    :returns: address of the leader, the one node missing from the
+              peers the leader reports
+    '''
+    while True:
+        for addr in addrs:
+            host, port = addr.split(':')
+            conn = socket.create_connection((host, int(port)))
+            peers = call(conn, {'type': 'peers'}).get('peers')
+            conn.close()
+            if peers and len(peers) == len(addrs) - 1:
+                leader, = set(addrs) - set(peers)
+                return leader
+        time.sleep(0.2)
+
+
+def slow_down(node, delay: float):
+    '''
+    make the node sleep `delay` seconds before handling appends
+    '''
+    election = node._RaftNode__election
+    handler = election.heartbeat_handler
+
+    def slow_handler(message: dict):
+        if 'action' in message:
+            time.sleep(delay)
+        return handler(message)
+
+    election.heartbeat_handler = slow_handler
+
+
+def child(size: int, delay: float, clients: int, seconds: float, port: int):
+    from raftnode.raftnode import RaftNode
+    addrs = [f'127.0.0.1:{port + i}' for i in range(size)]
+    data_dir = tempfile.mkdtemp()
+    nodes = {a: RaftNode(my_ip=a, peers=[p for p in addrs if p != a], timeout=1,
+                         data_dir=data_dir) for a in addrs}
+    for node in nodes.values():
+        node.run()
+    time.sleep(3)
+    leader = find_leader(addrs)
+    if delay:
+        slow_down(nodes[next(a for a in addrs if a != leader)], delay / 1000)
+    deadline = time.time() + seconds
+    latencies = [[] for _ in range(clients)]
+    failed = [0] * clients
+
+    def client(n):
+        host, port = leader.split(':')
+        conn = socket.create_connection((host, int(port)))
+        i = 0
+        while time.time() < deadline:
+            start = time.perf_counter()
+            reply = call(conn, {'type': 'put', 'key': f'c{n}-{i}', 'value': 'x' * 32})
+            if reply.get('data') is True:
+                latencies[n].append(time.perf_counter() - start)
+            else:
+                failed[n] += 1
+            i += 1
+        conn.close()
+
+    threads = [Thread(target=client, args=(n,)) for n in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    done = sorted(sum(latencies, []))
+    p99 = done[int(len(done) * 0.99) - 1] if done else 0
+    slow = f'slow peer {delay:>4.0f} ms' if delay else 'no slow peer     '
+    print(f'{size} nodes   {slow}   p50 {median(done or [0]) * 1e3:>7.2f} ms'
+          f'   p99 {p99 * 1e3:>7.2f} ms   {len(done) / seconds:>7.0f} puts/s'
+          f'   {sum(failed)} failed', flush=True)
+    os._exit(0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='3,5,7')
+    parser.add_argument('--delay', type=float, default=100)
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--port', type=int, default=5400)
+    parser.add_argument('--child', type=int, default=None)
+    parser.add_argument('--child-delay', type=float, default=0)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        child(args.child, args.child_delay, args.clients, args.seconds, args.port)
+    print(f'--- {args.clients} clients')
+    runs = [(int(s), d) for s in args.sizes.split(',') for d in (0, args.delay)]
+    for i, (size, delay) in enumerate(runs):
+        subprocess.run([sys.executable, __file__, '--child', str(size),
+                        '--child-delay', str(delay), '--clients', str(args.clients),
+                        '--seconds', str(args.seconds), '--port', str(args.port + 10 * i)])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""Get throughput of a cluster, reading from the leader only or from all the
+nodes.
+
+Every node and every client is a process of its own, so the nodes do not
+share an interpreter. Once a leader is elected a key is put and the clients
+get it for --seconds seconds, either all of them from the leader or spread
+over all the nodes. By default every read is linearizable: a follower waits
+for the read index of the leader before it reads (see raftnode.reads), so the
+leader only confirms its leadership instead of serving the reads.
+--consistency sets the consistency of the gets, e.g. bounded(300) to have
+the nodes answer from their own database.
+
+    PYTHONPATH=. python benchmarks/read_scaling.py --sizes 3,5 --clients 8
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from json import dumps, loads
+
+
+def call(conn: socket.socket, message: dict) -> dict:
+    conn.sendall(bytes(dumps(message), encoding='utf-8'))
+    return loads(conn.recv(65536).decode('utf-8'))
+
+
+def find_leader(addrs: list) -> str:
+    while True:
+        for addr in addrs:
+            host, port = addr.split(':')
+            try:
+                conn = socket.create_connection((host, int(port)))
+            except OSError:
+                continue
+            peers = call(conn, {'type': 'peers'}).get('peers')
+            conn.close()
+            if peers and len(peers) == len(addrs) - 1:
+                leader, = set(addrs) - set(peers)
+                return leader
+        time.sleep(0.2)
+
+
+def node(addr: str, addrs: list, data_dir: str):
+    from raftnode.raftnode import RaftNode
+    RaftNode(my_ip=addr, peers=[p for p in addrs if p != addr], timeout=1,
+             data_dir=data_dir).run()
+    while True:
+        time.sleep(60)
+
+
+def client(args):
+    addr, seconds, consistency = args
+    host, port = addr.split(':')
+    conn = socket.create_connection((host, int(port)))
+    reads, deadline = 0, time.time() + seconds
+    while time.time() < deadline:
+        reply = call(conn, {'type': 'get', 'key': 'k', 'consistency': consistency})
+        if isinstance(reply.get('data'), dict):
+            reads += 1
+    conn.close()
+    return reads
+
+
+def run(size: int, clients: int, seconds: float, port: int, consistency: str):
+    addrs = [f'127.0.0.1:{port + i}' for i in range(size)]
+    data_dir = tempfile.mkdtemp()
+    procs = [subprocess.Popen([sys.executable, __file__, '--node', addr,
+                               '--addrs', ','.join(addrs), '--data-dir', data_dir])
+             for addr in addrs]
+    try:
+        time.sleep(3)
+        leader = find_leader(addrs)
+        host, leader_port = leader.split(':')
+        conn = socket.create_connection((host, int(leader_port)))
+        call(conn, {'type': 'put', 'key': 'k', 'value': 'x' * 32})
+        conn.close()
+        with multiprocessing.Pool(clients) as pool:
+            for name, targets in (('leader only', [leader]), ('all nodes', addrs)):
+                jobs = [(targets[i % len(targets)], seconds, consistency) for i in range(clients)]
+                reads = sum(pool.map(client, jobs))
+                print(f'{size} nodes   {name:<12} {reads / seconds:>8.0f} gets/s', flush=True)
+    finally:
+        for proc in procs:
+            proc.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='3,5')
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--port', type=int, default=5600)
+    parser.add_argument('--consistency', default='linearizable')
+    parser.add_argument('--node', default=None)
+    parser.add_argument('--addrs', default=None)
+    parser.add_argument('--data-dir', default=None)
+    args = parser.parse_args()
+
+    if args.node is not None:
+        node(args.node, args.addrs.split(','), args.data_dir)
+    print(f'--- {args.clients} clients, {os.cpu_count()} cpus, {args.consistency} gets')
+    for i, size in enumerate(int(s) for s in args.sizes.split(',')):
+        run(size, args.clients, args.seconds, args.port + 10 * i, args.consistency)
+
+
+if __name__ == '__main__':
+    main()
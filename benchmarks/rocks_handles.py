@@ -0,0 +1,95 @@
+"""Put and get throughput of RockStore, opening the database per operation,
+keeping the handles open or keeping the namespaces in column families.
+
+The first run opens the database of the namespace for every operation, the
+way RockStore used to; the second goes through RockStore, which keeps the
+handles open and shares the block cache; the third keeps every namespace in
+a column family of one database. The open file descriptors after each run
+are printed too. Needs the rocksdb extra, with column family support for the
+third run.
+
+    PYTHONPATH=. python benchmarks/rocks_handles.py --ops 20000 --namespaces 64
+"""
+import argparse
+import os
+import tempfile
+import time
+from os import path
+
+import rocksdb
+
+from raftnode.datastore.rocks import RockStore
+
+
+def options() -> rocksdb.Options:
+    opts = rocksdb.Options(create_if_missing=True)
+    opts.table_factory = rocksdb.BlockBasedTableFactory(
+        filter_policy=rocksdb.BloomFilterPolicy(10),
+        block_cache=rocksdb.LRUCache(2 * (1024 ** 3)),
+        block_cache_compressed=rocksdb.LRUCache(500 * (1024 ** 2)))
+    return opts
+
+
+def reopen(data_dir: str, ops: int, namespaces: int):
+    opts = options()
+
+    def put(key, value, namespace):
+        db = rocksdb.DB(path.join(data_dir, namespace), opts)
+        db.put(key.encode(), value.encode())
+
+    def get(key, namespace):
+        db = rocksdb.DB(path.join(data_dir, namespace), opts)
+        return db.get(key.encode())
+
+    return run('open per operation', put, get, ops, namespaces)
+
+
+def cached(data_dir: str, ops: int, namespaces: int):
+    store = RockStore(data_dir=data_dir, config={'max_open_dbs': namespaces})
+    try:
+        return run('cached handles', store.put, store.get, ops, namespaces)
+    finally:
+        store.close()
+
+
+def column_families(data_dir: str, ops: int, namespaces: int):
+    store = RockStore(data_dir=data_dir, config={'namespaces': 'column_families'})
+    try:
+        return run('column families', store.put, store.get, ops, namespaces)
+    finally:
+        store.close()
+
+
+def open_files() -> int:
+    return len(os.listdir('/proc/self/fd')) if os.path.isdir('/proc/self/fd') else -1
+
+
+def run(name: str, put, get, ops: int, namespaces: int):
+    start = time.perf_counter()
+    for i in range(ops):
+        put(f'key-{i}', 'x' * 64, namespace=f'ns{i % namespaces}')
+    puts = ops / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for i in range(ops):
+        get(f'key-{i}', namespace=f'ns{i % namespaces}')
+    gets = ops / (time.perf_counter() - start)
+    print(f'{name:<20} put {puts:>10.0f} ops/s   get {gets:>10.0f} ops/s'
+          f'   {open_files():>6} open files')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ops', type=int, default=20000)
+    parser.add_argument('--namespaces', type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        reopen(data_dir, args.ops, args.namespaces)
+    with tempfile.TemporaryDirectory() as data_dir:
+        cached(data_dir, args.ops, args.namespaces)
+    with tempfile.TemporaryDirectory() as data_dir:
+        column_families(data_dir, args.ops, args.namespaces)
+
+
+if __name__ == '__main__':
+    main()
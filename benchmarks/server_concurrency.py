@@ -0,0 +1,99 @@
+"""Request throughput of Transport.serve with 1, 8 and 64 concurrent clients.
+
+Every client keeps one connection open and sends `get` requests in a loop for
+`--duration` seconds. A second round sends `put` requests that block for
+MAX_LOG_WAIT ms (the worst case quorum wait) while heartbeat latency is
+measured on the side, to show that peer traffic is not queued behind them.
+
+    PYTHONPATH=. python benchmarks/server_concurrency.py --duration 3
+"""
+import argparse
+import os
+import socket
+import time
+from json import dumps, loads
+from queue import Queue
+from statistics import median
+from threading import Event, Thread
+
+from raftnode import cfg
+from raftnode.transport import Transport
+
+
+class StubElection:
+    status = cfg.LEADER
+
+    def heartbeat_handler(self, message):
+        return message['term'], 0
+
+    def handle_get(self, payload):
+        return {'key': payload['key'], 'value': 'value'}
+
+    def handle_put(self, payload):
+        time.sleep(cfg.MAX_LOG_WAIT / 1000)
+        return True
+
+
+def client(addr, msg_type, stop, counts):
+    host, port = addr.split(':')
+    s = socket.create_connection((host, int(port)))
+    message = bytes(dumps({'type': msg_type, 'key': 'k', 'value': 'v'}), encoding='utf-8')
+    done = 0
+    while not stop.is_set():
+        s.sendall(message)
+        loads(s.recv(1024).decode('utf-8'))
+        done += 1
+    counts.append(done)
+    s.close()
+
+
+def round_trip(addr, msg_type, clients, duration, heartbeats=None):
+    stop, counts = Event(), []
+    threads = [Thread(target=client, args=(addr, msg_type, stop, counts))
+               for _ in range(clients)]
+    for t in threads:
+        t.start()
+    start = time.perf_counter()
+    if heartbeats:
+        latencies = []
+        while time.perf_counter() - start < duration:
+            hb_start = time.perf_counter()
+            heartbeats.heartbeat(addr, {'term': 1, 'addr': 'bench'})
+            latencies.append(time.perf_counter() - hb_start)
+            time.sleep(cfg.HB_TIME / 1000)
+    else:
+        time.sleep(duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    line = f'{msg_type:<4} {clients:>3} clients {sum(counts) / elapsed:>10.0f} req/s'
+    if heartbeats:
+        latencies.sort()
+        line += (f'   heartbeat p50 {median(latencies) * 1e3:.2f} ms'
+                 f'  max {latencies[-1] * 1e3:.2f} ms')
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--duration', type=float, default=3)
+    parser.add_argument('--port', type=int, default=5110)
+    args = parser.parse_args()
+
+    q = Queue()
+    addr = f'127.0.0.1:{args.port}'
+    server = Transport(addr, timeout=3600, queue=q)
+    q.put({'election': StubElection()})
+    Thread(target=server.serve, daemon=True).start()
+    peer = Transport(f'127.0.0.1:{args.port + 1}', timeout=3600, queue=Queue())
+
+    for clients in (1, 8, 64):
+        round_trip(addr, 'get', clients, args.duration)
+    for clients in (1, 8, 64):
+        round_trip(addr, 'put', clients, args.duration, heartbeats=peer)
+    os._exit(0)
+
+
+if __name__ == '__main__':
+    main()
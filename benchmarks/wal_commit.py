@@ -0,0 +1,83 @@
+"""Commit latency of the Store as the log grows.
+
+Fills the log of a `Store` with 1k, 100k and 1M entries and then measures
+the latency of `Store.commit`, until the entry is durable, on top of it.
+With the shelve based log every commit rewrote the whole log; pass --shelve
+to time that approach as well (only up to --shelve-max entries, it gets
+slow quickly).
+
+    PYTHONPATH=. python benchmarks/wal_commit.py --sizes 1000,100000,1000000
+"""
+import argparse
+import shelve
+import tempfile
+import time
+from collections import deque
+from os import path
+from statistics import median
+
+from raftnode.store import Store
+
+
+def entry(commit_id: int) -> dict:
+    return {'key': f'key-{commit_id}', 'value': f'value {commit_id}',
+            'namespace': 'default', 'commit_id': commit_id}
+
+
+def report(name: str, size: int, latencies: list):
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f'{name:<8} {size:>9} entries   p50 {median(latencies) * 1e6:>9.1f} us'
+          f'   p99 {p99 * 1e6:>9.1f} us')
+
+
+def bench_wal(size: int, commits: int):
+    with tempfile.TemporaryDirectory() as data_dir:
+        store = Store(data_dir=data_dir)
+        for commit_id in range(1, size + 1):
+            store.log.append(entry(commit_id))
+        store.commit_id = size
+        latencies = []
+        for _ in range(commits):
+            start = time.perf_counter()
+            store.commit({'key': 'k', 'value': 'v'}).wait()
+            latencies.append(time.perf_counter() - start)
+        store.log.close()
+    report('wal', size, latencies)
+
+
+def bench_shelve(size: int, commits: int):
+    '''
+    the commit path of the shelve based log: append, close, reopen
+    '''
+    with tempfile.TemporaryDirectory() as data_dir:
+        filename = path.join(data_dir, 'OrderedLog')
+        f = shelve.open(filename, writeback=True)
+        f['data'] = deque(entry(commit_id) for commit_id in range(1, size + 1))
+        f.close()
+        latencies = []
+        for commit_id in range(size + 1, size + commits + 1):
+            start = time.perf_counter()
+            f = shelve.open(filename, writeback=True)
+            f['data'].append(entry(commit_id))
+            f.close()
+            latencies.append(time.perf_counter() - start)
+    report('shelve', size, latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='1000,100000,1000000')
+    parser.add_argument('--commits', type=int, default=1000)
+    parser.add_argument('--shelve', action='store_true')
+    parser.add_argument('--shelve-max', type=int, default=100000)
+    args = parser.parse_args()
+
+    for size in (int(s) for s in args.sizes.split(',')):
+        bench_wal(size, args.commits)
+        if args.shelve and size <= args.shelve_max:
+            bench_shelve(size, max(args.commits // 10, 10))
+
+
+if __name__ == '__main__':
+    main()
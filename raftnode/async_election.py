@@ -0,0 +1,147 @@
+import asyncio
+import time
+from queue import Queue
+
+from raftnode import cfg, logger
+from raftnode.async_transport import AsyncTransport
+from raftnode.election import Election
+from raftnode.store import Store
+
+
+class AsyncElection(Election):
+
+    '''
+    asyncio flavour of the `Election`. The election timeout is a timer on
+    the event loop of the `AsyncTransport` instead of a sleeping thread, and
+    the vote requests and heartbeats to the peers are tasks on that loop
+    instead of one thread per peer
+    '''
+
+    def __init__(self, transport: AsyncTransport, store: Store, queue: Queue):
+        self.transport = transport
+        self.loop = transport.loop
+        self.timer = None
+        self.heartbeats = dict()
+        self.beat = None
+        super().__init__(transport, store, queue)
+
+    def ask_for_vote(self):
+        '''
+        ask the other nodes in the cluster to vote
+        so that this node can become the leader
+        '''
+        for peer in self.peers:
+            self.transport.spawn(self.asend_vote_request(peer, self.term))
+
+    async def asend_vote_request(self, voter: str, term: int):
+        '''
+        coroutine version of `Election.send_vote_request`
+        '''
+        message = {
+            'type': 'vote_request',
+            'term': term,
+            'last_term': self.store.last_log_term,
+            'last_index': self.store.last_index
+        }
+        while self.status == cfg.CANDIDATE and self.term == term:
+            vote_reply = await self.transport.arequest(voter, message)
+            if vote_reply:
+                choice = vote_reply['choice']
+                logger.debug(f'choice from {voter} is {choice}')
+                if choice and self.status == cfg.CANDIDATE:
+                    self.increment_vote()
+                elif not choice:
+                    term = vote_reply['term']
+                    if term > self.term:
+                        self.status = cfg.FOLLOWER
+                break
+            await asyncio.sleep(cfg.HB_TIME / 1000)
+
+    def start_heartbeat(self):
+        '''
+        If this node is elected as the leader, start sending
+        heartbeats to the follower nodes
+        '''
+        self.transport.spawn(self.astart_heartbeat())
+
+    async def astart_heartbeat(self):
+        await self.loop.run_in_executor(self.transport.background, self.commit_staged)
+        if self.beat is None:
+            self.beat = asyncio.Event()
+        logger.info(f"I'm the leader of the pack for the term {self.term}")
+        logger.debug('sending heartbeat to peers')
+        for peer in self.peers:
+            task = self.heartbeats.get(peer)
+            if task and not task.done():
+                continue
+            self.heartbeats[peer] = self.loop.create_task(self.asend_heartbeat(peer))
+
+    async def asend_heartbeat(self, peer: str):
+        '''
+        coroutine version of `Election.send_heartbeat`
+        '''
+        term = self.term
+        message = {'type': 'heartbeat', 'term': term, 'addr': self.transport.addr}
+        while self.status == cfg.LEADER:
+            logger.debug(f'[PEER HEARTBEAT] {peer}')
+            message['commit_index'] = self.store.commit_id
+            start, sent_at = self.loop.time(), time.time()
+            reply = await self.transport.arequest(peer, message)
+            if reply:
+                if reply['term'] > self.term:
+                    self.term = reply['term']
+                    self.status = cfg.FOLLOWER
+                    self.init_timeout()
+                else:
+                    self.heartbeat_acked(peer, term, sent_at)
+            logger.debug(f'[PEER HEARTBEAT RESPONSE] {peer} {reply}')
+            delta = self.loop.time() - start
+            try:
+                await asyncio.wait_for(self.beat.wait(), max(cfg.HB_TIME / 1000 - delta, 0))
+            except asyncio.TimeoutError:
+                pass
+
+    def request_heartbeats(self):
+        '''
+        have the heartbeats sent to the peers right away; the heartbeat
+        tasks waiting on the loop are woken up
+        '''
+        super().request_heartbeats()
+        if self.beat is not None:
+            self.loop.call_soon_threadsafe(self.__wake)
+
+    def __wake(self):
+        self.beat.set()
+        self.beat.clear()
+
+    def init_timeout(self):
+        '''
+        arm the election timer on the event loop, unless it is
+        already armed
+        '''
+        logger.info('starting timeout')
+        self.reset_timeout()
+        self.loop.call_soon_threadsafe(self.__arm)
+
+    def __arm(self, delay: float = None):
+        if self.timer:
+            return
+        if delay is None:
+            delay = max(self.election_time - time.time(), 0)
+        self.timer = self.loop.call_later(delay, self.__on_timeout)
+
+    def __on_timeout(self):
+        '''
+        timer version of `Election.timeout_loop`: if the election time has
+        passed without a heartbeat from the leader, start the election;
+        otherwise sleep until the (reset) election time
+        '''
+        self.timer = None
+        if self.status == cfg.LEADER:
+            return
+        if self.election_time - time.time() < 0:
+            if self.transport.peers:
+                self.start_election()
+            else:
+                self.reset_timeout()
+        self.__arm()
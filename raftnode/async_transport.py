@@ -0,0 +1,286 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from json import dumps
+from queue import Queue
+from threading import Thread, get_ident
+
+from raftnode import cfg, logger
+from raftnode.pool import AsyncConnectionPool
+from raftnode.protocol import (HEADER, MAGIC, decode_payload, encode_payload,
+                               pack_header, unpack_header)
+from raftnode.transport import MessageBuffer, Transport
+
+
+class AsyncTransport(Transport):
+
+    '''
+    asyncio flavour of the `Transport`. The server, the peer RPCs and the
+    ping timer all run on one event loop (in one thread) instead of a
+    thread per connection, ping and RPC.
+
+    Handlers that may block (a put waiting for its quorum, a redirect to
+    the leader, a log/commit action of the leader) are run in bounded
+    thread pools, so the number of threads stays constant no matter how
+    many peers, clients or messages there are.
+
+    The blocking RPC methods of `Transport` (heartbeat, vote_request, ...)
+    keep working from those threads: they submit the request to the event
+    loop and wait for the reply.
+    '''
+
+    def __init__(self, my_ip: str, timeout: int, queue: Queue):
+        self.loop = asyncio.new_event_loop()
+        self.client_executor = ThreadPoolExecutor(cfg.CLIENT_WORKERS)
+        self.peer_executor = ThreadPoolExecutor(cfg.PEER_WORKERS)
+        self.background = ThreadPoolExecutor(cfg.PEER_WORKERS)
+        self.apool = AsyncConnectionPool()
+        self.loop_thread = Thread(target=self.loop.run_forever, daemon=True)
+        self.loop_thread.start()
+        super().__init__(my_ip, timeout, queue)
+
+    def in_loop(self) -> bool:
+        '''
+        True if the caller runs on the event loop thread
+        '''
+        return get_ident() == self.loop_thread.ident
+
+    def spawn(self, coro):
+        '''
+        schedule the coroutine on the event loop; safe to call
+        from any thread
+        '''
+        if self.in_loop():
+            return self.loop.create_task(coro)
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def submit(self, fn, *args):
+        '''
+        run the blocking function `fn(*args)` in the background thread pool
+        '''
+        return self.background.submit(fn, *args)
+
+    def start_ping(self, timeout: float):
+        '''
+        ping the peers every `timeout` seconds from a timer on the event loop
+        '''
+        self.loop.call_soon_threadsafe(self.__ping, float(timeout))
+
+    def __ping(self, timeout: float):
+        if self.peers:
+            logger.debug(f'peers >>> {self.peers}')
+            for peer in self.peers:
+                self.loop.create_task(self.aecho(peer))
+        else:
+            logger.debug('ping  >>> no peers to ping')
+        self.loop.call_later(timeout, self.__ping, timeout)
+
+    def serve(self):
+        '''
+        start serving the clients and peers on the event loop. Unlike
+        `Transport.serve` this function does not block
+        '''
+        self.election = self.q.get()['election']
+        asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self.handle_client, sock=self.server), self.loop)
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        '''
+        serve the messages of one connection until the other end closes it.
+        Framed requests are handled concurrently and answered as they
+        complete; plain JSON messages are answered one after the other
+        '''
+        try:
+            first = await reader.read(cfg.RECV_BUFFER)
+            if first[:1] == MAGIC[:1]:
+                await self.__serve_frames(first, reader, writer)
+            elif first:
+                await self.__serve_json(first, reader, writer)
+        except (ConnectionResetError, BrokenPipeError, asyncio.IncompleteReadError, ValueError) as e:
+            return
+        finally:
+            writer.close()
+
+    async def __serve_json(self, data: bytes, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        buffer = MessageBuffer()
+        while data:
+            messages = buffer.feed(data)
+            if messages is None:
+                writer.write(bytes(self.addr, encoding='utf-8'))
+                await writer.drain()
+                return
+            for msg in messages:
+                if msg.get('type') == 'watch':
+                    # the watch streams on the connection until it ends
+                    await self.__stream(msg, partial(self.__send_json, writer))
+                    continue
+                reply = await self.ahandle_message(msg)
+                if reply is None:
+                    return
+                writer.write(bytes(dumps(reply), encoding='utf-8'))
+                await writer.drain()
+            data = await reader.read(cfg.RECV_BUFFER)
+
+    async def __serve_frames(self, data: bytes, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        drain_lock = asyncio.Lock()
+        if len(data) < HEADER.size:
+            data += await reader.readexactly(HEADER.size - len(data))
+        while True:
+            codec, request_id, length = unpack_header(data[:HEADER.size])
+            payload = data[HEADER.size:HEADER.size + length]
+            if len(payload) < length:
+                payload += await reader.readexactly(length - len(payload))
+            data = data[HEADER.size + length:]
+            msg = decode_payload(payload, codec)
+            if msg.get('type') == 'watch':
+                send = partial(self.__send_frame, writer, drain_lock, request_id, codec)
+                self.loop.create_task(self.__stream(msg, send))
+            else:
+                self.loop.create_task(self.__serve_frame(writer, drain_lock, request_id, codec, msg))
+            if len(data) < HEADER.size:
+                data += await reader.readexactly(HEADER.size - len(data))
+
+    async def __serve_frame(self, writer: asyncio.StreamWriter, drain_lock: asyncio.Lock, request_id: int, codec: int, msg: dict):
+        reply = await self.ahandle_message(msg)
+        if writer.is_closing():
+            return
+        if reply is None:
+            writer.close()
+            return
+        await self.__send_frame(writer, drain_lock, request_id, codec, reply)
+
+    async def __send_frame(self, writer: asyncio.StreamWriter, drain_lock: asyncio.Lock, request_id: int, codec: int, reply: dict) -> bool:
+        if writer.is_closing():
+            return False
+        payload = encode_payload(reply, codec)
+        writer.writelines([pack_header(request_id, len(payload), codec), payload])
+        async with drain_lock:
+            try:
+                await writer.drain()
+            except (ConnectionResetError, BrokenPipeError) as e:
+                writer.close()
+                return False
+        return True
+
+    async def __send_json(self, writer: asyncio.StreamWriter, reply: dict) -> bool:
+        if writer.is_closing():
+            return False
+        writer.write(bytes(dumps(reply), encoding='utf-8'))
+        try:
+            await writer.drain()
+        except (ConnectionResetError, BrokenPipeError) as e:
+            return False
+        return True
+
+    async def __stream(self, msg: dict, send):
+        '''
+        coroutine version of `Transport.watch_replies`: push the replies
+        of a watch with `send` until the watch ends or `send` fails. The
+        watch sets an event on the loop when it has changes, so a watch
+        does not hold a thread while it waits; only the replay of the
+        changes before it from the log runs in the thread pool
+        '''
+        self.refresh_election()
+        watch = await self.loop.run_in_executor(self.client_executor, self.election.handle_watch, msg)
+        if isinstance(watch, str):
+            await send({'type': 'watch', 'data': watch})
+            return
+        changed = asyncio.Event()
+        watch.listener = partial(self.loop.call_soon_threadsafe, changed.set)
+        try:
+            while True:
+                changed.clear()
+                if watch.replaying:
+                    data = await self.loop.run_in_executor(self.client_executor, watch.take)
+                else:
+                    data = watch.take()
+                if not await send({'type': 'watch', 'data': data}) or 'error' in data:
+                    return
+                if not watch.ready:
+                    try:
+                        await asyncio.wait_for(changed.wait(), cfg.WATCH_KEEPALIVE / 1000)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            self.election.store.unwatch(watch)
+
+    async def ahandle_message(self, msg: dict) -> dict:
+        '''
+        handle the message on the event loop if that can not block,
+        otherwise in the thread pool of its traffic class
+        '''
+        self.refresh_election()
+        msg_type = msg.get('type')
+        if msg_type in ('ping', 'vote_request', 'hello') or (msg_type == 'heartbeat' and 'action' not in msg):
+            return self.handle_message(msg)
+        if msg_type in cfg.PEER_MESSAGES:
+            executor = self.peer_executor
+        else:
+            executor = self.client_executor
+        try:
+            return await self.loop.run_in_executor(executor, self.handle_message, msg)
+        except Exception as e:
+            logger.exception(f'failed to handle message {msg}')
+            return None
+
+    async def areconnect(self, addr: str):
+        '''
+        coroutine version of `Transport.reconnect`
+        '''
+        try:
+            return await self.apool.acquire(addr)
+        except ConnectionRefusedError:
+            if addr in self.peers:
+                with self.lock:
+                    self.peers.remove(addr)
+        except (TimeoutError, asyncio.TimeoutError) as e:
+            logger.info(f'Timeout error connecting to peer {addr}')
+            logger.info(f'Removing peer {addr} from list of peers')
+            if addr in self.peers:
+                with self.lock:
+                    self.peers.remove(addr)
+        except OSError as e:
+            logger.info(f'Could not connect to peer {addr}: {e}')
+
+    async def arequest(self, peer: str, message: dict) -> dict:
+        '''
+        coroutine version of `Transport.request`
+        '''
+        for attempt in range(2):
+            channel = await self.areconnect(peer)
+            if not channel:
+                return None
+            try:
+                return await channel.request(message, self.apool.timeout)
+            except asyncio.TimeoutError as e:
+                logger.info(f'[POOL] timeout waiting for peer {peer}')
+                return None
+            except OSError as e:
+                logger.debug(f'[POOL] lost connection to peer {peer}: {e}')
+                self.apool.discard(peer, channel)
+        return None
+
+    async def aecho(self, peer: str) -> bool:
+        echo_reply = await self.arequest(peer, {'type': 'ping'})
+        if echo_reply:
+            logger.debug('ping  >>> {}'.format(echo_reply))
+            if echo_reply['is_alive']:
+                return True
+        return False
+
+    def request(self, peer: str, message: dict) -> dict:
+        '''
+        blocking facade of `arequest` for the callers running in threads
+        '''
+        if self.in_loop():
+            raise RuntimeError('blocking request called from the event loop')
+        return asyncio.run_coroutine_threadsafe(
+            self.arequest(peer, message), self.loop).result()
+
+    def send_request(self, peer: str, message: dict):
+        '''
+        non-blocking facade of `arequest`; the future resolves to
+        None if the peer could not be reached
+        '''
+        return asyncio.run_coroutine_threadsafe(
+            self.arequest(peer, message), self.loop)
@@ -19,6 +19,8 @@ def main():
                                                     ) + '\n' + str(render_examples('Default: 1')) + '\n' + str(render_examples('Example --timeout 0.5')), default=1)
     parser.add_argument(
         '-v', '--volume', help=str(render_help('the database files will be kept in this directory.')) + '\n' + str(render_examples('Default: ./data')) + '\n' + str(render_examples('Example: --volume ./data')), default='data')
+    parser.add_argument(
+        '-e', '--engine', help=str(render_help('thread: blocking sockets served by worker threads; asyncio: the server, the peer requests and the timers run on one event loop.')) + '\n' + str(render_examples('Default: thread')) + '\n' + str(render_examples('Example: --engine asyncio')), choices=['thread', 'asyncio'], default='thread')
     args = parser.parse_args()
 
     store_type = 'memory'
@@ -32,8 +34,9 @@ def main():
         store_type = 'database'
         
 
-    node = Node(my_ip=args.ip, peers=peers, timeout=args.timeout, store_type=store_type, data_dir=args.volume)
+    node = Node(my_ip=args.ip, peers=peers, timeout=args.timeout, engine=args.engine, store_type=store_type, data_dir=args.volume)
     node.run()
+    node.wait()
 
 def render_help(msg: str):
     msg = bold(magenta(msg))
@@ -0,0 +1,258 @@
+'''
+Message codecs of the framed wire protocol.
+
+Every frame names the codec its message is encoded with. Two nodes agree on
+the codec to use when a channel is opened (see `ConnectionPool.connect`):
+the connecting node lists the codecs it supports in a `hello` message, sent
+as JSON, and the other node picks the first one of it's own PEER_CODECS that
+is in that list. Nodes that do not know the `hello` message make the
+connecting node fall back to JSON, so mixed-version clusters keep working.
+
+* ``json`` (0): the JSON text the clients send
+* ``binary`` (1): a compact tagged binary encoding; frequent keys and values
+  such as ``term``, ``commit_id`` or ``heartbeat`` are sent as one byte,
+  small integers as one byte and other integers as varints
+* ``msgpack`` (2): MessagePack, only available if the msgpack package is
+  installed (``pip install raftnode[msgpack]``)
+
+A payload that can not be decoded raises a ValueError, whatever the codec,
+so the connection it came on can be dropped.
+'''
+from json import dumps, loads
+from struct import Struct, error as StructError
+
+from raftnode import cfg
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class JSONCodec:
+
+    id = 0
+    name = 'json'
+
+    def encode(self, msg) -> bytes:
+        return bytes(dumps(msg), encoding='utf-8')
+
+    def decode(self, payload):
+        try:
+            return loads(str(payload, encoding='utf-8'))
+        except RecursionError:
+            raise ValueError('message nested too deep')
+
+
+class MsgpackCodec:
+
+    id = 2
+    name = 'msgpack'
+
+    def encode(self, msg) -> bytes:
+        return msgpack.packb(msg, use_bin_type=True)
+
+    def decode(self, payload):
+        try:
+            return msgpack.unpackb(payload, raw=False)
+        except (TypeError, RecursionError) as e:
+            raise ValueError(f'bad msgpack message: {e!r}')
+
+
+class BinaryCodec:
+
+    '''
+    Compact tagged binary encoding. Every value starts with a tag byte:
+
+    * 0x00 - 0x0f: None, False, True, negative int, float, str, bytes,
+      list and dict; variable length values carry a varint length
+    * 0x40 - 0x7f: one of the interned strings of `WORDS`
+    * 0x80 - 0xff: an integer between 0 and 127
+    '''
+
+    id = 1
+    name = 'binary'
+
+    NONE, FALSE, TRUE, INT, NEG_INT, FLOAT, STR, BYTES, LIST, DICT = range(10)
+    WORD, SMALL_INT = 0x40, 0x80
+
+    # the words are part of the wire format and fill all of 0x40 - 0x7f:
+    # the table is frozen, a node can not know a word an older node does not
+    WORDS = (
+        'type', 'term', 'addr', 'action', 'commit_id', 'payload', 'key',
+        'value', 'namespace', 'delete', 'choice', 'staged', 'is_alive',
+        'data', 'sender', 'peers', 'heartbeat', 'vote_request', 'ping',
+        'add_peer', 'log', 'commit', 'put', 'get', 'default', 'hello',
+        'codec', 'codecs', 'append', 'prev_index', 'commit_index',
+        'last_index', 'noop', 'snapshot', 'last_term', 'offset', 'done',
+        'snapshot_offset', 'prev_term', 'success', 'conflict_index',
+        'conflict_term', 'keys', 'expires_at', 'expire', 'evict',
+        'read_index', 'mput', 'mget', 'mdelete', 'items', 'values',
+        'scan', 'prefix', 'start', 'end', 'limit', 'token', 'watch',
+        'since', 'changes', 'coalesced', 'txn', 'cas',
+    )
+
+    DOUBLE = Struct('!d')
+
+    def __init__(self):
+        self.words = {word: self.WORD + i for i, word in enumerate(self.WORDS)}
+
+    def encode(self, msg) -> bytes:
+        out = bytearray()
+        self.__encode(msg, out)
+        return bytes(out)
+
+    def decode(self, payload):
+        '''
+        :raises ValueError: if the payload is truncated or not a value
+        '''
+        try:
+            value, _ = self.__decode(memoryview(payload), 0)
+        except (IndexError, StructError, RecursionError, TypeError) as e:
+            # truncated, or a list or dict as the key of a dict
+            raise ValueError(f'bad binary message: {e!r}')
+        return value
+
+    def __encode(self, value, out: bytearray):
+        if value is None:
+            out.append(self.NONE)
+        elif value is True:
+            out.append(self.TRUE)
+        elif value is False:
+            out.append(self.FALSE)
+        elif isinstance(value, int):
+            if 0 <= value < 0x80:
+                out.append(self.SMALL_INT + value)
+            elif value >= 0:
+                out.append(self.INT)
+                self.__varint(value, out)
+            else:
+                out.append(self.NEG_INT)
+                self.__varint(-value, out)
+        elif isinstance(value, str):
+            tag = self.words.get(value)
+            if tag:
+                out.append(tag)
+            else:
+                data = value.encode('utf-8')
+                out.append(self.STR)
+                self.__varint(len(data), out)
+                out += data
+        elif isinstance(value, dict):
+            out.append(self.DICT)
+            self.__varint(len(value), out)
+            for key, item in value.items():
+                self.__encode(key, out)
+                self.__encode(item, out)
+        elif isinstance(value, (list, tuple)):
+            out.append(self.LIST)
+            self.__varint(len(value), out)
+            for item in value:
+                self.__encode(item, out)
+        elif isinstance(value, float):
+            out.append(self.FLOAT)
+            out += self.DOUBLE.pack(value)
+        elif isinstance(value, (bytes, bytearray)):
+            out.append(self.BYTES)
+            self.__varint(len(value), out)
+            out += value
+        else:
+            raise TypeError(f'can not encode {type(value)}')
+
+    @staticmethod
+    def __varint(n: int, out: bytearray):
+        while n >= 0x80:
+            out.append((n & 0x7f) | 0x80)
+            n >>= 7
+        out.append(n)
+
+    @staticmethod
+    def __read_varint(buf: memoryview, pos: int) -> tuple:
+        n = shift = 0
+        while True:
+            byte = buf[pos]
+            pos += 1
+            n |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return n, pos
+            shift += 7
+
+    def __decode(self, buf: memoryview, pos: int) -> tuple:
+        tag = buf[pos]
+        pos += 1
+        if tag >= self.SMALL_INT:
+            return tag - self.SMALL_INT, pos
+        if tag >= self.WORD:
+            if tag - self.WORD >= len(self.WORDS):
+                raise ValueError(f'unknown word {tag}')
+            return self.WORDS[tag - self.WORD], pos
+        if tag == self.NONE:
+            return None, pos
+        if tag == self.TRUE:
+            return True, pos
+        if tag == self.FALSE:
+            return False, pos
+        if tag in (self.INT, self.NEG_INT):
+            n, pos = self.__read_varint(buf, pos)
+            return (n if tag == self.INT else -n), pos
+        if tag == self.FLOAT:
+            return self.DOUBLE.unpack_from(buf, pos)[0], pos + self.DOUBLE.size
+        if tag in (self.STR, self.BYTES):
+            length, pos = self.__read_varint(buf, pos)
+            if pos + length > len(buf):
+                raise ValueError(f'truncated {length} bytes')
+            data = buf[pos:pos + length]
+            if tag == self.STR:
+                return str(data, encoding='utf-8'), pos + length
+            return bytes(data), pos + length
+        if tag == self.LIST:
+            count, pos = self.__read_varint(buf, pos)
+            items = list()
+            for _ in range(count):
+                item, pos = self.__decode(buf, pos)
+                items.append(item)
+            return items, pos
+        if tag == self.DICT:
+            count, pos = self.__read_varint(buf, pos)
+            items = dict()
+            for _ in range(count):
+                key, pos = self.__decode(buf, pos)
+                items[key], pos = self.__decode(buf, pos)
+            return items, pos
+        raise ValueError(f'unknown tag {tag}')
+
+
+CODECS = {codec.id: codec for codec in (JSONCodec(), BinaryCodec())}
+if msgpack:
+    CODECS[MsgpackCodec.id] = MsgpackCodec()
+
+JSON = JSONCodec.id
+
+
+def get_codec(codec_id: int):
+    try:
+        return CODECS[codec_id]
+    except KeyError:
+        raise ValueError(f'unknown codec {codec_id}')
+
+
+def preferred_codecs() -> list:
+    '''
+    ids of the codecs listed in PEER_CODECS that are available on this
+    node, in order of preference. JSON is always supported
+    '''
+    by_name = {codec.name: codec.id for codec in CODECS.values()}
+    ids = [by_name[name] for name in cfg.PEER_CODECS if name in by_name]
+    if JSON not in ids:
+        ids.append(JSON)
+    return ids
+
+
+def choose_codec(offered: list) -> int:
+    '''
+    pick the codec for a channel from the codecs the other node `offered`
+    '''
+    for codec_id in preferred_codecs():
+        if codec_id in offered:
+            return codec_id
+    return JSON
@@ -1,3 +1,4 @@
+from json import loads
 from random import randrange
 from os import getenv
 
@@ -10,6 +11,87 @@ HIGH_TIMEOUT =  int(getenv('HIGH_TIMEOUT', 300))
 REQUESTS_TIMEOUT = 50
 HB_TIME = int(getenv('HB_TIME', 50))
 MAX_LOG_WAIT = int(getenv('MAX_LOG_WAIT', 150))
+PROPOSAL_BATCH_SIZE = int(getenv('PROPOSAL_BATCH_SIZE', 256))
+# append messages in flight per follower; keep it below PEER_WORKERS,
+# the followers handle the appends of one leader on that many workers
+REPLICATION_WINDOW = int(getenv('REPLICATION_WINDOW', 3))
+# append messages are sized so the follower takes about REPLICATION_BATCH_TIME
+# ms to handle one (0 keeps them at PROPOSAL_BATCH_SIZE entries), and kept
+# below REPLICATION_BATCH_BYTES
+REPLICATION_BATCH_TIME = float(getenv('REPLICATION_BATCH_TIME', 20))
+REPLICATION_BATCH_BYTES = int(getenv('REPLICATION_BATCH_BYTES', 1024 ** 2))
+# committed entries kept in memory for followers that are a little behind;
+# older ones are read from the write-ahead log
+LOG_CACHE_ENTRIES = int(getenv('LOG_CACHE_ENTRIES', 10000))
+
+PEER_TIMEOUT = int(getenv('PEER_TIMEOUT', 5000))
+POOL_SIZE = int(getenv('POOL_SIZE', 2))
+POOL_IDLE_TIMEOUT = int(getenv('POOL_IDLE_TIMEOUT', 30000))
+POOL_BACKOFF_MIN = int(getenv('POOL_BACKOFF_MIN', 50))
+POOL_BACKOFF_MAX = int(getenv('POOL_BACKOFF_MAX', 2000))
+
+PEER_WORKERS = int(getenv('PEER_WORKERS', 4))
+# a put keeps its worker for the whole replication round, so this also
+# bounds how many writes can be batched into one round
+CLIENT_WORKERS = int(getenv('CLIENT_WORKERS', 64))
+CLIENT_BACKLOG = int(getenv('CLIENT_BACKLOG', 1024))
+RECV_BUFFER = int(getenv('RECV_BUFFER', 65536))
+MAX_MESSAGE_SIZE = int(getenv('MAX_MESSAGE_SIZE', 64 * 1024 ** 2))
+# handled by the PEER_WORKERS; read_index is among them so the followers'
+# reads do not wait behind the client writes on the leader
+PEER_MESSAGES = ('heartbeat', 'vote_request', 'ping', 'add_peer', 'data', 'hello', 'read_index')
+# the pure python binary codec sends about a third of the bytes of json for a
+# few us more per message (see benchmarks/codec.py); put json first to trade
+# the bytes back for CPU
+PEER_CODECS = getenv('PEER_CODECS', 'msgpack,binary,json').split(',')
+
+WAL_SEGMENT_SIZE = int(getenv('WAL_SEGMENT_SIZE', 64 * 1024 ** 2))
+# batch, interval or never; see raftnode.wal
+WAL_FSYNC = getenv('WAL_FSYNC', 'batch')
+WAL_FSYNC_INTERVAL = int(getenv('WAL_FSYNC_INTERVAL', 1000))
+WAL_BATCH_SIZE = int(getenv('WAL_BATCH_SIZE', 1024))
+WAL_BATCH_WAIT = float(getenv('WAL_BATCH_WAIT', 0))
+# snapshot the database, and drop the log entries the snapshot covers, every
+# SNAPSHOT_ENTRIES entries or SNAPSHOT_BYTES bytes of log; 0 disables a trigger
+SNAPSHOT_ENTRIES = int(getenv('SNAPSHOT_ENTRIES', 100000))
+SNAPSHOT_BYTES = int(getenv('SNAPSHOT_BYTES', 0))
+SNAPSHOT_KEEP = int(getenv('SNAPSHOT_KEEP', 2))
+# snapshots are streamed to followers in chunks of about this many bytes
+SNAPSHOT_CHUNK_SIZE = int(getenv('SNAPSHOT_CHUNK_SIZE', 1024 ** 2))
+
+# rocksdb keeps every namespace in a database of its own ('databases') or in
+# a column family of one shared database ('column_families'), tuned per
+# namespace with a JSON object of column family options
+ROCKSDB_NAMESPACES = getenv('ROCKSDB_NAMESPACES', 'databases')
+ROCKSDB_NAMESPACE_OPTIONS = loads(getenv('ROCKSDB_NAMESPACE_OPTIONS', '{}'))
+# memory limit of a namespace of the in-memory store in bytes (0 for none),
+# limits of single namespaces as a JSON object, and lru, lfu or random
+# eviction of the keys of a namespace over its limit
+MEMORY_MAX_BYTES = int(getenv('MEMORY_MAX_BYTES', 0))
+MEMORY_NAMESPACE_MAX_BYTES = loads(getenv('MEMORY_NAMESPACE_MAX_BYTES', '{}'))
+MEMORY_EVICTION = getenv('MEMORY_EVICTION', 'lru')
+# the leader deletes the keys whose TTL ran out every TTL_SWEEP_INTERVAL ms,
+# up to TTL_SWEEP_KEYS keys per round; expired and evicted keys are deleted
+# DELETE_BATCH_SIZE keys per log entry
+TTL_SWEEP_INTERVAL = int(getenv('TTL_SWEEP_INTERVAL', 1000))
+TTL_SWEEP_KEYS = int(getenv('TTL_SWEEP_KEYS', 1000000))
+DELETE_BATCH_SIZE = int(getenv('DELETE_BATCH_SIZE', 10000))
+# linearizable reads are served by followers too, once they applied the
+# read index of the leader; within READ_LEASE ms of the majority acking its
+# heartbeats the leader does not confirm its leadership for a read (0 turns
+# the lease off; keep it well below LOW_TIMEOUT, clocks drift)
+FOLLOWER_READS = getenv('FOLLOWER_READS', '1') == '1'
+READ_LEASE = int(getenv('READ_LEASE', 0))
+# scans return pages of at most SCAN_PAGE_SIZE keys and about SCAN_PAGE_BYTES
+# bytes, with a token to get the next page
+SCAN_PAGE_SIZE = int(getenv('SCAN_PAGE_SIZE', 1000))
+SCAN_PAGE_BYTES = int(getenv('SCAN_PAGE_BYTES', 1024 ** 2))
+# a watch buffers up to WATCH_BUFFER changes for its client (see
+# raftnode.watch) and pushes them in batches of WATCH_BATCH; an empty
+# batch is pushed every WATCH_KEEPALIVE ms when nothing changes
+WATCH_BUFFER = int(getenv('WATCH_BUFFER', 10000))
+WATCH_BATCH = int(getenv('WATCH_BATCH', 1000))
+WATCH_KEEPALIVE = int(getenv('WATCH_KEEPALIVE', 1000))
 
 def random_timeout():
     '''
@@ -1,4 +1,6 @@
 from abc import ABC, ABCMeta, abstractmethod
+from heapq import nsmallest
+from operator import itemgetter
 
 
 class IDatastore(ABC):
@@ -27,3 +29,99 @@ class IDatastore(ABC):
         Implement this function to connect and interact
         with the database
         '''
+
+    @abstractmethod
+    def snapshot(self):
+        '''
+        Implement this function to return the (namespace, key, value)
+        items of the database as of now. It is called on the write
+        path, so it should only capture the state and leave reading
+        it to the iteration
+        '''
+
+    @abstractmethod
+    def restore(self, items, commit_id: int = 0):
+        '''
+        Implement this function to replace the contents of the
+        database with the (namespace, key, value) items of a snapshot,
+        taken at `commit_id`
+        '''
+
+    def get_many(self, keys: list, namespace: str) -> dict:
+        '''
+        Override this function to look the keys up in one go
+
+        :returns: the keys and their values, None if they do not exist
+        :rtype: dict
+        '''
+        return {key: self.get(key=key, namespace=namespace) for key in keys}
+
+    def scan(self, namespace: str, start: str = None, end: str = None, limit: int = 1000) -> list:
+        '''
+        Override this function to read the keys in order from an index.
+        This one picks the items out of a `snapshot` of the whole
+        database, so it costs O(n log limit)
+
+        :returns: up to `limit` (key, value) items of the namespace in
+                  key order, from `start` on and before `end` (None for
+                  no bound)
+        :rtype: list
+        '''
+        items = ((key, value) for name, key, value in self.snapshot()
+                 if name == namespace and (start is None or key >= start)
+                 and (end is None or key < end))
+        return nsmallest(limit, items, key=itemgetter(0))
+
+    def write_batch(self, operations: list, commit_id: int = None, outcomes: list = None):
+        '''
+        Override this function to apply the operations in one go. Every
+        operation is a ('put', namespace, key, value) or a
+        ('delete', namespace, key, None) tuple, applied in order. The
+        batch ends at `commit_id`; `outcomes` are the (namespace, commit
+        id, succeeded) of its transactions, for a durable database to
+        keep (see `applied`)
+        '''
+        for operation, namespace, key, value in operations:
+            if operation == 'delete':
+                self.delete(key=key, namespace=namespace)
+            else:
+                self.put(key, value, namespace=namespace)
+
+    def applied(self) -> dict:
+        '''
+        Override this function in a database that keeps its contents
+        across restarts to return the commit id every namespace was
+        written up to (`namespaces`, None for one it does not know) and
+        the `outcomes` of the transactions written with them, by commit
+        id (see `write_batch`). None, the default, has the database
+        restored from the snapshot on start
+        '''
+        return None
+
+    def sync(self):
+        '''
+        Override this function in a durable database to make the writes
+        durable; a snapshot is written, and the log entries before it
+        are dropped, only once it returns
+        '''
+
+    def compact(self, commit_id: int):
+        '''
+        Override this function to drop what the database keeps for the
+        log entries up to `commit_id`, like the outcomes of their
+        transactions, once the log dropped them
+        '''
+
+    def evictions(self) -> list:
+        '''
+        Override this function to return the (namespace, key) of the
+        keys to evict to keep the database within its memory limits.
+        The keys are deleted through the log, not by the database
+        '''
+        return list()
+
+    def close(self):
+        '''
+        Override this function to release the resources of the
+        database when the node shuts down
+        '''
@@ -0,0 +1,81 @@
+'''
+Ordered index of the keys of a namespace of the in-memory store.
+
+`SortedKeys` keeps the keys in sorted blocks of at most 2 * `load` keys,
+with the last key of every block in a list of its own. Adding or removing a
+key is a binary search over the blocks and one in the block, so it costs
+O(log n + load) and not the O(n) of a single sorted list; iterating from a
+key costs O(log n) to find it and O(1) per key after it.
+'''
+from bisect import bisect_left, insort
+
+
+class SortedKeys:
+
+    '''
+    :param load: half of the most keys a block holds
+    :type load: int
+    '''
+
+    def __init__(self, load: int = 512):
+        self.__load = load
+        self.__blocks = list()
+        self.__maxes = list()
+        self.__len = 0
+
+    def __len__(self):
+        return self.__len
+
+    def add(self, key: str):
+        '''
+        add a key that is not in the index yet
+        '''
+        self.__len += 1
+        if not self.__blocks:
+            self.__blocks.append([key])
+            self.__maxes.append(key)
+            return
+        i = min(bisect_left(self.__maxes, key), len(self.__blocks) - 1)
+        block = self.__blocks[i]
+        insort(block, key)
+        self.__maxes[i] = block[-1]
+        if len(block) > 2 * self.__load:
+            self.__blocks[i:i + 1] = [block[:self.__load], block[self.__load:]]
+            self.__maxes[i:i + 1] = [block[self.__load - 1], block[-1]]
+
+    def discard(self, key: str):
+        '''
+        remove the key, if it is in the index
+        '''
+        i = bisect_left(self.__maxes, key)
+        if i == len(self.__blocks):
+            return
+        block = self.__blocks[i]
+        j = bisect_left(block, key)
+        if j == len(block) or block[j] != key:
+            return
+        del block[j]
+        self.__len -= 1
+        if not block:
+            del self.__blocks[i]
+            del self.__maxes[i]
+        else:
+            self.__maxes[i] = block[-1]
+
+    def irange(self, start: str = None, end: str = None):
+        '''
+        :returns: the keys from `start` on (all of them if None), up to
+                  and not including `end` (no bound if None), in order
+        :rtype: generator
+        '''
+        if start is None:
+            i, j = 0, 0
+        else:
+            i = bisect_left(self.__maxes, start)
+            j = bisect_left(self.__blocks[i], start) if i < len(self.__blocks) else 0
+        for block in self.__blocks[i:]:
+            stop = len(block) if end is None else bisect_left(block, end, j)
+            yield from block[j:stop]
+            if stop < len(block):
+                return
+            j = 0
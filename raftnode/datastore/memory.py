@@ -1,24 +1,100 @@
+from collections import OrderedDict
+from json import dumps
+from random import Random
+from threading import Lock
+
 from raftnode.datastore.Idatastore import IDatastore
+from raftnode.datastore.index import SortedKeys
+
+EVICTION_POLICIES = ('lru', 'lfu', 'random')
+_DELETED = object()
+
+
+class _Namespace:
+
+    '''
+    the keys of a namespace, in least recently used order, with their
+    size in bytes and how often they were used, and in key order
+    '''
+
+    def __init__(self):
+        self.items = OrderedDict()
+        self.sizes = dict()
+        self.hits = dict()
+        self.index = SortedKeys()
+        self.bytes = 0
 
 
 class MemoryStore(IDatastore):
 
     '''
     A class that implements IDatastore. It is responsible
-    for storing data in-memory and retrieving it 
+    for storing data in-memory and retrieving it
     using python dictionary
+
+    Every namespace is a dictionary of its own. The memory a namespace
+    takes is accounted as the bytes of its keys and JSON encoded values,
+    the same on every node. A namespace can be capped at `max_bytes`, or
+    at its own limit in `namespace_max_bytes`; the store does not drop
+    keys by itself, it picks the keys to evict (see `evictions`) and the
+    leader replicates their deletes through the log, so every node evicts
+    the same keys
+
+    :param config: `max_bytes` (0 for no limit), `namespace_max_bytes`
+                   and `eviction`, one of lru, lfu or random
+    :type config: dict
     '''
 
-    def __init__(self):
-        self.__db = dict()
+    def __init__(self, config: dict = None):
+        if not config:
+            config = dict()
+        self.__max_bytes = config.get('max_bytes', 0)
+        self.__namespace_max_bytes = config.get('namespace_max_bytes') or dict()
+        self.__eviction = config.get('eviction', 'lru')
+        if self.__eviction not in EVICTION_POLICIES:
+            raise ValueError(f'unknown eviction policy {self.__eviction}')
+        self.__namespaces = dict()
+        self.__random = Random()
+        # reads reorder the keys, so they are serialized with the writes
+        self.__lock = Lock()
 
     def connect(self):
         '''
         create/connect to the in-memory data store
         '''
-        return self.__db
+        return self.__namespaces
+
+    @staticmethod
+    def __size(key: str, value) -> int:
+        key = key if isinstance(key, str) else dumps(key)
+        return len(key.encode('utf-8')) + len(dumps(value).encode('utf-8'))
+
+    def __set(self, namespace: str, key: str, value):
+        ns = self.__namespaces.get(namespace)
+        if ns is None:
+            ns = self.__namespaces[namespace] = _Namespace()
+        size = self.__size(key, value)
+        if key not in ns.sizes:
+            ns.index.add(key)
+        ns.bytes += size - ns.sizes.get(key, 0)
+        ns.items[key] = value
+        ns.items.move_to_end(key)
+        ns.sizes[key] = size
+        ns.hits[key] = ns.hits.get(key, 0) + 1
+
+    def __remove(self, namespace: str, key: str):
+        ns = self.__namespaces.get(namespace)
+        if ns is None or key not in ns.items:
+            raise KeyError(key)
+        ns.bytes -= ns.sizes.pop(key)
+        del ns.hits[key]
+        ns.index.discard(key)
+        value = ns.items.pop(key)
+        if not ns.items:
+            del self.__namespaces[namespace]
+        return value
 
-    def put(self, key: str, value, **kwargs):
+    def put(self, key: str, value, namespace: str = 'default', **kwargs):
         '''
         insert values into the in-memory datastore
 
@@ -29,13 +105,17 @@ class MemoryStore(IDatastore):
         :param value: the actual data to be stored in the
                     dictionary
         :type value: any
+
+        :param namespace: namespace to which the key belongs
+        :type namespace: str
         '''
         try:
-            self.__db.update({key: value})
+            with self.__lock:
+                self.__set(namespace, key, value)
         except Exception as e:
             raise e
 
-    def get(self, key: str, **kwargs) -> dict:
+    def get(self, key: str, namespace: str = 'default', **kwargs) -> dict:
         '''
         fetch data form the in-memory datastore
 
@@ -43,27 +123,182 @@ class MemoryStore(IDatastore):
                     dictionary
         :type key: str
 
+        :param namespace: namespace to which the key belongs
+        :type namespace: str
+
         :returns: data in dictionary format
         :rtype: dict
         '''
         try:
-            data = self.__db.get(key, None)
-            return data
+            with self.__lock:
+                ns = self.__namespaces.get(namespace)
+                if ns is None or key not in ns.items:
+                    return None
+                ns.items.move_to_end(key)
+                ns.hits[key] += 1
+                return ns.items[key]
         except Exception as e:
             raise e
-    
-    def delete(self, key: str, **kwargs) -> str:
+
+    def get_many(self, keys: list, namespace: str = 'default') -> dict:
+        '''
+        fetch the values of the keys under one lock
+
+        :returns: the keys and their values, None if they do not exist
+        :rtype: dict
+        '''
+        values = dict()
+        with self.__lock:
+            ns = self.__namespaces.get(namespace)
+            for key in keys:
+                if ns is None or key not in ns.items:
+                    values[key] = None
+                    continue
+                ns.items.move_to_end(key)
+                ns.hits[key] += 1
+                values[key] = ns.items[key]
+        return values
+
+    def scan(self, namespace: str, start: str = None, end: str = None, limit: int = 1000) -> list:
+        '''
+        read the keys of the namespace in order, from the ordered index
+        of the namespace
+
+        :param start: first key, None to start with the first key
+        :type start: str
+
+        :param end: the keys before `end` are read, None for no bound
+        :type end: str
+
+        :returns: up to `limit` (key, value) items
+        :rtype: list
+        '''
+        with self.__lock:
+            ns = self.__namespaces.get(namespace)
+            if ns is None:
+                return list()
+            items = list()
+            for key in ns.index.irange(start, end):
+                if len(items) == limit:
+                    break
+                items.append((key, ns.items[key]))
+            return items
+
+    def delete(self, key: str, namespace: str = 'default', **kwargs) -> str:
         '''
         delete data from in-memory datastore
 
         :param key: key whose value will be deleted from the
                     datastore
         :type key: str
+
+        :param namespace: namespace to which the key belongs
+        :type namespace: str
         '''
         try:
-            removed_value = self.__db.pop(key)
+            with self.__lock:
+                removed_value = self.__remove(namespace, key)
             return removed_value
         except KeyError as ke:
             return f'Key {key} not found in the database'
         except Exception as e:
-            raise e
\ No newline at end of file
+            raise e
+
+    def write_batch(self, operations: list, commit_id: int = None, outcomes: list = None):
+        '''
+        apply ('put' | 'delete', namespace, key, value) operations under
+        one lock; only the last operation on a key matters. The store
+        is not durable, `commit_id` and `outcomes` are not kept
+
+        :param operations: operations in the order they were committed
+        :type operations: list
+        '''
+        changes = OrderedDict()
+        for operation, namespace, key, value in operations:
+            changes[namespace, key] = _DELETED if operation == 'delete' else value
+        with self.__lock:
+            for (namespace, key), value in changes.items():
+                if value is not _DELETED:
+                    self.__set(namespace, key, value)
+                elif namespace in self.__namespaces:
+                    try:
+                        self.__remove(namespace, key)
+                    except KeyError:
+                        pass
+
+    def memory(self) -> dict:
+        '''
+        :returns: bytes taken by every namespace
+        :rtype: dict
+        '''
+        with self.__lock:
+            return {name: ns.bytes for name, ns in self.__namespaces.items()}
+
+    def __limit(self, namespace: str) -> int:
+        return self.__namespace_max_bytes.get(namespace, self.__max_bytes)
+
+    def __candidates(self, ns: _Namespace):
+        '''
+        the keys of the namespace, the first to evict first
+        '''
+        if self.__eviction == 'lru':
+            return iter(ns.items)
+        if self.__eviction == 'lfu':
+            return iter(sorted(ns.hits, key=ns.hits.get))
+        return iter(self.__random.sample(list(ns.items), len(ns.items)))
+
+    def evictions(self) -> list:
+        '''
+        pick the keys to evict from the namespaces that take more than
+        their limit, by the eviction policy. A namespace is brought to
+        below 95% of its limit, so evictions come in rounds and not with
+        every put
+
+        :returns: (namespace, key) of the keys to evict
+        :rtype: list
+        '''
+        victims = list()
+        with self.__lock:
+            for name, ns in self.__namespaces.items():
+                limit = self.__limit(name)
+                if not limit or ns.bytes <= limit:
+                    continue
+                excess = ns.bytes - limit + limit // 20
+                for key in self.__candidates(ns):
+                    if excess <= 0:
+                        break
+                    victims.append((name, key))
+                    excess -= ns.sizes[key]
+        return victims
+
+    def namespaces(self) -> list:
+        '''
+        :returns: the namespaces that have keys
+        :rtype: list
+        '''
+        with self.__lock:
+            return sorted(self.__namespaces)
+
+    def snapshot(self):
+        '''
+        copy the datastore; the copy is shallow, values are replaced
+        on put and never changed in place
+
+        :returns: generator of (namespace, key, value) items
+        :rtype: generator
+        '''
+        with self.__lock:
+            copies = [(name, list(ns.items.items())) for name, ns in self.__namespaces.items()]
+        return ((name, key, value) for name, items in copies for key, value in items)
+
+    def restore(self, items, commit_id: int = 0):
+        '''
+        replace the contents of the datastore with the items of a snapshot
+
+        :param items: (namespace, key, value) items
+        :type items: iterable
+        '''
+        with self.__lock:
+            self.__namespaces = dict()
+            for namespace, key, value in items:
+                self.__set(namespace, key, value)
@@ -1,11 +1,23 @@
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
 from json import JSONDecodeError, dumps, loads
-from os import getenv, makedirs, path
+from os import getenv, listdir, makedirs, path, remove
+from shutil import rmtree
+from threading import RLock
 from typing import Union
 
 import rocksdb
 
 from raftnode.datastore.Idatastore import IDatastore
 
+# kept with the keys of every namespace: the commit id it was written up to
+# and the outcomes of its transactions. 0xff is never part of UTF-8, so
+# these do not clash with the keys and sort after all of them
+APPLIED = b'\xffapplied'
+OUTCOME = b'\xffoutcome:'
+# there while a snapshot is being restored
+RESTORING = 'rocksdb.restoring'
+
 
 class RockStore(IDatastore):
 
@@ -13,6 +25,28 @@ class RockStore(IDatastore):
     A class that implements IDatastore. It enables storing the data
     into a database called rocksdb in (key, value) format
 
+    With `namespaces` set to 'databases' (the default) every namespace is
+    a database of its own. The databases are kept open, up to `max_open_dbs`
+    of them; the least recently used one is closed to open another. A
+    database is pinned while it is used, by a read, a write or a snapshot
+    being iterated, and only closed once it is not used any more, so there
+    can be more than `max_open_dbs` open for a while. All of them share one
+    block cache, but each has its own write-ahead log, memtables and files.
+
+    With `namespaces` set to 'column_families' every namespace is a column
+    family of one database in `data_dir`/column_families. The block cache,
+    write-ahead log and background threads are shared, so the resources
+    used grow with the data and not with the number of namespaces. The
+    options of a namespace's column family can be tuned in
+    `namespace_options`, e.g. ``{'logs': {'write_buffer_size': 8388608}}``.
+    Column families need python-rocksdb 0.8 or later (the
+    `rocksdb-column-families` extra); with an older one (the `rocksdb`
+    extra pins 0.7.0) the store raises a ValueError instead of starting
+
+    The store is durable: every namespace is written with the commit id of
+    the batch and the outcomes of its transactions (see `write_batch`), so
+    a node picks its database up where it was left (see `applied`)
+
     :param data_dir: directory where the database files will be stored,
                     default=./data
     :type data_dir: dict
@@ -27,6 +61,33 @@ class RockStore(IDatastore):
         self.__check_data_dir()
         self.__config = rocksdb.Options()
         self.__set_config(config=config)
+        self.__max_open = max(1, config.get('max_open_dbs', 64))
+        self.__handles = OrderedDict()
+        # how many users every open database has
+        self.__pins = dict()
+        # the namespaces with outcomes of transactions
+        self.__outcomes = set()
+        self.__lock = RLock()
+        namespaces = config.get('namespaces', 'databases')
+        if namespaces not in ('databases', 'column_families'):
+            raise ValueError(f'unknown rocksdb namespaces {namespaces}')
+        self.__column_families = namespaces == 'column_families'
+        if self.__column_families:
+            if not self.supports_column_families():
+                raise ValueError('ROCKSDB_NAMESPACES=column_families needs python-rocksdb 0.8 '
+                                 'or later (pip install raftnode[rocksdb-column-families]), '
+                                 f'rocksdb {getattr(rocksdb, "__version__", "")} is installed')
+            self.__family_config = config
+            self.__namespace_options = config.get('namespace_options') or dict()
+            self.__shared = None
+            self.__families = dict()
+
+    @staticmethod
+    def supports_column_families() -> bool:
+        '''
+        :returns: True if the installed python-rocksdb has column families
+        '''
+        return getattr(rocksdb, 'ColumnFamilyOptions', None) is not None
 
     @property
     def database(self):
@@ -69,17 +130,167 @@ class RockStore(IDatastore):
         self.__config.target_file_size_base = config.get(
             'target_file_size_base', 67108864)
 
-        self.__config.table_factory = rocksdb.BlockBasedTableFactory(
+        # created once: every database opened with these options shares them
+        self.__table_factory = self.__config.table_factory = rocksdb.BlockBasedTableFactory(
             filter_policy=rocksdb.BloomFilterPolicy(10),
-            block_cache=rocksdb.LRUCache(2 * (1024 ** 3)),
-            block_cache_compressed=rocksdb.LRUCache(500 * (1024 ** 2)))
+            block_cache=rocksdb.LRUCache(config.get('block_cache_size', 2 * (1024 ** 3))),
+            block_cache_compressed=rocksdb.LRUCache(
+                config.get('block_cache_compressed_size', 500 * (1024 ** 2))))
 
     def connect(self):
         '''
-        create/connect to rocksdb database
+        create/connect to the rocksdb database of the current namespace
+        (see `database`); the handle is cached
+        '''
+        with self.__lock:
+            db = self.__handles.get(self.database)
+            if db is not None:
+                self.__handles.move_to_end(self.database)
+                return db
+            db = rocksdb.DB(self.database, self.__config)
+            self.__handles[self.database] = db
+            self.__trim(keep=self.database)
+            return db
+
+    def __trim(self, keep: str = None):
+        '''
+        close the least recently used databases over `max_open_dbs`
+        that are not pinned (and not `keep`)
         '''
-        db = rocksdb.DB(self.database, self.__config)
-        return db
+        for name in list(self.__handles):
+            if len(self.__handles) <= self.__max_open:
+                return
+            if name != keep and not self.__pins.get(name):
+                self.__close(self.__handles.pop(name))
+
+    def __pin(self, namespace: str, create: bool = True):
+        '''
+        :returns: the database of the namespace (see `__handle`), kept
+                  open until `__unpin`
+        '''
+        with self.__lock:
+            db = self.__handle(namespace, create=create)
+            if db is not None:
+                self.__pins[self.database] = self.__pins.get(self.database, 0) + 1
+            return db
+
+    def __unpin(self, namespace: str):
+        with self.__lock:
+            name = path.join(self.data_dir, namespace)
+            # the pins are dropped when the store is closed
+            if name not in self.__pins:
+                return
+            self.__pins[name] -= 1
+            if not self.__pins[name]:
+                del self.__pins[name]
+                self.__trim()
+
+    def __handle(self, namespace: str, create: bool = True):
+        '''
+        :returns: the database of the namespace, None if it does not
+                  exist and `create` is False
+        '''
+        with self.__lock:
+            self.database = namespace
+            if not create and self.database not in self.__handles and not path.exists(self.database):
+                return None
+            return self.connect()
+
+    @property
+    def __shared_dir(self) -> str:
+        return path.join(self.data_dir, 'column_families')
+
+    def __family_options(self, namespace: str):
+        '''
+        :returns: the column family options of the namespace: the
+                  defaults of the store, tuned by `namespace_options`
+        '''
+        opts = rocksdb.ColumnFamilyOptions()
+        opts.write_buffer_size = self.__family_config.get('write_buffer_size', 67108864)
+        opts.max_write_buffer_number = self.__family_config.get('max_write_buffer_number', 100)
+        opts.target_file_size_base = self.__family_config.get('target_file_size_base', 67108864)
+        opts.table_factory = self.__table_factory
+        for name, value in self.__namespace_options.get(namespace, dict()).items():
+            if name == 'compression' and isinstance(value, str):
+                value = getattr(rocksdb.CompressionType, value)
+            setattr(opts, name, value)
+        return opts
+
+    def __open_shared(self):
+        '''
+        open the database of the column families, with all the column
+        families it has
+        '''
+        names = [b'default']
+        if path.isfile(path.join(self.__shared_dir, 'CURRENT')):
+            names = rocksdb.list_column_families(self.__shared_dir, self.__config)
+        self.__shared = rocksdb.DB(
+            self.__shared_dir, self.__config,
+            column_families={name: self.__family_options(name.decode(self.encoding))
+                             for name in names})
+        self.__families = {name.decode(self.encoding): self.__shared.get_column_family(name)
+                           for name in names}
+
+    def __family(self, namespace: str, create: bool = True):
+        '''
+        :returns: the column family of the namespace, None if it does
+                  not exist and `create` is False
+        '''
+        with self.__lock:
+            if self.__shared is None:
+                self.__open_shared()
+            family = self.__families.get(namespace)
+            if family is None and create:
+                family = self.__shared.create_column_family(
+                    bytes(namespace, encoding=self.encoding), self.__family_options(namespace))
+                self.__families[namespace] = family
+            return family
+
+    @contextmanager
+    def __locate(self, namespace: str, create: bool = True):
+        '''
+        :returns: the database holding the namespace and a function that
+                  turns a key into the key of the namespace in it, None
+                  if the namespace does not exist and `create` is False.
+                  The database is pinned until the block ends
+        :rtype: tuple
+        '''
+        if self.__column_families:
+            family = self.__family(namespace, create=create)
+            yield None if family is None else (self.__shared, lambda key: (family, key))
+            return
+        db = self.__pin(namespace, create=create)
+        if db is None:
+            yield None
+            return
+        try:
+            yield db, lambda key: key
+        finally:
+            self.__unpin(namespace)
+
+    @staticmethod
+    def __close(db):
+        # the writes are not synced one by one, only before the handle goes
+        db.write(rocksdb.WriteBatch(), sync=True)
+        # python-rocksdb closes the database once the handle is freed;
+        # newer versions can close it right away
+        close = getattr(db, 'close', None)
+        if close:
+            close()
+
+    def close(self):
+        '''
+        close all the open databases
+        '''
+        with self.__lock:
+            if self.__column_families and self.__shared is not None:
+                self.__families = dict()
+                self.__close(self.__shared)
+                self.__shared = None
+            self.__pins = dict()
+            while self.__handles:
+                _, db = self.__handles.popitem(last=False)
+                self.__close(db)
 
     def put(self, key: str, value, namespace: str) -> bool:
         '''
@@ -95,17 +306,13 @@ class RockStore(IDatastore):
         :param namespace: namespace to which the key belongs
         :type namespace: str
         '''
-        db = None
         try:
-            self.database = namespace
-            db = self.connect()
-            key, value = self.__bytes_encode(key), self.__bytes_encode(value)
-            db.put(key, value)
+            with self.__locate(namespace) as (db, key_of):
+                key, value = self.__bytes_encode(key), self.__bytes_encode(value)
+                db.put(key_of(key), value)
             return True
         except Exception as e:
             raise e
-        finally:
-            db = None
 
     def get(self, key: str, namespace: str) -> dict:
         '''
@@ -122,21 +329,63 @@ class RockStore(IDatastore):
         :returns: data from the database in dictionary format
         :rtype: dict 
         '''
-        db = None
         try:
-            self.database = namespace
-            if not path.exists(self.database):
-                return None
-            db = self.connect()
-            key = self.__bytes_encode(key)
-            value = db.get(key)
+            with self.__locate(namespace, create=False) as located:
+                if located is None:
+                    return None
+                db, key_of = located
+                key = self.__bytes_encode(key)
+                value = db.get(key_of(key))
             if not value:
                 return None
             return self.__bytes_decode(value)
         except Exception as e:
             raise e
-        finally:
-            db = None
+
+    def get_many(self, keys: list, namespace: str) -> dict:
+        '''
+        retrieve the values of the keys with one rocksdb multi_get
+
+        :returns: the keys and their values, None if they do not exist
+        :rtype: dict
+        '''
+        with self.__locate(namespace, create=False) as located:
+            if located is None or not keys:
+                return {key: None for key in keys}
+            db, key_of = located
+            lookups = {key_of(self.__bytes_encode(key)): key for key in keys}
+            found = db.multi_get(list(lookups))
+        return {key: self.__bytes_decode(found[k]) if found.get(k) else None
+                for k, key in lookups.items()}
+
+    def scan(self, namespace: str, start: str = None, end: str = None, limit: int = 1000) -> list:
+        '''
+        read the keys of the namespace in order with a rocksdb iterator;
+        rocksdb orders the keys by their UTF-8 bytes, which is the order
+        of the strings
+
+        :returns: up to `limit` (key, value) items from `start` on and
+                  before `end` (None for no bound)
+        :rtype: list
+        '''
+        with self.__locate(namespace, create=False) as located:
+            if located is None:
+                return list()
+            db, _ = located
+            it = self.__iterate(db, namespace)
+            if start is None:
+                it.seek_to_first()
+            else:
+                it.seek(self.__bytes_encode(start))
+            end = None if end is None else self.__bytes_encode(end)
+            items = list()
+            for key, value in it:
+                if isinstance(key, tuple):
+                    key = key[-1]
+                if len(items) == limit or (end is not None and key >= end) or key[:1] == b'\xff':
+                    break
+                items.append((key.decode(self.encoding), self.__bytes_decode(value)))
+        return items
 
     def delete(self, key: str, namespace: str) -> Union[str, bool]:
         '''
@@ -149,24 +398,260 @@ class RockStore(IDatastore):
         :param namespace: namespace to which the key belongs
         :type namespace: str
         '''
-        db = None
         try:
-            self.database = namespace
-            if not path.exists(self.database):
-                return f'No namespace {namespace} found!'
-            db = self.connect()
-            key = self.__bytes_encode(key)
-            db.delete(key)
+            with self.__locate(namespace, create=False) as located:
+                if located is None:
+                    return f'No namespace {namespace} found!'
+                db, key_of = located
+                key = self.__bytes_encode(key)
+                db.delete(key_of(key))
             return True
         except Exception as e:
             raise e
+
+    def write_batch(self, operations: list, commit_id: int = None, outcomes: list = None):
+        '''
+        apply ('put' | 'delete', namespace, key, value) operations with a
+        rocksdb WriteBatch per database, so they are written at once;
+        with column families that is one atomic batch for all namespaces.
+        Every namespace written gets the commit id and the outcomes of
+        its transactions in its batch
+
+        :param operations: operations in the order they were committed
+        :type operations: list
+
+        :param commit_id: commit id of the last entry of the batch
+        :type commit_id: int
+
+        :param outcomes: (namespace, commit id, succeeded) of the transactions
+        :type outcomes: list
+        '''
+        batches, written = OrderedDict(), dict()
+        with ExitStack() as pinned:
+            for operation, namespace, key, value in operations:
+                located = self.__batch(batches, pinned, namespace, create=operation != 'delete')
+                if located is None:
+                    continue
+                _, batch, key_of = located
+                written[namespace] = batch, key_of
+                if operation == 'delete':
+                    batch.delete(key_of(self.__bytes_encode(key)))
+                else:
+                    batch.put(key_of(self.__bytes_encode(key)), self.__bytes_encode(value))
+            for namespace, outcome_id, succeeded in outcomes or ():
+                _, batch, key_of = self.__batch(batches, pinned, namespace)
+                written[namespace] = batch, key_of
+                batch.put(key_of(self.__outcome_key(outcome_id)), dumps(succeeded).encode())
+                self.__outcomes.add(namespace)
+            if commit_id is not None:
+                for batch, key_of in written.values():
+                    batch.put(key_of(APPLIED), str(commit_id).encode())
+            for db, batch in batches.values():
+                db.write(batch)
+
+    def __batch(self, batches: OrderedDict, pinned: ExitStack, namespace: str, create: bool = True):
+        '''
+        :returns: the database holding the namespace, its WriteBatch and
+                  the function turning a key into its key in it (see
+                  `__locate`), None if the namespace does not exist and
+                  `create` is False
+        :rtype: tuple
+        '''
+        located = pinned.enter_context(self.__locate(namespace, create=create))
+        if located is None:
+            return None
+        db, key_of = located
+        if id(db) not in batches:
+            batches[id(db)] = (db, rocksdb.WriteBatch())
+        return db, batches[id(db)][1], key_of
+
+    @staticmethod
+    def __outcome_key(commit_id: int) -> bytes:
+        return OUTCOME + b'%020d' % commit_id
+
+    def __iterate(self, db, namespace: str, snapshot=None):
+        if self.__column_families:
+            return db.iteritems(self.__family(namespace), snapshot=snapshot)
+        return db.iteritems(snapshot=snapshot)
+
+    def applied(self) -> dict:
+        '''
+        :returns: the commit id every namespace was written up to
+                  (`namespaces`; 0 if it is empty, None if it has keys
+                  but no commit id, from before the store was durable) and
+                  the `outcomes` of the transactions, by commit id; None
+                  if a snapshot was being restored
+        :rtype: dict
+        '''
+        if path.exists(path.join(self.data_dir, RESTORING)):
+            return None
+        markers, outcomes = dict(), dict()
+        for namespace in self.namespaces():
+            with self.__locate(namespace, create=False) as located:
+                if located is None:
+                    continue
+                db, key_of = located
+                marker = db.get(key_of(APPLIED))
+                if marker is None:
+                    it = self.__iterate(db, namespace)
+                    it.seek_to_first()
+                    markers[namespace] = None if next(iter(it), None) else 0
+                    continue
+                markers[namespace] = int(marker)
+                it = self.__iterate(db, namespace)
+                it.seek(OUTCOME)
+                for key, value in it:
+                    key = key[-1] if isinstance(key, tuple) else key
+                    if not key.startswith(OUTCOME):
+                        break
+                    outcomes[int(key[len(OUTCOME):])] = loads(value)
+                    self.__outcomes.add(namespace)
+        return {'namespaces': markers, 'outcomes': outcomes}
+
+    def sync(self):
+        '''
+        sync the writes of the open databases; the closed ones were synced
+        when they were closed
+        '''
+        with self.__lock:
+            if self.__column_families:
+                namespaces = {'default'} if self.__shared is not None else set()
+            else:
+                namespaces = {path.basename(name) for name in self.__handles}
+        batches = OrderedDict()
+        with ExitStack() as pinned:
+            for namespace in sorted(namespaces):
+                self.__batch(batches, pinned, namespace, create=False)
+            for db, batch in batches.values():
+                db.write(batch, sync=True)
+
+    def compact(self, commit_id: int):
+        '''
+        drop the outcomes of the transactions up to `commit_id`
+        '''
+        with self.__lock:
+            namespaces = set(self.__outcomes)
+        batches = OrderedDict()
+        with ExitStack() as pinned:
+            for namespace in sorted(namespaces):
+                located = self.__batch(batches, pinned, namespace, create=False)
+                if located is None:
+                    continue
+                db, batch, key_of = located
+                it = self.__iterate(db, namespace)
+                it.seek(OUTCOME)
+                for key, _ in it:
+                    key = key[-1] if isinstance(key, tuple) else key
+                    if not key.startswith(OUTCOME) or int(key[len(OUTCOME):]) > commit_id:
+                        break
+                    batch.delete(key_of(key))
+            for db, batch in batches.values():
+                db.write(batch)
+
+    def namespaces(self) -> list:
+        '''
+        :returns: the namespaces that have a database in the data directory,
+                  or a column family in the shared database
+        :rtype: list
+        '''
+        if self.__column_families:
+            with self.__lock:
+                if self.__shared is None:
+                    self.__open_shared()
+                return sorted(self.__families)
+        return sorted(name for name in listdir(self.data_dir)
+                      if path.isfile(path.join(self.data_dir, name, 'CURRENT')))
+
+    def snapshot(self):
+        '''
+        take a rocksdb snapshot of every namespace; the items are read
+        under these snapshots while the generator is iterated
+
+        :returns: generator of (namespace, key, value) items
+        :rtype: generator
+        '''
+        with self.__lock:
+            if self.__column_families:
+                # one snapshot of the shared database covers all the namespaces
+                snapshot = self.__shared_snapshot()
+                snapshots = [(namespace, self.__shared, snapshot, self.__families[namespace])
+                             for namespace in self.namespaces()]
+            else:
+                # the databases stay pinned until their items are read
+                snapshots = [(namespace, db, db.snapshot(), None) for namespace, db in
+                             ((n, self.__pin(n)) for n in self.namespaces())]
+        items = self.__items(snapshots)
+        # started, so that closing it or dropping it unpins the databases
+        next(items)
+        return items
+
+    def __shared_snapshot(self):
+        if self.__shared is None:
+            self.__open_shared()
+        return self.__shared.snapshot()
+
+    def __items(self, snapshots: list):
+        pinned = [namespace for namespace, _, _, family in snapshots if family is None]
+        try:
+            yield
+            for namespace, db, snapshot, family in snapshots:
+                if family is None:
+                    it = db.iteritems(snapshot=snapshot)
+                else:
+                    it = db.iteritems(family, snapshot=snapshot)
+                it.seek_to_first()
+                for key, value in it:
+                    if isinstance(key, tuple):
+                        # the keys of a column family come with its handle
+                        key = key[-1]
+                    if key[:1] == b'\xff':
+                        break
+                    yield namespace, key.decode(self.encoding), self.__bytes_decode(value)
+                if family is None:
+                    self.__unpin(pinned.pop(0))
         finally:
-            db = None
+            for namespace in pinned:
+                self.__unpin(namespace)
+
+    def restore(self, items, commit_id: int = 0):
+        '''
+        drop all the namespaces and load the items of a snapshot
+
+        :param items: (namespace, key, value) items
+        :type items: iterable
+
+        :param commit_id: commit id of the snapshot
+        :type commit_id: int
+        '''
+        restoring = path.join(self.data_dir, RESTORING)
+        open(restoring, 'w').close()
+        if self.__column_families:
+            self.close()
+            if path.exists(self.__shared_dir):
+                rmtree(self.__shared_dir)
+        else:
+            self.close()
+            for namespace in self.namespaces():
+                rmtree(path.join(self.data_dir, namespace))
+        restored = set()
+        for namespace, key, value in items:
+            with self.__locate(namespace) as (db, key_of):
+                db.put(key_of(self.__bytes_encode(key)), self.__bytes_encode(value))
+            restored.add(namespace)
+        for namespace in restored:
+            with self.__locate(namespace) as (db, key_of):
+                batch = rocksdb.WriteBatch()
+                batch.put(key_of(APPLIED), str(commit_id).encode())
+                db.write(batch, sync=True)
+        with self.__lock:
+            self.__outcomes = set()
+        remove(restoring)
 
     def __bytes_encode(self, data):
         if isinstance(data, str):
             return bytes(data, encoding=self.encoding)
-        elif isinstance(data, (dict, list, tuple)):
+        elif isinstance(data, (dict, list, tuple, int, float, bool)) or data is None:
+            # numbers, booleans and null come back as such from `loads`
             return bytes(dumps(data), encoding=self.encoding)
         else:
             raise TypeError(f'Invalid type {type(data)} passed')
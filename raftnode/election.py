@@ -1,7 +1,8 @@
 import time
-from threading import Lock, Thread
+from threading import Condition, Lock, Thread
 from queue import Queue
 from raftnode import cfg, logger
+from raftnode.reads import ANY, BOUNDED, SharedRequest, consistency
 from raftnode.store import Store
 from raftnode.transport import Transport
 
@@ -16,6 +17,15 @@ class Election:
         self.__transport = transport
         self.__lock = Lock()
         self.q = queue
+        # term and send time of the last heartbeat each peer acked; the
+        # condition is also notified to send the heartbeats right away
+        self.__acks = dict()
+        self.__beat = Condition()
+        self.__beats_wanted = 0
+        self.__heard = 0
+        # commit index of the leader as of the last message heard from it
+        self.__leader_commit = 0
+        self.__read_indexes = SharedRequest(self.__fetch_read_index)
         self.init_timeout()
 
     def start_election(self):
@@ -40,13 +50,13 @@ class Election:
         '''
         for peer in self.peers:
             Thread(target=self.send_vote_request,
-                   args=(peer, self.term)).start()
+                   args=(peer, self.term), daemon=True).start()
 
     def send_vote_request(self, voter: str, term: int):
         '''
         send vote request message to the voter node
-        this message contains the current term of this node,
-        the latest commit id and any cached data
+        this message contains the current term of this node
+        and the term and index of the last entry of its log
 
         :param voter: address of the voter node in `ip:port`
                       format
@@ -57,8 +67,8 @@ class Election:
         '''
         message = {
             'term': term,
-            'commit_id': self.store.commit_id,
-            'staged': self.store.staged
+            'last_term': self.store.last_log_term,
+            'last_index': self.store.last_index
         }
         while self.status == cfg.CANDIDATE and self.term == term:
             vote_reply = self.__transport.vote_request(voter, message)
@@ -73,27 +83,34 @@ class Election:
                         self.status = cfg.FOLLOWER
                 break
 
-    def decide_vote(self, term: int, commit_id: int, staged: dict) -> bool:
+    def decide_vote(self, term: int, last_term: int, last_index: int) -> bool:
         '''
         on receiving vote request from the candidate node, decide 
-        whether to vote for or against that node
+        whether to vote for or against that node. The candidate gets
+        the vote only if its log is at least as up to date as the log
+        of this node: its last entry has a later term, or the same
+        term and an index as high, so it holds every committed entry
 
         :param term: term of the candidate node
         :type term: int
 
-        :param commit_id: latest commit_id that the 
-                        that the candidate node holds
-        :type commit_id: int
+        :param last_term: term of the last entry of the candidate's log
+        :type last_term: int
 
-        :param staged: any cached/staged data by the candidate node
-        :type staged: dict
+        :param last_index: index of the last entry of the candidate's log
+        :type last_index: int
 
         :returns: True if the voter can vote in favour of the candidate node
                   False otherwise
         :rtype: bool
         '''
+        if cfg.READ_LEASE and time.time() - self.__heard < cfg.LOW_TIMEOUT / 1000:
+            # the leader may hold a read lease that counts on this node
+            # not electing another leader before the election timeout
+            return False, self.term
         self.reset_timeout()
-        if self.term < term and self.store.commit_id <= commit_id and (staged or (self.store.staged == staged)):
+        up_to_date = (last_term, last_index) >= (self.store.last_log_term, self.store.last_index)
+        if self.term < term and up_to_date:
             self.reset_timeout()
             self.term = term
             return True, self.term
@@ -120,18 +137,24 @@ class Election:
         '''
         # self.q.put({})
         # self.status == cfg.LEADER
-        if self.store.staged:
-            # logger.info(f"STAGED>>>>>>>>>>>, {self.store.staged}")
-            if self.store.staged.get('delete', False):
-                self.store.delete(self.term, self.store.staged,
-                                  self.__transport, self.majority)
-            else:
-                self.store.put(self.term, self.store.staged,
-                               self.__transport, self.majority)
+        with self.__beat:
+            self.__acks = dict()
+        self.commit_staged()
         logger.info(f"I'm the leader of the pack for the term {self.term}")
         logger.debug('sending heartbeat to peers')
         for peer in self.peers:
-            Thread(target=self.send_heartbeat, args=(peer,)).start()
+            Thread(target=self.send_heartbeat, args=(peer,), daemon=True).start()
+
+    def commit_staged(self):
+        '''
+        a newly elected leader starts replicating its log to the
+        followers; this also commits the data it had staged but
+        not committed yet
+        '''
+        term = self.term
+        self.store.start_replication(
+            term, self.peers, self.__transport, self.majority,
+            lambda: self.status == cfg.LEADER and self.term == term)
 
     def send_heartbeat(self, peer: str):
         '''
@@ -141,11 +164,13 @@ class Election:
         :type peer: str
         '''
         try:
-            if self.store.log:
-                self.update_follower_commit(peer)
-            message = {'term': self.term, 'addr': self.__transport.addr}
+            term = self.term
+            message = {'term': term, 'addr': self.__transport.addr}
             while self.status == cfg.LEADER:
                 logger.debug(f'[PEER HEARTBEAT] {peer}')
+                with self.__beat:
+                    wanted = self.__beats_wanted
+                message['commit_index'] = self.store.commit_id
                 start = time.time()
                 reply = self.__transport.heartbeat(peer=peer, message=message)
                 if reply:
@@ -153,38 +178,84 @@ class Election:
                         self.term = reply['term']
                         self.status = cfg.FOLLOWER
                         self.init_timeout()
+                    else:
+                        self.heartbeat_acked(peer, term, start)
                 delta = time.time() - start
-                time.sleep((cfg.HB_TIME - delta) / 1000)
+                with self.__beat:
+                    self.__beat.wait_for(lambda: self.__beats_wanted > wanted,
+                                         max(cfg.HB_TIME / 1000 - delta, 0))
                 logger.debug(f'[PEER HEARTBEAT RESPONSE] {peer} {reply}')
         except Exception as e:
             raise e
 
-    def update_follower_commit(self, follower: str):
+    def heartbeat_acked(self, peer: str, term: int, sent_at: float):
+        '''
+        record that the peer acked the heartbeat of `term` sent at `sent_at`
         '''
-        update the followers log until it's log is in sync
-        with the leader's log
+        with self.__beat:
+            self.__acks[peer] = (term, sent_at)
+            self.__beat.notify_all()
 
-        :param follower: address of the follower node in `ip:port` format
-        :type follower: str
+    def request_heartbeats(self):
         '''
-        first_message = {'term': self.term, 'addr': self.__transport.addr}
-        second_message = {
-            'term': self.term,
-            'addr': self.__transport.addr,
-            'action': 'commit',
-        }
-        reply = self.__transport.heartbeat(follower, first_message)
-        cid = self.store.commit_id
-        if reply:
-            follower_cid = reply['commit_id']
-            if follower_cid < self.store.commit_id:
-                command_chunks = cfg.chunks(
-                    list(self.store.log)[follower_cid:], 4)
-                for chunk in command_chunks:
-                    # while reply["commit_id"] < self.store.commit_id and abs(i) <= len(self.store.log):
-                    second_message.update({'payload': chunk, 'commit_id': cid})
-                    reply = self.__transport.heartbeat(
-                        follower, second_message)
+        have the heartbeats sent to the peers right away
+        '''
+        with self.__beat:
+            self.__beats_wanted += 1
+            self.__beat.notify_all()
+
+    def __acked_since(self, term: int, since: float) -> bool:
+        '''
+        :returns: True if the majority, this node included, acked
+                  heartbeats of `term` sent at `since` or later
+        '''
+        acks = sum(1 for t, sent_at in self.__acks.values() if t == term and sent_at >= since)
+        return acks + 1 >= self.majority
+
+    def leader_read_index(self):
+        '''
+        ReadIndex (see `raftnode.reads`): the commit index, once it covers
+        the entries of the earlier terms, and once the majority confirmed
+        this node is still the leader. Within the read lease the majority
+        is not asked again
+
+        :returns: the index to read at, None if this node is not the
+                  leader or could not confirm it in MAX_LOG_WAIT ms
+        :rtype: int
+        '''
+        if self.status != cfg.LEADER:
+            return None
+        term, since = self.term, time.time()
+        index = self.store.read_index(term, cfg.MAX_LOG_WAIT / 1000)
+        if index is None:
+            return None
+        with self.__beat:
+            if cfg.READ_LEASE and self.__acked_since(term, time.time() - cfg.READ_LEASE / 1000):
+                return index
+        self.request_heartbeats()
+        remaining = since + cfg.MAX_LOG_WAIT / 1000 - time.time()
+        with self.__beat:
+            confirmed = self.__beat.wait_for(lambda: self.__acked_since(term, since), max(remaining, 0))
+        if confirmed and self.status == cfg.LEADER and self.term == term:
+            return index
+        return None
+
+    def __fetch_read_index(self):
+        leader = getattr(self, 'leader', None)
+        if leader is None:
+            return None
+        reply = self.__transport.request(leader, {'type': 'read_index'})
+        return reply.get('read_index') if reply else None
+
+    def read_index(self):
+        '''
+        :returns: the index this node has to apply up to before it
+                  serves a linearizable read, None if there is none
+        :rtype: int
+        '''
+        if self.status == cfg.LEADER:
+            return self.leader_read_index()
+        return self.__read_indexes.get()
 
     def heartbeat_handler(self, message: dict) -> tuple:
         '''
@@ -194,13 +265,18 @@ class Election:
         :param message: heartbeat data as sent by the leader node
         :type message: dict
 
-        :returns: term and latest commit_id of this (follower) node
+        :returns: term, latest commit_id and index of the last log
+                  entry of this (follower) node, and the fields the
+                  action adds to the reply
         :rtype: tuple
         '''
         try:
             term = message['term']
+            result = None
             if self.term <= term:
                 self.leader = message['addr']
+                self.__heard = time.time()
+                self.__leader_commit = message.get('commit_index', self.__leader_commit)
                 self.reset_timeout()
                 logger.debug(f'got heartbeat from leader {self.leader}')
                 if self.status == cfg.CANDIDATE:
@@ -214,8 +290,8 @@ class Election:
 
                 if 'action' in message:
                     logger.debug(f'received command from leader {message}')
-                    self.store.action_handler(message)
-            return self.term, self.store.commit_id
+                    result = self.store.action_handler(message)
+            return self.term, self.store.commit_id, self.store.last_index, result
         except Exception as e:
             raise e
 
@@ -227,11 +303,14 @@ class Election:
         :type payload: dict
 
         :returns: True if the data is inserted properly
-                  False otherwise
+                  False otherwise, or the error if the payload is not valid
         :rtype: bool
         '''
-        reply = self.store.put(
-            self.term, payload, self.__transport, self.majority)
+        try:
+            reply = self.store.put(
+                self.term, payload, self.__transport, self.majority)
+        except ValueError as e:
+            return str(e)
         return reply
 
     def handle_get(self, payload: dict) -> dict:
@@ -239,13 +318,153 @@ class Election:
         Retrieve data from the database
 
         :param payload: it contains `key` using which it's corresponding
-                        value will be retrieved from the database
+                        value will be retrieved from the database, and the
+                        `consistency` of the read (see `raftnode.reads`)
         :type payload: dict
+
+        A linearizable read waits until this node applied everything
+        committed before it arrived. A bounded read is served right away
+        if this node is fresh enough (see `fresh`), and linearizable
+        otherwise; a read of any consistency is always served right away.
+        The reply has the `commit_id` the read was served at
         '''
+        error = self.__wait_readable(payload)
+        if error:
+            return error
         return self.store.get(payload)
 
+    def handle_mget(self, payload: dict) -> dict:
+        '''
+        Retrieve the values of the `keys` in the payload, with the
+        `consistency` of the payload (see `handle_get`)
+        '''
+        error = self.__wait_readable(payload)
+        if error:
+            return error
+        return self.store.mget(payload)
+
+    def handle_scan(self, payload: dict) -> dict:
+        '''
+        Retrieve a page of the keys of a namespace in key order, from
+        `start` on and before `end` (see `Store.scan`), with the
+        `consistency` of the payload (see `handle_get`)
+        '''
+        error = self.__wait_readable(payload)
+        if error:
+            return error
+        try:
+            return self.store.scan(payload)
+        except ValueError as e:
+            return str(e)
+
+    def handle_prefix(self, payload: dict) -> dict:
+        '''
+        Retrieve a page of the keys of a namespace that start with the
+        `prefix` of the payload, in key order (see `handle_scan`)
+        '''
+        if not isinstance(payload.get('prefix'), str):
+            return 'prefix missing'
+        return self.handle_scan(payload)
+
+    def handle_watch(self, payload: dict):
+        '''
+        Watch the changes of a key, a prefix or a namespace (see
+        `Store.watch`). Any node serves watches: the changes are streamed
+        as this node applies them, so a follower streams them a little
+        after the leader
+
+        :returns: the watch, or the error to reply with
+        :rtype: Watch
+        '''
+        try:
+            return self.store.watch(payload)
+        except ValueError as e:
+            return str(e)
+
+    def __wait_readable(self, payload: dict) -> str:
+        '''
+        wait until this node can serve the read with the consistency
+        the payload asks for
+
+        :returns: the error to reply with, None if the read can be served
+        :rtype: str
+        '''
+        try:
+            level, staleness = consistency(payload)
+        except ValueError as e:
+            return str(e)
+        if level == ANY or (level == BOUNDED and self.fresh(staleness)):
+            return None
+        index = self.read_index()
+        if index is None:
+            return 'leader unavailable'
+        if self.store.commit_id < index:
+            self.store.wait_for_changes(
+                lambda: self.store.commit_id >= index, cfg.MAX_LOG_WAIT / 1000)
+            if self.store.commit_id < index:
+                return 'leader unavailable'
+        return None
+
+    def fresh(self, staleness: float) -> bool:
+        '''
+        :param staleness: seconds the data may lag behind the leader
+        :type staleness: float
+
+        :returns: True if this node has everything committed up to
+                  `staleness` seconds ago: the leader heard from the majority
+                  since then; a follower heard from the leader since then
+                  and applied the commit index the leader had sent
+        :rtype: bool
+        '''
+        since = time.time() - staleness
+        if self.status == cfg.LEADER:
+            with self.__beat:
+                return self.__acked_since(self.term, since)
+        return self.__heard >= since and self.store.commit_id >= self.__leader_commit
+
     def handle_delete(self, payload: dict):
-        return self.store.delete(self.term, payload, self.__transport, self.majority)
+        try:
+            return self.store.delete(self.term, payload, self.__transport, self.majority)
+        except ValueError as e:
+            return str(e)
+
+    def handle_mput(self, payload: dict) -> bool:
+        '''
+        Insert the `items` of the payload in one replicated write
+        '''
+        try:
+            return self.store.mput(self.term, payload, self.__transport, self.majority)
+        except ValueError as e:
+            return str(e)
+
+    def handle_mdelete(self, payload: dict) -> bool:
+        '''
+        Delete the `keys` of the payload in one replicated write
+        '''
+        try:
+            return self.store.mdelete(self.term, payload, self.__transport, self.majority)
+        except ValueError as e:
+            return str(e)
+
+    def handle_txn(self, payload: dict):
+        '''
+        Apply the operations of a transaction if its comparisons hold
+        (see `Store.txn`), in one replicated write
+        '''
+        try:
+            return self.store.txn(self.term, payload, self.__transport, self.majority)
+        except ValueError as e:
+            return str(e)
+
+    def handle_cas(self, payload: dict):
+        '''
+        Put the value of a key if it has the expected value or version
+        (see `Store.cas`)
+        '''
+        try:
+            return self.store.cas(self.term, payload, self.__transport, self.majority)
+        except ValueError as e:
+            return str(e)
 
     def timeout_loop(self):
         '''
@@ -272,7 +491,7 @@ class Election:
             self.reset_timeout()
             if self.timeout_thread and self.timeout_thread.is_alive():
                 return
-            self.timeout_thread = Thread(target=self.timeout_loop)
+            self.timeout_thread = Thread(target=self.timeout_loop, daemon=True)
             self.timeout_thread.start()
         except Exception as e:
             raise e
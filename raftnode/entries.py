@@ -0,0 +1,142 @@
+'''
+In-memory index of the recent entries of the log.
+
+`EntryLog` holds the entries from `first_index` to `last_index`: the entries
+that are not committed yet and a bounded cache of the last committed ones.
+Older entries are only in the write-ahead log (see `raftnode.wal`). Looking
+up an entry or its term is O(1), appending is O(1) and reading k entries is
+O(k). The terms are kept as runs of consecutive entries of the same term,
+so finding the first or last entry of a term is a binary search over the
+runs.
+'''
+from bisect import bisect_left, bisect_right
+
+
+class EntryLog:
+
+    '''
+    :param last_index: index of the entry before the first one this log
+                       will hold
+    :type last_index: int
+    '''
+
+    def __init__(self, last_index: int = 0):
+        self.reset(last_index)
+
+    def reset(self, last_index: int):
+        '''
+        drop all the entries; the next one appended gets `last_index` + 1
+        '''
+        self.__entries = list()
+        self.__start = 0
+        self.__first = last_index + 1
+        # runs of entries of the same term: their terms and first indexes
+        self.__run_terms = list()
+        self.__run_firsts = list()
+
+    @property
+    def first_index(self) -> int:
+        return self.__first
+
+    @property
+    def last_index(self) -> int:
+        return self.__first + len(self) - 1
+
+    def __len__(self):
+        return len(self.__entries) - self.__start
+
+    def append(self, entry: dict) -> int:
+        '''
+        :returns: index of the appended entry
+        :rtype: int
+        '''
+        self.__entries.append(entry)
+        index = self.last_index
+        term = entry.get('term', 0)
+        if not self.__run_terms or self.__run_terms[-1] != term:
+            self.__run_terms.append(term)
+            self.__run_firsts.append(index)
+        return index
+
+    def get(self, index: int) -> dict:
+        '''
+        :returns: the entry at `index`, None if it is not held
+        :rtype: dict
+        '''
+        if not self.__first <= index <= self.last_index:
+            return None
+        return self.__entries[self.__start + index - self.__first]
+
+    def term_at(self, index: int) -> int:
+        '''
+        :returns: term of the entry at `index`, None if it is not held
+        :rtype: int
+        '''
+        if not self.__first <= index <= self.last_index:
+            return None
+        return self.__run_terms[bisect_right(self.__run_firsts, index) - 1]
+
+    def slice(self, index: int, count: int) -> list:
+        '''
+        :returns: up to `count` entries from `index` on
+        :rtype: list
+        '''
+        start = self.__start + max(index - self.__first, 0)
+        return self.__entries[start:start + max(count, 0)]
+
+    def first_index_of_term(self, term: int) -> int:
+        '''
+        :returns: index of the first held entry of `term`, None if
+                  there is none
+        :rtype: int
+        '''
+        i = bisect_left(self.__run_terms, term)
+        if i == len(self.__run_terms) or self.__run_terms[i] != term:
+            return None
+        return self.__run_firsts[i]
+
+    def last_index_of_term(self, term: int) -> int:
+        '''
+        :returns: index of the last held entry of `term`, None if
+                  there is none
+        :rtype: int
+        '''
+        i = bisect_left(self.__run_terms, term)
+        if i == len(self.__run_terms) or self.__run_terms[i] != term:
+            return None
+        if i + 1 < len(self.__run_firsts):
+            return self.__run_firsts[i + 1] - 1
+        return self.last_index
+
+    def truncate(self, index: int):
+        '''
+        drop the entries after `index`
+        '''
+        if index >= self.last_index:
+            return
+        del self.__entries[self.__start + max(index - self.__first + 1, 0):]
+        while self.__run_firsts and self.__run_firsts[-1] > index:
+            self.__run_terms.pop()
+            self.__run_firsts.pop()
+
+    def trim(self, index: int):
+        '''
+        drop the entries up to `index`, to keep the cache bounded. The
+        list is only compacted once half of it is dropped entries, so
+        trimming is O(1) on average
+        '''
+        index = min(index, self.last_index)
+        if index < self.__first:
+            return
+        self.__start += index - self.__first + 1
+        self.__first = index + 1
+        if self.__start > len(self.__entries) // 2:
+            del self.__entries[:self.__start]
+            self.__start = 0
+        while len(self.__run_firsts) > 1 and self.__run_firsts[1] <= self.__first:
+            self.__run_terms.pop(0)
+            self.__run_firsts.pop(0)
+        if self.__run_firsts:
+            self.__run_firsts[0] = self.__first
+        if not len(self):
+            self.__run_terms, self.__run_firsts = list(), list()
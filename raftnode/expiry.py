@@ -0,0 +1,79 @@
+'''
+Expiration times of the keys that were put with a TTL.
+
+The leader turns the TTL of a put into an absolute expiration time before
+the entry goes into the log, so every node holds the same times. Expired
+keys are not returned by `get` right away (lazy expiry) and the leader
+deletes them in batches, through the log (see `Store.sweep`), so all the
+nodes drop the same keys.
+
+`ExpiryTable` keeps the times in a dict and a heap of (time, namespace,
+key). Setting or dropping a time is O(1) (the heap entries of replaced
+times are skipped when they come up) and finding the k expired keys is
+O(k log n).
+'''
+from heapq import heapify, heappop, heappush
+
+# the expiration times are kept in snapshots as items of this namespace
+NAMESPACE = '__expires_at__'
+
+
+class ExpiryTable:
+
+    def __init__(self):
+        self.__times = dict()
+        self.__heap = list()
+
+    def __len__(self):
+        return len(self.__times)
+
+    def set(self, namespace: str, key: str, expires_at: float):
+        '''
+        :param expires_at: time the key expires at, in seconds since
+                           the epoch
+        :type expires_at: float
+        '''
+        self.__times[namespace, key] = expires_at
+        heappush(self.__heap, (expires_at, namespace, key))
+        if len(self.__heap) > 2 * len(self.__times) + 1024:
+            self.rebuild()
+
+    def discard(self, namespace: str, key: str):
+        self.__times.pop((namespace, key), None)
+
+    def expired(self, namespace: str, key: str, now: float) -> bool:
+        expires_at = self.__times.get((namespace, key))
+        return expires_at is not None and expires_at <= now
+
+    def due(self, now: float, limit: int) -> list:
+        '''
+        take up to `limit` keys that expired by `now` off the heap; they
+        stay in the table until their deletes are applied
+
+        :returns: (namespace, key) of the expired keys
+        :rtype: list
+        '''
+        keys = list()
+        while self.__heap and len(keys) < limit and self.__heap[0][0] <= now:
+            expires_at, namespace, key = heappop(self.__heap)
+            if self.__times.get((namespace, key)) == expires_at:
+                keys.append((namespace, key))
+        return keys
+
+    def rebuild(self):
+        '''
+        rebuild the heap from the table, dropping the replaced times and
+        bringing back the keys `due` took that were not deleted
+        '''
+        self.__heap = [(t, namespace, key) for (namespace, key), t in self.__times.items()]
+        heapify(self.__heap)
+
+    def clear(self):
+        self.__times, self.__heap = dict(), list()
+
+    def items(self) -> list:
+        '''
+        :returns: the ((namespace, key), expires_at) items
+        :rtype: list
+        '''
+        return list(self.__times.items())
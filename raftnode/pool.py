@@ -0,0 +1,212 @@
+import asyncio
+import socket
+import time
+from itertools import count
+from threading import Lock
+
+from raftnode import cfg, logger
+from raftnode.codec import CODECS, preferred_codecs
+from raftnode.protocol import AsyncChannel, Channel
+
+
+class ConnectionPool:
+
+    '''
+    Keeps long-lived connections to the peers of this node so that the
+    peer RPCs (heartbeat, vote_request, ping, ...) do not open a new
+    socket for every message.
+
+    The pooled connections are framed, multiplexed `Channel`s: any number
+    of threads can have requests in flight on the same channel. Every peer
+    gets up to `size` channels, which are handed out in turn. Channels the
+    peer closed, or that were idle for longer than POOL_IDLE_TIMEOUT, are
+    dropped when the peer is asked for, and failed connection attempts put
+    the peer in an exponential backoff window so that a dead peer is not
+    hammered with connection attempts.
+
+    :param size: number of channels kept per peer
+    :type size: int
+
+    :param timeout: how long (in seconds) to wait for a connection or a reply
+    :type timeout: float
+    '''
+
+    def __init__(self, size: int = cfg.POOL_SIZE, timeout: float = cfg.PEER_TIMEOUT / 1000):
+        self.size = size
+        self.timeout = timeout
+        self.__channels = dict()
+        self.__backoff = dict()
+        self.__turn = count()
+        self.__lock = Lock()
+
+    def acquire(self, addr: str) -> Channel:
+        '''
+        get a channel to the peer at address `addr`, opening a new
+        connection if the peer has less than `size` healthy channels
+
+        :param addr: address of the peer in `ip:port` format
+        :type addr: str
+
+        :returns: channel, or None if the peer is in its backoff window
+        :rtype: Channel
+        '''
+        channel = self.pick(addr)
+        if channel:
+            return channel
+        return self.add(addr, self.connect(addr))
+
+    def connect(self, addr: str) -> Channel:
+        '''
+        open a new channel to the peer at address `addr`, honouring
+        the backoff window of the peer
+
+        :param addr: address of the peer in `ip:port` format
+        :type addr: str
+        '''
+        if self.in_backoff(addr):
+            return None
+        host, port = addr.split(':')
+        try:
+            conn = socket.create_connection((host, int(port)), timeout=self.timeout)
+        except OSError:
+            self.record_failure(addr)
+            raise
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.record_success(addr)
+        channel = Channel(conn)
+        try:
+            reply = channel.request(self.hello(), self.timeout)
+        except OSError:
+            # the peer does not know the hello message; talk JSON to it
+            channel.close()
+            conn = socket.create_connection((host, int(port)), timeout=self.timeout)
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            return Channel(conn)
+        return self.negotiated(channel, reply)
+
+    @staticmethod
+    def hello() -> dict:
+        '''
+        the message offering the codecs of this node to a peer
+        '''
+        return {'type': 'hello', 'codecs': preferred_codecs()}
+
+    @staticmethod
+    def negotiated(channel, reply: dict):
+        '''
+        switch the channel to the codec the peer picked in it's
+        reply to the hello message
+        '''
+        codec = reply.get('codec') if isinstance(reply, dict) else None
+        if codec in CODECS:
+            channel.codec = codec
+            logger.debug(f'[POOL] using codec {CODECS[codec].name}')
+        return channel
+
+    def pick(self, addr: str):
+        '''
+        return one of the healthy channels to `addr`, in turn, or None if a
+        new channel should be opened. Unhealthy channels are closed on the way
+        '''
+        now = time.time()
+        channel = None
+        with self.__lock:
+            channels, stale = list(), list()
+            for ch in self.__channels.get(addr, ()):
+                (channels if self.is_healthy(ch, now) else stale).append(ch)
+            self.__channels[addr] = channels
+            if len(channels) >= self.size:
+                channel = channels[next(self.__turn) % len(channels)]
+        for ch in stale:
+            ch.close()
+        return channel
+
+    def add(self, addr: str, channel):
+        if channel:
+            with self.__lock:
+                self.__channels.setdefault(addr, list()).append(channel)
+        return channel
+
+    def discard(self, addr: str, channel):
+        '''
+        drop a channel that failed mid-request
+        '''
+        with self.__lock:
+            channels = self.__channels.get(addr, [])
+            if channel in channels:
+                channels.remove(channel)
+        channel.close()
+
+    def close(self, addr: str = None):
+        '''
+        close the channels to the peer at `addr`, or to every
+        peer if no address is given
+        '''
+        with self.__lock:
+            if addr:
+                channels = self.__channels.pop(addr, [])
+            else:
+                channels = [ch for chs in self.__channels.values() for ch in chs]
+                self.__channels.clear()
+        for channel in channels:
+            channel.close()
+
+    def in_backoff(self, addr: str) -> bool:
+        with self.__lock:
+            failures, retry_at = self.__backoff.get(addr, (0, 0))
+        if retry_at > time.time():
+            logger.debug(f'[POOL] peer {addr} in backoff, skipping connect')
+            return True
+        return False
+
+    def record_failure(self, addr: str):
+        with self.__lock:
+            failures, _ = self.__backoff.get(addr, (0, 0))
+            delay = min(cfg.POOL_BACKOFF_MIN * (2 ** failures), cfg.POOL_BACKOFF_MAX)
+            self.__backoff[addr] = (failures + 1, time.time() + delay / 1000)
+
+    def record_success(self, addr: str):
+        with self.__lock:
+            self.__backoff.pop(addr, None)
+
+    @staticmethod
+    def is_healthy(channel, now: float) -> bool:
+        return not channel.closed and now - channel.last_used < cfg.POOL_IDLE_TIMEOUT / 1000
+
+
+class AsyncConnectionPool(ConnectionPool):
+
+    '''
+    asyncio flavour of the `ConnectionPool`; the pooled channels are
+    `AsyncChannel`s and must only be used from the event loop that
+    opened them
+    '''
+
+    async def acquire(self, addr: str) -> AsyncChannel:
+        channel = self.pick(addr)
+        if channel:
+            return channel
+        return self.add(addr, await self.connect(addr))
+
+    async def connect(self, addr: str) -> AsyncChannel:
+        if self.in_backoff(addr):
+            return None
+        host, port = addr.split(':')
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(host, int(port)), self.timeout)
+        except (OSError, asyncio.TimeoutError):
+            self.record_failure(addr)
+            raise
+        writer.get_extra_info('socket').setsockopt(
+            socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.record_success(addr)
+        channel = AsyncChannel(reader, writer)
+        try:
+            reply = await channel.request(self.hello(), self.timeout)
+        except (OSError, asyncio.TimeoutError):
+            channel.close()
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(host, int(port)), self.timeout)
+            return AsyncChannel(reader, writer)
+        return self.negotiated(channel, reply)
@@ -0,0 +1,326 @@
+'''
+Framed wire protocol used between the nodes of the cluster.
+
+Every message is sent as one frame: a fixed size header followed by the
+encoded message. The header carries the length of the message, so that
+messages of any size are read completely, and a request id, so that many
+requests can be in flight on one connection; the reply to a request is
+sent back with the request id of the request::
+
+    +-------+---------+-------+------------+--------+----------------+
+    | magic | version | codec | request id | length | message ...    |
+    | 2 B   | 1 B     | 1 B   | 4 B        | 4 B    | `length` bytes |
+    +-------+---------+-------+------------+--------+----------------+
+
+The first byte of the magic can never start a JSON document, so a server
+can tell framed connections apart from the plain JSON messages sent by
+hand-written clients, which keep working unchanged.
+'''
+import asyncio
+import socket
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeout
+from itertools import count
+from struct import Struct
+from threading import Lock, Thread
+
+from raftnode import cfg, logger
+from raftnode.codec import JSON, get_codec
+
+MAGIC = b'RN'
+VERSION = 1
+HEADER = Struct('!2sBBII')
+
+
+def encode_payload(msg: dict, codec: int = JSON) -> bytes:
+    '''
+    encode the message with the given codec (see `raftnode.codec`)
+    '''
+    return get_codec(codec).encode(msg)
+
+
+def decode_payload(payload, codec: int = JSON) -> dict:
+    '''
+    decode a message; `payload` can be any bytes-like object, including a
+    memoryview on the receive buffer
+    '''
+    return get_codec(codec).decode(payload)
+
+
+def pack_header(request_id: int, length: int, codec: int = JSON) -> bytes:
+    return HEADER.pack(MAGIC, VERSION, codec, request_id, length)
+
+
+def unpack_header(header) -> tuple:
+    '''
+    :returns: codec, request id and length of the frame
+    :rtype: tuple
+    '''
+    magic, version, codec, request_id, length = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ValueError(f'bad frame magic {bytes(magic)}')
+    if length > cfg.MAX_MESSAGE_SIZE:
+        raise ValueError(f'frame of {length} bytes is too large')
+    return codec, request_id, length
+
+
+def send_frame(sock: socket.socket, request_id: int, payload: bytes, codec: int = JSON):
+    '''
+    send the header and the payload with one vectored write, without
+    concatenating them first
+    '''
+    buffers = [pack_header(request_id, len(payload), codec), payload]
+    total = sum(len(b) for b in buffers)
+    sent = sock.sendmsg(buffers)
+    if sent < total:
+        sock.sendall(memoryview(b''.join(buffers))[sent:])
+
+
+class FrameBuffer:
+
+    '''
+    Reusable receive buffer. Data is read straight into the buffer with
+    `recv_into` and complete frames are handed out as memoryviews on it,
+    so no intermediate bytes objects are created per read. The buffer only
+    grows when a frame larger than the buffer arrives
+
+    :param size: initial size of the buffer in bytes
+    :type size: int
+    '''
+
+    def __init__(self, size: int = cfg.RECV_BUFFER):
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.start = 0
+        self.end = 0
+
+    def __len__(self):
+        return self.end - self.start
+
+    def recv_into(self, sock: socket.socket) -> int:
+        '''
+        read whatever is available on the socket into the buffer
+
+        :returns: number of bytes read; 0 means the other end closed the connection
+        :rtype: int
+        '''
+        if self.end == len(self.buffer):
+            self.__make_room(len(self) + 1)
+        n = sock.recv_into(self.view[self.end:])
+        self.end += n
+        return n
+
+    def peek(self, n: int) -> memoryview:
+        return self.view[self.start:min(self.start + n, self.end)]
+
+    def take(self) -> bytes:
+        '''
+        return everything buffered so far and empty the buffer
+        '''
+        data = bytes(self.view[self.start:self.end])
+        self.start = self.end = 0
+        return data
+
+    def next_frame(self) -> tuple:
+        '''
+        :returns: codec, request id and payload of the next complete frame,
+                  None if the frame is not complete yet. The payload is a
+                  memoryview that is only valid until the next `recv_into`
+        :rtype: tuple
+        '''
+        if len(self) < HEADER.size:
+            return None
+        codec, request_id, length = unpack_header(
+            self.view[self.start:self.start + HEADER.size])
+        frame_end = self.start + HEADER.size + length
+        if frame_end > self.end:
+            if frame_end > len(self.buffer):
+                self.__make_room(HEADER.size + length)
+            return None
+        payload = self.view[self.start + HEADER.size:frame_end]
+        self.start = frame_end
+        if self.start == self.end:
+            self.start = self.end = 0
+        return codec, request_id, payload
+
+    def __make_room(self, needed: int):
+        '''
+        move the unread bytes to the front of the buffer, or to a new
+        larger buffer if `needed` bytes do not fit in the current one.
+        The buffer is replaced rather than resized, since memoryviews
+        handed out earlier may still be alive
+        '''
+        pending = len(self)
+        if needed > len(self.buffer):
+            buffer = bytearray(max(needed, 2 * len(self.buffer)))
+            buffer[:pending] = self.view[self.start:self.end]
+            self.buffer, self.view = buffer, memoryview(buffer)
+        elif self.start:
+            self.buffer[:pending] = self.view[self.start:self.end]
+        self.start, self.end = 0, pending
+
+
+class Channel:
+
+    '''
+    A framed connection to a peer that many threads can use at the same
+    time. Requests are tagged with a request id and a reader thread hands
+    every reply to the thread waiting for it, so a slow request does not
+    hold up the others. Messages are encoded with the codec negotiated
+    for the channel, JSON until then
+
+    :param sock: connected socket
+    :type sock: socket.socket
+    '''
+
+    def __init__(self, sock: socket.socket):
+        sock.settimeout(None)
+        self.sock = sock
+        self.codec = JSON
+        self.closed = False
+        self.last_used = time.time()
+        self.pending = dict()
+        self.__ids = count(1)
+        self.__lock = Lock()
+        self.__send_lock = Lock()
+        Thread(target=self.__read_replies, daemon=True).start()
+
+    def request(self, msg: dict, timeout: float) -> dict:
+        '''
+        send a message and wait for it's reply
+
+        :param msg: message to be sent
+        :type msg: dict
+
+        :param timeout: how long to wait for the reply, in seconds
+        :type timeout: float
+
+        :returns: decoded reply
+        :rtype: dict
+        '''
+        reply = self.submit(msg)
+        try:
+            return reply.result(timeout)
+        except FutureTimeout:
+            self.forget(reply)
+            raise socket.timeout(f'no reply in {timeout} seconds')
+
+    def submit(self, msg: dict) -> Future:
+        '''
+        send a message without waiting for it's reply, so that many
+        requests can be in flight at once
+
+        :returns: future of the decoded reply; it fails with a connection
+                  error if the channel is closed before the reply arrives
+        :rtype: Future
+        '''
+        codec = self.codec
+        payload = encode_payload(msg, codec)
+        reply = Future()
+        self.last_used = time.time()
+        with self.__lock:
+            if self.closed:
+                raise ConnectionResetError('channel closed')
+            request_id = next(self.__ids) & 0xffffffff
+            self.pending[request_id] = reply
+        reply.request_id = request_id
+        try:
+            with self.__send_lock:
+                send_frame(self.sock, request_id, payload, codec)
+        except OSError:
+            self.forget(reply)
+            raise
+        return reply
+
+    def forget(self, reply: Future):
+        '''
+        stop waiting for the reply, e.g. after a timeout
+        '''
+        with self.__lock:
+            self.pending.pop(reply.request_id, None)
+
+    def __read_replies(self):
+        frames = FrameBuffer()
+        try:
+            while frames.recv_into(self.sock):
+                frame = frames.next_frame()
+                while frame:
+                    codec, request_id, payload = frame
+                    reply = decode_payload(payload, codec)
+                    with self.__lock:
+                        waiter = self.pending.pop(request_id, None)
+                    if waiter:
+                        waiter.set_result(reply)
+                    frame = frames.next_frame()
+        except (OSError, ValueError) as e:
+            logger.debug(f'[CHANNEL] connection lost: {e}')
+        self.close()
+
+    def close(self):
+        with self.__lock:
+            self.closed = True
+            waiters, self.pending = list(self.pending.values()), dict()
+        for waiter in waiters:
+            waiter.set_exception(ConnectionResetError('channel closed'))
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+class AsyncChannel:
+
+    '''
+    asyncio flavour of the `Channel`; it must only be used from the
+    event loop that created it
+    '''
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.codec = JSON
+        self.closed = False
+        self.last_used = time.time()
+        self.pending = dict()
+        self.__ids = count(1)
+        self.__task = asyncio.ensure_future(self.__read_replies())
+
+    async def request(self, msg: dict, timeout: float) -> dict:
+        codec = self.codec
+        payload = encode_payload(msg, codec)
+        if self.closed:
+            raise ConnectionResetError('channel closed')
+        self.last_used = time.time()
+        request_id = next(self.__ids) & 0xffffffff
+        reply = asyncio.get_event_loop().create_future()
+        self.pending[request_id] = reply
+        try:
+            self.writer.writelines(
+                [pack_header(request_id, len(payload), codec), payload])
+            await self.writer.drain()
+            return await asyncio.wait_for(reply, timeout)
+        finally:
+            self.pending.pop(request_id, None)
+
+    async def __read_replies(self):
+        try:
+            while True:
+                codec, request_id, length = unpack_header(
+                    await self.reader.readexactly(HEADER.size))
+                payload = await self.reader.readexactly(length)
+                reply = self.pending.pop(request_id, None)
+                if reply and not reply.done():
+                    reply.set_result(decode_payload(payload, codec))
+        except (asyncio.IncompleteReadError, OSError, ValueError) as e:
+            logger.debug(f'[CHANNEL] connection lost: {e}')
+        self.close()
+
+    def close(self):
+        self.closed = True
+        for reply in self.pending.values():
+            if not reply.done():
+                reply.set_exception(ConnectionResetError('channel closed'))
+        self.pending = dict()
+        self.writer.close()
@@ -1,8 +1,10 @@
 """Main module."""
-from threading import Thread
+from threading import Event, Thread
 from queue import Queue
 import socket
 from raftnode import logger
+from raftnode.async_election import AsyncElection
+from raftnode.async_transport import AsyncTransport
 from raftnode.election import Election
 from raftnode.store import Store
 from raftnode.transport import Transport
@@ -10,12 +12,19 @@ from raftnode.transport import Transport
 
 class RaftNode(Transport):
 
-    def __init__(self, my_ip: str, peers: list, timeout: int, **kwargs):
+    def __init__(self, my_ip: str, peers: list, timeout: int, engine: str = 'thread', **kwargs):
         self.q = Queue()
+        self.__engine = engine
+        kwargs.setdefault('log_name', f'wal-{my_ip.replace(":", "-")}')
         self.__store = Store(**kwargs)
-        self.__transport = Transport(my_ip, timeout=timeout, queue=self.q)
-        self.__election = Election(
-            transport=self.__transport, store=self.__store, queue=self.q)
+        if engine == 'asyncio':
+            self.__transport = AsyncTransport(my_ip, timeout=timeout, queue=self.q)
+            self.__election = AsyncElection(
+                transport=self.__transport, store=self.__store, queue=self.q)
+        else:
+            self.__transport = Transport(my_ip, timeout=timeout, queue=self.q)
+            self.__election = Election(
+                transport=self.__transport, store=self.__store, queue=self.q)
         self.q.put({'election': self.__election})
         self.__peers = peers
 
@@ -38,7 +47,10 @@ class RaftNode(Transport):
         '''
         start the socket server for this node
         '''
-        Thread(target=self.__transport.serve).start()
+        if self.__engine == 'asyncio':
+            self.__transport.serve()
+        else:
+            Thread(target=self.__transport.serve, daemon=True).start()
 
     def start_adding_peers(self, peers):
         '''
@@ -47,11 +59,17 @@ class RaftNode(Transport):
         '''
         if peers:
             for peer in peers:
-                Thread(target=self.__transport.req_add_peer,
-                       args=(peer,)).start()
+                self.__transport.submit(self.__transport.req_add_peer, peer)
 
     def start_timeout(self):
         '''
         start the election timer
         '''
         self.__election.init_timeout()
+
+    def wait(self):
+        '''
+        block until the process is interrupted; the threads of the node
+        are daemon threads, which do not keep the process running
+        '''
+        Event().wait()
@@ -0,0 +1,92 @@
+'''
+Linearizable reads without going through the log.
+
+A read is linearizable if it sees every write committed before it arrived.
+The leader makes sure of that with the ReadIndex protocol (see
+`Election.leader_read_index`): it takes its commit index as the read index
+and confirms it is still the leader with a round of heartbeats acked by the
+majority, sent after the read arrived. With a leader lease (READ_LEASE) the
+round is skipped while the majority acked heartbeats within the lease.
+
+A follower asks the leader for a read index, waits until it has applied up
+to it and reads from its own database. The reads that arrive at a follower
+while it waits for a read index share the next request (`SharedRequest`),
+so the leader handles one request per follower at a time, whatever the
+number of reads.
+
+A get may ask for less: with the ``bounded(ms)`` consistency a node answers
+from its own database if it is at most that many ms behind the leader, and
+with ``any`` it always does (see `consistency`).
+'''
+import re
+from threading import Condition
+
+from raftnode import logger
+
+LINEARIZABLE, BOUNDED, ANY = 'linearizable', 'bounded', 'any'
+_BOUNDED = re.compile(r'bounded\((\d+(?:\.\d*)?)\)$')
+
+
+def consistency(payload: dict) -> tuple:
+    '''
+    the consistency a get asks for: linearizable (the default),
+    bounded(ms) or any
+
+    :returns: the level and, for bounded, the staleness in seconds
+    :rtype: tuple
+
+    :raises ValueError: if the consistency is none of these
+    '''
+    value = payload.get('consistency', LINEARIZABLE)
+    if value in (LINEARIZABLE, ANY):
+        return value, None
+    match = _BOUNDED.match(str(value).replace(' ', ''))
+    if not match:
+        raise ValueError(f'unknown consistency {value}')
+    return BOUNDED, float(match.group(1)) / 1000
+
+
+class SharedRequest:
+
+    '''
+    runs `fetch` for the callers of `get`, one call at a time. A caller
+    only takes the result of a call that started after it arrived, so the
+    callers that arrive while a call is running share the next one
+
+    :param fetch: function returning the result, None if it failed
+    :type fetch: callable
+    '''
+
+    def __init__(self, fetch):
+        self.__fetch = fetch
+        self.__cond = Condition()
+        self.__running = False
+        self.__started = 0
+        self.__finished = 0
+        self.__result = None
+
+    def get(self):
+        '''
+        :returns: the result of a call started after this one arrived
+        '''
+        with self.__cond:
+            wanted = self.__started + 1
+            while self.__finished < wanted:
+                if self.__running:
+                    self.__cond.wait()
+                    continue
+                self.__running = True
+                self.__started += 1
+                call = self.__started
+                self.__cond.release()
+                result = None
+                try:
+                    result = self.__fetch()
+                except Exception:
+                    logger.exception('[READ INDEX] request failed')
+                finally:
+                    self.__cond.acquire()
+                    self.__running = False
+                    self.__finished, self.__result = call, result
+                    self.__cond.notify_all()
+            return self.__result
@@ -0,0 +1,273 @@
+import os
+import time
+from collections import deque
+from concurrent.futures import TimeoutError as FutureTimeout
+from json import dumps
+from threading import Thread
+
+from raftnode import cfg, logger
+
+
+class Replicator:
+
+    '''
+    Replicates the log of the leader to one follower, AppendEntries style.
+
+    `next_index` is the index of the next entry to send to the follower and
+    `match_index` the highest index the follower is known to have. Up to
+    REPLICATION_WINDOW append messages are in flight at once, so a follower
+    with a long round trip does not hold back the entries behind. While the
+    replicator does not know where the log of the follower matches the log
+    of the leader (after the election, or after an error) it sends one
+    message at a time. A follower that rejects an append tells where its
+    log ends or which term its conflicting entries are of, so `next_index`
+    gets to the point of divergence in one or two round trips, see
+    `divergence`.
+
+    The number of entries per message starts at PROPOSAL_BATCH_SIZE and then
+    follows the measured throughput of the follower, so a message takes
+    about REPLICATION_BATCH_TIME ms to be handled, and its size stays below
+    REPLICATION_BATCH_BYTES, see `batch_limit`.
+
+    Every append message also carries the commit index of the leader, so
+    the followers learn which of the entries they have can be committed.
+    A follower that needs entries the leader already dropped after a
+    snapshot is streamed the snapshot instead, see `send_snapshot`.
+
+    :param store: store of the leader
+    :type store: Store
+
+    :param transport: transport of the leader
+    :type transport: Transport
+
+    :param peer: address of the follower in `ip:port` format
+    :type peer: str
+
+    :param term: term this node is the leader of
+    :type term: int
+
+    :param leading: returns False once this node is no longer the
+                    leader of `term`
+    :type leading: callable
+    '''
+
+    def __init__(self, store, transport, peer: str, term: int, leading):
+        self.store = store
+        self.transport = transport
+        self.peer = peer
+        self.term = term
+        self.leading = leading
+        self.next_index = store.last_index + 1
+        self.match_index = 0
+        self.probing = True
+        self.sent_commit = -1
+        self.inflight = deque()
+        self.snapshot_offset = (None, 0)
+        self.batch_size = cfg.PROPOSAL_BATCH_SIZE
+        self.entry_bytes = 0
+        self.thread = Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def is_alive(self) -> bool:
+        return self.thread.is_alive()
+
+    def active(self) -> bool:
+        return self.leading() and self.peer in self.transport.peers
+
+    def has_work(self) -> bool:
+        '''
+        True if the follower is missing entries or the commit index
+        '''
+        return (self.next_index <= self.store.last_index
+                or self.sent_commit < self.store.commit_id)
+
+    def run(self):
+        logger.debug(f'[REPLICATION] replicating to {self.peer} for term {self.term}')
+        while self.active():
+            self.fill_window()
+            if self.inflight:
+                self.handle_reply(*self.inflight.popleft())
+            else:
+                self.store.wait_for_changes(
+                    lambda: self.has_work() or not self.active(), cfg.HB_TIME / 1000)
+        logger.debug(f'[REPLICATION] stopped replicating to {self.peer}')
+
+    def fill_window(self):
+        window = 1 if self.probing else cfg.REPLICATION_WINDOW
+        while len(self.inflight) < window and self.has_work():
+            prev_index = self.next_index - 1
+            prev_term = self.store.term_at(prev_index)
+            entries = self.store.entries_from(self.next_index, self.batch_limit())
+            if entries is None or prev_term is None:
+                if not self.inflight:
+                    self.send_snapshot()
+                return
+            commit_index = self.store.commit_id
+            message = {
+                'type': 'heartbeat',
+                'term': self.term,
+                'addr': self.transport.addr,
+                'action': 'append',
+                'prev_index': prev_index,
+                'prev_term': prev_term,
+                'payload': entries,
+                'commit_index': commit_index
+            }
+            reply = self.transport.send_request(self.peer, message)
+            if reply is None:
+                self.rewind(self.inflight[0][1] if self.inflight else prev_index)
+                time.sleep(cfg.HB_TIME / 1000)
+                return
+            if entries:
+                size = len(dumps(entries[0]))
+                self.entry_bytes = size if not self.entry_bytes else 0.8 * self.entry_bytes + 0.2 * size
+            self.inflight.append((reply, prev_index, len(entries), time.perf_counter()))
+            self.next_index += len(entries)
+            self.sent_commit = commit_index
+
+    def batch_limit(self) -> int:
+        '''
+        :returns: how many entries to send in the next message
+        :rtype: int
+        '''
+        if self.entry_bytes:
+            by_bytes = cfg.REPLICATION_BATCH_BYTES // self.entry_bytes
+            return int(max(1, min(self.batch_size, by_bytes)))
+        return int(max(1, self.batch_size))
+
+    def adapt(self, count: int, elapsed: float):
+        '''
+        size the next messages after the time the follower took for a
+        full message of `count` entries
+        '''
+        if not cfg.REPLICATION_BATCH_TIME or count < self.batch_limit() or elapsed <= 0:
+            return
+        target = count * cfg.REPLICATION_BATCH_TIME / 1000 / elapsed
+        # grow at most 2x a round, shrink right away
+        self.batch_size = max(1, min(target, 2 * self.batch_size))
+
+    def divergence(self, reply: dict) -> int:
+        '''
+        :returns: the index to continue with after the follower rejected
+                  an append; after the last entry the leader has of the
+                  conflicting term, or else the first index of that
+                  term (or the end of the log) in the follower's log
+        :rtype: int
+        '''
+        term = reply.get('conflict_term')
+        if term is not None:
+            last = self.store.last_index_of_term(term)
+            if last:
+                return last + 1
+        return reply.get('conflict_index', 1)
+
+    def handle_reply(self, future, prev_index: int, count: int, sent: float):
+        try:
+            reply = future.result(cfg.PEER_TIMEOUT / 1000)
+        except (FutureTimeout, OSError) as e:
+            reply = None
+        if not reply or reply.get('term', 0) > self.term:
+            logger.debug(f'[REPLICATION] no reply from {self.peer}')
+            self.rewind(prev_index)
+            time.sleep(cfg.HB_TIME / 1000)
+            return
+        if reply.get('success'):
+            self.probing = False
+            self.adapt(count, time.perf_counter() - sent)
+            if prev_index + count > self.match_index:
+                self.match_index = prev_index + count
+                self.store.update_commit(self.term)
+        else:
+            index = self.divergence(reply)
+            logger.debug(f'[REPLICATION] {self.peer} rejected entries after {prev_index}, '
+                         f'continuing at {index}')
+            self.rewind(min(index, prev_index + 1) - 1)
+
+    def send_snapshot(self):
+        '''
+        stream the latest snapshot of the leader to the follower, in
+        chunks of about SNAPSHOT_CHUNK_SIZE bytes read straight from the
+        file, with up to REPLICATION_WINDOW chunks in flight. Every reply
+        tells how much of the snapshot the follower has, so a transfer
+        that was cut off continues where the follower is. Afterwards the
+        follower continues with the entries after the snapshot. Without a
+        snapshot, or if it was just replaced, it is tried again next round
+        '''
+        snapshot = self.store.snapshots.latest
+        try:
+            if snapshot is None:
+                raise FileNotFoundError('no snapshot was written yet')
+            header = self.store.snapshots.header(snapshot)
+            fd = os.open(snapshot, os.O_RDONLY)
+        except FileNotFoundError as e:
+            logger.info(f'[REPLICATION] can not send a snapshot to {self.peer} yet: {e}')
+            time.sleep(cfg.HB_TIME / 1000)
+            return
+        commit_id = header['commit_id']
+        if self.snapshot_offset[0] != commit_id:
+            self.snapshot_offset = (commit_id, 0)
+        logger.info(f'[REPLICATION] sending snapshot {snapshot} to {self.peer} '
+                    f'from offset {self.snapshot_offset[1]}')
+        try:
+            size = os.fstat(fd).st_size
+            offset, inflight = self.snapshot_offset[1], deque()
+            while self.active():
+                while len(inflight) < cfg.REPLICATION_WINDOW and offset < size:
+                    data = self.store.snapshots.read_chunk(fd, offset, cfg.SNAPSHOT_CHUNK_SIZE)
+                    message = {
+                        'type': 'heartbeat',
+                        'term': self.term,
+                        'addr': self.transport.addr,
+                        'action': 'snapshot',
+                        'last_index': commit_id,
+                        'last_term': header['term'],
+                        'offset': offset,
+                        'payload': data.decode('utf-8'),
+                        'done': offset + len(data) == size
+                    }
+                    reply = self.transport.send_request(self.peer, message)
+                    if reply is None:
+                        time.sleep(cfg.HB_TIME / 1000)
+                        return
+                    offset += len(data)
+                    inflight.append((reply, offset))
+                if not inflight:
+                    # all of it was acknowledged but not installed; start over
+                    self.snapshot_offset = (commit_id, 0)
+                    time.sleep(cfg.HB_TIME / 1000)
+                    return
+                future, end = inflight.popleft()
+                try:
+                    reply = future.result(cfg.PEER_TIMEOUT / 1000)
+                except (FutureTimeout, OSError):
+                    reply = None
+                if not reply or reply.get('term', 0) > self.term:
+                    logger.debug(f'[REPLICATION] no reply from {self.peer}')
+                    time.sleep(cfg.HB_TIME / 1000)
+                    return
+                if reply.get('last_index', 0) >= commit_id:
+                    logger.info(f'[REPLICATION] {self.peer} installed the snapshot at {commit_id}')
+                    self.rewind(commit_id)
+                    self.match_index = max(self.match_index, commit_id)
+                    self.store.update_commit(self.term)
+                    return
+                received = reply.get('snapshot_offset', 0)
+                self.snapshot_offset = (commit_id, received)
+                if received != end:
+                    # the follower has a different part of it than expected
+                    inflight.clear()
+                    offset = received
+        finally:
+            os.close(fd)
+
+    def rewind(self, index: int):
+        '''
+        forget the messages in flight and continue after `index`
+        '''
+        self.inflight.clear()
+        self.next_index = max(index + 1, 1)
+        self.sent_commit = -1
+        self.probing = True
@@ -0,0 +1,191 @@
+'''
+Snapshots of the database at a commit id.
+
+A snapshot is a file named after the commit id it was taken at. The first
+line is a JSON header and every following line one ``[namespace, key, value]``
+item of the database, in JSON::
+
+    {"commit_id": 1200, "term": 3}
+    ["default", "name", "John Doe"]
+    ["default", "city", "Pune"]
+
+A snapshot is written to a temporary file, fsynced and then renamed, so a
+snapshot file is always complete. Once a snapshot is written the log entries
+it covers can be dropped, see `WriteAheadLog.compact`.
+
+The leader streams a snapshot to a follower in chunks of whole lines, read
+straight from the file (`read_chunk`). The follower appends them to a partial
+file (`receive`), which survives a restart, so an interrupted transfer
+resumes at the offset the follower already has.
+'''
+import os
+from json import dumps, loads
+
+from raftnode import cfg, logger
+
+SUFFIX = '.snap'
+PARTIAL = '.part'
+
+
+class SnapshotStore:
+
+    '''
+    the directory the snapshots of a node are kept in; only the
+    last `keep` snapshots are kept
+
+    :param directory: directory of the snapshot files
+    :type directory: str
+
+    :param keep: number of snapshots to keep
+    :type keep: int
+    '''
+
+    def __init__(self, directory: str, keep: int = cfg.SNAPSHOT_KEEP):
+        self.directory = directory
+        self.keep = max(1, keep)
+        os.makedirs(directory, exist_ok=True)
+
+    def __paths(self) -> list:
+        names = sorted(n for n in os.listdir(self.directory) if n.endswith(SUFFIX))
+        return [os.path.join(self.directory, n) for n in names]
+
+    @property
+    def latest(self) -> str:
+        '''
+        path of the latest snapshot, None if there is none
+        '''
+        paths = self.__paths()
+        return paths[-1] if paths else None
+
+    def write(self, commit_id: int, term: int, items) -> str:
+        '''
+        write a snapshot and remove the old ones
+
+        :param commit_id: commit id of the last entry the snapshot covers
+        :type commit_id: int
+
+        :param term: term of that entry
+        :type term: int
+
+        :param items: (namespace, key, value) items of the database
+        :type items: iterable
+
+        :returns: path of the snapshot
+        :rtype: str
+        '''
+        path = self.path(commit_id)
+        tmp = f'{path}.tmp'
+        count = 0
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(dumps({'commit_id': commit_id, 'term': term}) + '\n')
+            for item in items:
+                f.write(dumps(list(item)) + '\n')
+                count += 1
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        logger.info(f'[SNAPSHOT] wrote {count} items at commit id {commit_id} to {path}')
+        for old in self.__paths()[:-self.keep]:
+            os.remove(old)
+        return path
+
+    def __partial(self, commit_id: int, source: str) -> str:
+        # snapshots of different nodes at the same commit id have their
+        # items in a different order, so chunks of both cannot be mixed
+        source = source.replace(':', '-')
+        return os.path.join(self.directory, f'{commit_id:020d}-{source}{SUFFIX}{PARTIAL}')
+
+    def received(self, commit_id: int, source: str) -> int:
+        '''
+        :param source: address of the node sending the snapshot
+        :type source: str
+
+        :returns: how many bytes of the snapshot at `commit_id` were
+                  received from `source` so far; other partial snapshots
+                  are removed
+        :rtype: int
+        '''
+        partial = self.__partial(commit_id, source)
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(PARTIAL) and path != partial:
+                os.remove(path)
+        return os.path.getsize(partial) if os.path.exists(partial) else 0
+
+    def receive(self, commit_id: int, source: str, data: bytes, done: bool) -> int:
+        '''
+        append a chunk to the partial snapshot at `commit_id` from `source`;
+        the snapshot is put in place once the last chunk is in
+
+        :param done: True for the last chunk
+        :type done: bool
+
+        :returns: bytes received so far
+        :rtype: int
+        '''
+        partial = self.__partial(commit_id, source)
+        with open(partial, 'ab') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+        if done:
+            os.replace(partial, self.path(commit_id))
+            logger.info(f'[SNAPSHOT] received {size} bytes at commit id {commit_id}')
+            for old in self.__paths()[:-self.keep]:
+                os.remove(old)
+        return size
+
+    def path(self, commit_id: int) -> str:
+        '''
+        path of the snapshot at `commit_id`
+        '''
+        return os.path.join(self.directory, f'{commit_id:020d}{SUFFIX}')
+
+    @staticmethod
+    def read_chunk(fd: int, offset: int, size: int) -> bytes:
+        '''
+        read about `size` bytes from `offset` on, up to the end of the
+        last whole line, so every chunk can be sent as text
+
+        :param fd: file descriptor of the snapshot
+        :type fd: int
+        '''
+        data = os.pread(fd, size, offset)
+        end = data.rfind(b'\n') + 1
+        while not end and data:
+            # a line longer than `size`
+            more = os.pread(fd, size, offset + len(data))
+            if not more:
+                return data
+            data += more
+            end = data.rfind(b'\n') + 1
+        return data[:end]
+
+    @staticmethod
+    def header(path: str) -> dict:
+        '''
+        :returns: commit id and term of the snapshot
+        :rtype: dict
+        '''
+        with open(path, encoding='utf-8') as f:
+            return loads(f.readline())
+
+    @staticmethod
+    def items(path: str, namespaces: list = None):
+        '''
+        :param namespaces: only read the items of these namespaces; the
+                           other lines are skipped without decoding them
+        :type namespaces: list
+
+        :returns: the (namespace, key, value) items of the snapshot,
+                  read one at a time
+        :rtype: generator
+        '''
+        prefixes = None if namespaces is None else tuple(
+            dumps([namespace, None])[:-len(', null]')] + ',' for namespace in namespaces)
+        with open(path, encoding='utf-8') as f:
+            f.readline()
+            for line in f:
+                if prefixes is None or line.startswith(prefixes):
+                    yield tuple(loads(line))
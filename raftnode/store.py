@@ -1,40 +1,147 @@
 import time
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from itertools import chain
+from json import dumps, loads
 from os import getenv, makedirs, path
-from threading import Lock, Thread
-from collections import deque
-import shelve
+from threading import Condition, Event, Lock, Thread
 
 from raftnode import cfg, logger
 from raftnode.datastore.memory import MemoryStore
+from raftnode.entries import EntryLog
+from raftnode.expiry import NAMESPACE as EXPIRY_NAMESPACE, ExpiryTable
+from raftnode.replication import Replicator
+from raftnode.snapshot import SnapshotStore
+from raftnode.wal import WriteAheadLog
+from raftnode.watch import RESYNC, Watch, Watchers
+
+# the versions of the keys are kept in snapshots as items of this namespace
+VERSION_NAMESPACE = '__version__'
 
 class Store:
 
-    def __init__(self, store_type: str = 'memory', data_dir: str = 'data'):
+    '''
+    The log and the database of a node. Committed entries are appended to
+    a write-ahead log (see `raftnode.wal`) kept in the `log_name` directory
+    under `data_dir`. Every SNAPSHOT_ENTRIES entries (or SNAPSHOT_BYTES bytes
+    of log) the database is snapshotted (see `raftnode.snapshot`) into the
+    `log_name`.snapshots directory and the log entries it covers are dropped.
+    On start the database is restored from the latest snapshot and the log
+    entries after it. A durable database (see `IDatastore.applied`) is kept
+    as it is instead: only the expiration times and versions are loaded from
+    the snapshot and the log entries it does not have yet are written to it
+
+    :param store_type: type of data store to be used; either memory or database
+    :type store_type: str
+
+    :param data_dir: directory the log (and the database) are kept in
+    :type data_dir: str
+
+    :param log_name: name of the log directory; overridden by LOG_FILENAME
+    :type log_name: str
+    '''
+
+    def __init__(self, store_type: str = 'memory', data_dir: str = 'data', log_name: str = 'OrderedLog'):
         self.commit_id = 0
-        self.log = deque()
-        self.staged = None
+        self.last_term = 0
+        self.snapshot_id = 0
+        self.snapshot_term = 0
+        self.entries = EntryLog()
+        self.replicators = dict()
+        self.watchers = Watchers()
         self.db = self.__get_database(store_type, data_dir=data_dir)
         self.__lock = Lock()
+        self.__changed = Condition(self.__lock)
+        self.__proposals = dict()
+        self.__majority = 1
+        self.__expiry = ExpiryTable()
+        # commit id of the last write of every key, and whether the recent
+        # transactions succeeded, by commit id
+        self.__versions = dict()
+        self.__outcomes = OrderedDict()
+        # term and log index of the last round of evictions and expirations
+        self.__evicting = (0, 0)
+        self.__expiring = (0, 0)
+        self.__sweeper = None
+        self.__snapshotter = None
+        self.__receiving = None
+        self.__snapshot_bytes = 0
         self.__data_dir = getenv('DATA_DIR', data_dir)
-        self.__log_file = getenv('LOG_FILENAME', 'OrderedLog')
+        self.__log_file = getenv('LOG_FILENAME', log_name)
         self.__data_file = getenv('DATA_FILENAME', 'data.json')
         self.__check_data_dir()
         self.__session()
 
     def __session(self):
-        self.f = shelve.open(path.join(self.__data_dir,self.__log_file), writeback=True)
-        try:
-            if self.f['data']:
-                self.commit_id = self.f['data'][-1]['commit_id']
-                logger.debug(f'[SHELVE LOG] commit id, {self.commit_id}')
-        except KeyError as e:
-            self.f['data'] = self.log
-            logger.debug(f'[SHELVE LOG] Initial log, {self.f["data"]}')
-    
-    def __flush(self):
-        self.f['data'].append(self.staged)
-        logger.info(f'[DATA INSERT] {self.f["data"][-1]}')
-        self.f.close()
+        self.snapshots = SnapshotStore(path.join(self.__data_dir, f'{self.__log_file}.snapshots'))
+        self.log = WriteAheadLog(path.join(self.__data_dir, self.__log_file))
+        snapshot = self.snapshots.latest
+        recovered = self.__recover(snapshot)
+        if snapshot:
+            if recovered is None:
+                self.__restore(snapshot)
+            if self.log.last_commit_id < self.snapshot_id:
+                self.log.reset(self.snapshot_id)
+        self.commit_id = self.snapshot_id
+        while self.commit_id < self.log.last_commit_id:
+            entries = self.log.since(self.commit_id, cfg.WAL_BATCH_SIZE)
+            self.__apply(entries, recovered)
+            self.commit_id = entries[-1]['commit_id']
+            self.last_term = entries[-1].get('term', self.last_term)
+        self.entries.reset(self.commit_id)
+        logger.debug(f'[WAL] commit id, {self.commit_id}')
+
+    def __recover(self, snapshot: str) -> dict:
+        '''
+        keep a durable database as it is, if it has all the entries up
+        to the snapshot and none the log does not: only load the
+        expiration times and versions of the snapshot
+
+        :returns: what the database has (see `IDatastore.applied`), None
+                  if it has to be restored from the snapshot
+        :rtype: dict
+        '''
+        applied = self.db.applied()
+        if applied is None or None in applied['namespaces'].values():
+            return None
+        header = self.snapshots.header(snapshot) if snapshot else {'commit_id': 0, 'term': 0}
+        if max(applied['namespaces'].values(), default=0) > max(header['commit_id'], self.log.last_commit_id):
+            return None
+        if snapshot:
+            self.__expiry.clear()
+            self.__versions.clear()
+            tables = self.snapshots.items(snapshot, namespaces=[EXPIRY_NAMESPACE, VERSION_NAMESPACE])
+            for _ in self.__restore_items(tables):
+                pass
+            self.snapshot_id = header['commit_id']
+            self.snapshot_term = self.last_term = header['term']
+            logger.info(f'[SNAPSHOT] kept the database, restored the tables of {snapshot}')
+        return applied
+
+    def __restore(self, snapshot: str):
+        '''
+        replace the database with the contents of the snapshot
+        '''
+        header = self.snapshots.header(snapshot)
+        self.__expiry.clear()
+        self.__versions.clear()
+        self.db.restore(self.__restore_items(self.snapshots.items(snapshot)), header['commit_id'])
+        self.snapshot_id = header['commit_id']
+        self.snapshot_term = self.last_term = header['term']
+        logger.info(f'[SNAPSHOT] restored {snapshot}')
+
+    def __restore_items(self, items):
+        '''
+        the items of a snapshot for the database; the expiration times
+        and versions kept with them go to their tables
+        '''
+        for namespace, key, value in items:
+            if namespace == EXPIRY_NAMESPACE:
+                self.__expiry.set(key[0], key[1], value)
+            elif namespace == VERSION_NAMESPACE:
+                self.__versions[key[0], key[1]] = value
+            else:
+                yield namespace, key, value
 
     def __check_data_dir(self):
         if not path.exists(self.__data_dir):
@@ -51,42 +158,178 @@ class Store:
             from raftnode.datastore.rocks import RockStore
             database = kwargs.get('database', None)
             data_dir = kwargs.get('data_dir', None)
-            db = RockStore(data_dir=data_dir)
+            db = RockStore(data_dir=data_dir, config={
+                'namespaces': cfg.ROCKSDB_NAMESPACES,
+                'namespace_options': cfg.ROCKSDB_NAMESPACE_OPTIONS})
         else:
-            db = MemoryStore()
+            db = MemoryStore(config={
+                'max_bytes': cfg.MEMORY_MAX_BYTES,
+                'namespace_max_bytes': cfg.MEMORY_NAMESPACE_MAX_BYTES,
+                'eviction': cfg.MEMORY_EVICTION})
         return db
 
+    @property
+    def last_index(self) -> int:
+        '''
+        index of the last entry in the log, committed or not
+        '''
+        return self.entries.last_index
+
+    @property
+    def last_log_term(self) -> int:
+        '''
+        term of the last entry in the log, committed or not
+        '''
+        term = self.entries.term_at(self.last_index) if self.last_index > self.commit_id else None
+        return self.last_term if term is None else term
+
+    @property
+    def staged(self) -> list:
+        '''
+        the entries that are logged but not committed yet, None if there
+        are none
+        '''
+        return self.entries.slice(self.commit_id + 1, self.last_index - self.commit_id) or None
+
     def action_handler(self, message: dict):
         '''
-        handle the commit and log actions sent by the leader node
+        handle the append action sent by the leader node: if the log has
+        the entry at `prev_index` with `prev_term`, add the entries after
+        it to the log, replacing any uncommitted entries of an earlier term
+        they conflict with, and commit the entries up to the `commit_index`
+        of the leader. Otherwise the reply tells the leader where to
+        continue: `conflict_index` is the end of the log, or the first
+        entry of `conflict_term`, the term of the entry at `prev_index`
 
-        :param message: log/commit data as received from the leader
+        :param message: append data as received from the leader
         :type message: dict
+
+        :returns: fields to add to the reply, if any
+        :rtype: dict
+        '''
+        if message['action'] == 'snapshot':
+            return self.install_snapshot(message)
+        if message['action'] != 'append':
+            logger.info(f'unknown action {message["action"]}')
+            return
+        prev_index = message['prev_index']
+        entries = message['payload']
+        with self.__changed:
+            # appends are handled by several workers; give an earlier
+            # message still being handled the chance to fill the gap
+            self.__changed.wait_for(
+                lambda: prev_index <= self.last_index, cfg.HB_TIME / 1000)
+            if prev_index > self.last_index:
+                return {'success': False, 'conflict_index': self.last_index + 1}
+            # committed entries always match the log of the leader
+            term = self.entries.term_at(prev_index) if prev_index > self.commit_id else None
+            if term is not None and term != message.get('prev_term', term):
+                first = max(self.entries.first_index_of_term(term), self.commit_id + 1)
+                return {'success': False, 'conflict_term': term, 'conflict_index': first}
+            index = prev_index
+            for entry in entries:
+                index += 1
+                if index <= self.commit_id:
+                    continue
+                if index <= self.last_index:
+                    if self.entries.term_at(index) == entry.get('term', 0):
+                        continue
+                    self.__truncate(index - 1)
+                self.entries.append(entry)
+            self.__commit_to(min(message['commit_index'], index))
+            self.__changed.notify_all()
+            return {'success': True}
+
+    def term_at(self, index: int) -> int:
+        '''
+        :returns: term of the entry at `index`, None if the log does
+                  not have it (any more)
+        :rtype: int
         '''
         with self.__lock:
-            action = message['action']
-            payload = message['payload']
-            if action == 'log':
-                self.staged = payload
-            elif action == 'commit':
-                if isinstance(payload, list):
-                    for command in payload:
-                # cid = message.get('commit_id', self.commit_id)
-                        namespace = command.get('namespace', 'default')
-                        delete = command.get('delete', False)
-                        leader_cid = command
-                        logger.debug(f'[OLD COMMANDS] adding command {command}')
-                        if not self.staged:
-                            self.staged = command
-                        self.commit(namespace, delete)
-                else:
-                    namespace = payload.get('namespace', 'default')
-                    delete = payload.get('delete', False)
-                    logger.debug(f'[COMMAND] {payload}')
-                    if not self.staged:
-                        self.staged = payload
-                    self.commit(namespace, delete)
-        return
+            term = self.entries.term_at(index)
+            if term is not None or index > self.commit_id:
+                return term
+            if index == self.snapshot_id:
+                return self.snapshot_term
+        if index == 0:
+            return 0
+        entry = self.log.get(index)
+        return entry.get('term', 0) if entry else None
+
+    def last_index_of_term(self, term: int) -> int:
+        '''
+        :returns: index of the last entry of `term` in the log, None if
+                  there is none; the terms in the log never go down, so
+                  below the cached entries this is a binary search
+        :rtype: int
+        '''
+        with self.__lock:
+            first = self.entries.first_index
+            first_term = self.entries.term_at(first)
+            if first_term is not None and term >= first_term:
+                return self.entries.last_index_of_term(term)
+        low, high = self.log.first_commit_id - 1, first - 1
+        if self.term_at(low) is None:
+            low += 1
+        if low > high or self.term_at(low) > term:
+            return None
+        while low < high:
+            middle = (low + high + 1) // 2
+            found = self.term_at(middle)
+            if found is None:
+                return None
+            if found <= term:
+                low = middle
+            else:
+                high = middle - 1
+        return low if self.term_at(low) == term else None
+
+    def install_snapshot(self, message: dict) -> dict:
+        '''
+        receive a chunk of the snapshot the leader streams to this node.
+        The chunks are appended to a partial snapshot in order; once the
+        last one is in, the database and the log are replaced with the
+        snapshot, unless this node already has the entries it covers
+
+        :param message: chunk as sent by the leader; `last_index` and
+                        `last_term` are the commit id and term the snapshot
+                        was taken at, `offset` where the chunk (`payload`)
+                        starts and `done` is set on the last chunk
+        :type message: dict
+
+        :returns: `snapshot_offset`, the bytes of the snapshot received so
+                  far, so the leader knows where to continue
+        :rtype: dict
+        '''
+        commit_id = message['last_index']
+        with self.__changed:
+            if commit_id <= self.commit_id:
+                return None
+            source = message['addr']
+            if not self.__receiving or self.__receiving[:2] != [commit_id, source]:
+                self.__receiving = [commit_id, source, self.snapshots.received(commit_id, source)]
+            # chunks are handled by several workers, wait for the earlier ones
+            receiving = self.__receiving
+            self.__changed.wait_for(
+                lambda: receiving[2] >= message['offset'] or self.__receiving is not receiving,
+                cfg.HB_TIME / 1000)
+            if self.__receiving is not receiving or receiving[2] != message['offset']:
+                return {'snapshot_offset': receiving[2]}
+            data = bytes(message['payload'], encoding='utf-8')
+            receiving[2] = self.snapshots.receive(commit_id, source, data, message['done'])
+            self.__changed.notify_all()
+            if message['done']:
+                self.__receiving = None
+                self.__truncate(self.commit_id)
+                self.__restore(self.snapshots.path(commit_id))
+                # the changes the snapshot covers can not be streamed
+                self.watchers.close(RESYNC)
+                self.log.reset(commit_id)
+                self.commit_id = commit_id
+                self.entries.reset(commit_id)
+                self.__snapshot_bytes = self.log.appended_bytes
+            return {'snapshot_offset': receiving[2]}
 
     def put(self, term: int, payload: dict, transport, majority: int) -> bool:
         '''
@@ -106,62 +349,383 @@ class Store:
 
         :param majority: how many nodes constitute the majority
         :type majority: int
+
+        If the payload has a `ttl`, the key expires that many seconds from
+        now; the entry carries the time it expires at (`expires_at`), so
+        every node expires it at the same time
+
+        :raises ValueError: if the key is not a string or there is no value
         '''
-        namespace = payload.get('namespace', 'default')
-        with self.__lock:
-            self.staged = payload
-            waited = 0
-            log_message = {
-                'term': term,
-                'addr': transport.addr,
-                'payload': payload,
-                'action': 'log',
-                'commit_id': self.commit_id
-            }
-            log_confirmations = [False] * len(transport.peers)
-            Thread(target=self.send_data, args=(
-                log_message, transport, log_confirmations,)).start()
-
-            while sum(log_confirmations) + 1 < majority:
-                waited += 0.0005
-                time.sleep(0.0005)
-                if waited > cfg.MAX_LOG_WAIT / 1000:
-                    logger.info(
-                        f"waited {cfg.MAX_LOG_WAIT} ms, update rejected:")
-                    return False
+        self.__check_keys(payload.get('namespace', 'default'), [payload.get('key')])
+        if 'value' not in payload:
+            raise ValueError(f'no value to put in {payload["key"]}')
+        ttl = payload.get('ttl')
+        if ttl is not None:
+            payload = {k: v for k, v in payload.items() if k != 'ttl'}
+            payload['expires_at'] = time.time() + float(ttl)
+        accepted = self.propose(term, payload, transport, majority)
+        if accepted:
+            self.evict(term)
+        return accepted
 
-            commit_message = {
-                "term": term,
-                "addr": transport.addr,
-                "payload": payload,
-                "action": "commit",
-                "commit_id": self.commit_id
-            }
-        self.commit(namespace)
-        Thread(target=self.send_data,
-            args=(commit_message, transport,)).start()
-        logger.info(
-            "majority reached, replied to client, sending message to commit")
-        return True
+    def delete(self, term: int, payload: dict, transport, majority: int) -> bool:
+        '''
+        Delete the `key` in the payload from the database, replicating
+        the delete the same way `put` replicates inserts
 
-    def send_data(self, message: dict, transport, confirmations: list = None):
+        :raises ValueError: if the key is not a string
         '''
-        send the log or commit data to the follower nodes and record their 
-        responses in the `confirmations` list
+        self.__check_keys(payload.get('namespace', 'default'), [payload.get('key')])
+        return self.propose(term, dict(payload, delete=True), transport, majority)
 
-        :param message: data toe be sent to the follower nodes
-        :type message: dict
+    @staticmethod
+    def __check_keys(namespace, keys: list):
+        '''
+        keys that are not strings would be committed and then fail to be
+        applied on every node, so the writes are checked before they are
+        proposed
 
-        :param transport: instance of the transport class
-        :type transport: Transport
+        :raises ValueError: if the namespace or a key is not a string
+        '''
+        if not isinstance(namespace, str):
+            raise ValueError(f'namespace {namespace!r} is not a string')
+        for key in keys:
+            if not isinstance(key, str):
+                raise ValueError(f'key {key!r} is not a string')
+
+    def mput(self, term: int, payload: dict, transport, majority: int) -> bool:
+        '''
+        Insert the `items` of the payload, a dict of keys and values, into
+        the `namespace`. They are replicated as one entry of the log and
+        applied at once; a `ttl` applies to all of them (see `put`)
+
+        :returns: True if the entry was committed and is durable
+        :rtype: bool
+
+        :raises ValueError: if the items are not a dict with string keys
+        '''
+        items = payload.get('items')
+        if not isinstance(items, dict):
+            raise ValueError('items must be a dict of keys and values')
+        self.__check_keys(payload.get('namespace', 'default'), items)
+        entry = {'type': 'mput', 'namespace': payload.get('namespace', 'default'),
+                 'items': items}
+        if payload.get('ttl') is not None:
+            entry['expires_at'] = time.time() + float(payload['ttl'])
+        accepted = self.propose(term, entry, transport, majority)
+        if accepted:
+            self.evict(term)
+        return accepted
+
+    def mdelete(self, term: int, payload: dict, transport, majority: int) -> bool:
+        '''
+        Delete the `keys` of the payload from the `namespace`, replicated
+        as one entry of the log and applied at once
+
+        :raises ValueError: if the keys are not a list of strings
+        '''
+        keys = payload.get('keys')
+        if not isinstance(keys, list):
+            raise ValueError('keys must be a list')
+        self.__check_keys(payload.get('namespace', 'default'), keys)
+        entry = {'type': 'mdelete', 'namespace': payload.get('namespace', 'default'),
+                 'keys': keys}
+        return self.propose(term, entry, transport, majority)
+
+    def txn(self, term: int, payload: dict, transport, majority: int):
+        '''
+        Apply the `success` operations of the payload if all its `compare`
+        comparisons hold, the `failure` operations otherwise, atomically.
+        A comparison is the `key` and the `value` it must have (null if it
+        must not exist) or its `version`, the commit id of its last write
+        (0 if it must not exist). An operation is a `key` and its `value`,
+        or a `key` and the `delete` flag. All the keys are of the
+        `namespace`.
+
+        The transaction is replicated as one entry of the log and every
+        node evaluates it when applying it (see `__compare`), so it sees
+        all the entries committed before it
+
+        :returns: False if the entry was not committed, otherwise whether
+                  the comparisons held (`succeeded`) and its `commit_id`
+        :rtype: dict
+
+        :raises ValueError: if a comparison or an operation is not valid
+        '''
+        entry = {'type': 'txn', 'namespace': payload.get('namespace', 'default'),
+                 'compare': payload.get('compare') or [],
+                 'success': payload.get('success') or [],
+                 'failure': payload.get('failure') or [], 'now': time.time()}
+        self.__check_keys(entry['namespace'], [])
+        if not all(isinstance(entry[part], list) for part in ('compare', 'success', 'failure')):
+            raise ValueError('compare, success and failure must be lists')
+        for compare in entry['compare']:
+            if not isinstance(compare, dict) or not isinstance(compare.get('key'), str):
+                raise ValueError(f'bad comparison {compare}')
+            if ('value' in compare) == ('version' in compare):
+                raise ValueError(f'compare the value or the version of {compare["key"]}')
+        for op in entry['success'] + entry['failure']:
+            if not isinstance(op, dict) or not isinstance(op.get('key'), str):
+                raise ValueError(f'bad operation {op}')
+            if not op.get('delete', False) and 'value' not in op:
+                raise ValueError(f'no value to put in {op["key"]}')
+        proposal = self.__propose(term, entry, majority)
+        if proposal is None:
+            return False
+        self.evict(term)
+        return {'succeeded': proposal.succeeded, 'commit_id': proposal.commit_id}
+
+    def cas(self, term: int, payload: dict, transport, majority: int):
+        '''
+        Compare and swap: put the `value` of the payload in the `key` (or
+        delete it with the `delete` flag) if the key has the `expected`
+        value (null if it must not exist) or the `version` (see `txn`)
+
+        :raises ValueError: if neither `expected` nor `version` is given
+        '''
+        key = payload.get('key')
+        if 'version' in payload:
+            compare = {'key': key, 'version': payload['version']}
+        elif 'expected' in payload:
+            compare = {'key': key, 'value': payload['expected']}
+        else:
+            raise ValueError('cas needs the expected value or the version')
+        if payload.get('delete', False):
+            op = {'key': key, 'delete': True}
+        else:
+            op = {'key': key, 'value': payload.get('value')}
+        return self.txn(term, {'namespace': payload.get('namespace', 'default'),
+                               'compare': [compare], 'success': [op]}, transport, majority)
+
+    def evict(self, term: int):
+        '''
+        append deletes of the keys the database picks to evict (see
+        `IDatastore.evictions`) to the log of the leader, without waiting
+        for them; every node applies them, so all evict the same keys.
+        There is one round of evictions in the log at a time
+        '''
+        with self.__changed:
+            if self.__evicting[0] == term and self.commit_id < self.__evicting[1]:
+                return
+            victims = self.__versioned(self.db.evictions())
+            if victims:
+                self.__evicting = (term, self.__append_deletes('evict', victims, term))
+        if victims:
+            logger.info(f'[EVICT] evicting {len(victims)} keys')
+            self.update_commit(term)
+
+    def sweep(self, term: int):
+        '''
+        append deletes of the keys whose TTL ran out to the log of the
+        leader, up to TTL_SWEEP_KEYS of them, without waiting for them.
+        There is one round of expirations in the log at a time
+        '''
+        with self.__changed:
+            if self.__expiring[0] == term and self.commit_id < self.__expiring[1]:
+                return
+            keys = self.__versioned(self.__expiry.due(time.time(), cfg.TTL_SWEEP_KEYS))
+            if keys:
+                self.__expiring = (term, self.__append_deletes('expire', keys, term))
+        if keys:
+            logger.info(f'[EXPIRE] expiring {len(keys)} keys')
+            self.update_commit(term)
+
+    def __sweep_loop(self, term: int, leading):
+        while leading():
+            time.sleep(cfg.TTL_SWEEP_INTERVAL / 1000)
+            self.sweep(term)
+
+    def __versioned(self, keys: list) -> list:
+        '''
+        :returns: the (namespace, key, version) of the (namespace, key)
+                  `keys`; the delete of a key is only applied if it still
+                  has that version (see `__unchanged`)
+        :rtype: list
+        '''
+        return [(namespace, key, self.__versions.get((namespace, key), 0)) for namespace, key in keys]
+
+    def __append_deletes(self, kind: str, keys: list, term: int) -> int:
+        '''
+        append entries deleting the (namespace, key, version) `keys`, DELETE_BATCH_SIZE
+        keys per entry, so they are replicated and committed together; must
+        be called with the store lock held
+
+        :returns: index of the last entry
+        :rtype: int
+        '''
+        for batch in cfg.chunks(keys, cfg.DELETE_BATCH_SIZE):
+            index = self.entries.append(
+                {'type': kind, 'keys': [list(k) for k in batch], 'term': term})
+        self.__changed.notify_all()
+        return index
+
+    def propose(self, term: int, entry: dict, transport, majority: int) -> bool:
+        '''
+        append the entry to the log of the leader and wait until the
+        replicators (see `raftnode.replication`) got it to the majority
+        and it is committed. Entries proposed at the same time are sent
+        to the followers together, up to PROPOSAL_BATCH_SIZE per message
+
+        :returns: True if the entry was committed and is durable within
+                  MAX_LOG_WAIT ms
+        :rtype: bool
+        '''
+        return self.__propose(term, entry, majority) is not None
+
+    def __propose(self, term: int, entry: dict, majority: int):
+        '''
+        :returns: the proposal of the entry (see `propose`), None if the
+                  entry was not committed or is not durable
+        :rtype: Proposal
+        '''
+        proposal = Proposal(dict(entry, term=term))
+        with self.__changed:
+            self.__majority = majority
+            index = self.entries.append(proposal.entry)
+            self.__proposals[index] = proposal
+            self.__changed.notify_all()
+        self.update_commit(term)
+        if not proposal.wakeup.wait(cfg.MAX_LOG_WAIT / 1000):
+            with self.__lock:
+                self.__proposals.pop(index, None)
+            logger.info(f"waited {cfg.MAX_LOG_WAIT} ms, update rejected:")
+            return None
+        if proposal.accepted and self.wait_durable(proposal.durable):
+            return proposal
+        return None
+
+    def start_replication(self, term: int, peers: list, transport, majority: int, leading):
+        '''
+        start a replicator for every peer that does not have one for this
+        term yet. If the log ends with entries of earlier terms that are not
+        committed yet, an empty entry of this term is appended: entries of
+        earlier terms are only committed along with an entry of the term of
+        the leader
+
+        :param leading: returns False once this node is no longer the
+                        leader of `term`
+        :type leading: callable
+        '''
+        with self.__changed:
+            self.__majority = majority
+            if self.last_index > self.commit_id and self.entries.term_at(self.last_index) != term:
+                self.entries.append({'type': 'noop', 'term': term})
+            for peer in peers:
+                replicator = self.replicators.get(peer)
+                if replicator and replicator.term == term and replicator.is_alive():
+                    continue
+                self.replicators[peer] = Replicator(
+                    self, transport, peer, term, leading).start()
+            if self.__sweeper is None or self.__sweeper[0] != term:
+                # keys an earlier term of this node took to expire may
+                # not have been deleted
+                self.__expiry.rebuild()
+                thread = Thread(target=self.__sweep_loop, args=(term, leading), daemon=True)
+                self.__sweeper = (term, thread)
+                thread.start()
+            self.__changed.notify_all()
+        self.update_commit(term)
+
+    def update_commit(self, term: int):
+        '''
+        advance the commit index of the leader to the highest index that
+        the majority of the nodes have
+        '''
+        with self.__changed:
+            matches = [self.last_index] + [
+                r.match_index for r in self.replicators.values() if r.term == term]
+            if len(matches) < self.__majority:
+                return
+            index = sorted(matches, reverse=True)[self.__majority - 1]
+            if index <= self.commit_id or self.entries.term_at(index) != term:
+                return
+            self.__commit_to(index)
+            self.__changed.notify_all()
+
+    def read_index(self, term: int, timeout: float) -> int:
+        '''
+        wait until the commit index covers all the entries of the terms
+        before `term`, which is when every entry after it is of `term`.
+        A new leader only knows that once it committed an entry of its
+        own term
+
+        :returns: the commit index, None if it does not cover them
+                  within `timeout` seconds
+        :rtype: int
+        '''
+        def covered():
+            return self.commit_id == self.last_index or self.entries.term_at(self.commit_id + 1) == term
+        with self.__changed:
+            if self.__changed.wait_for(covered, timeout):
+                return self.commit_id
+        return None
+
+    def wait_for_changes(self, predicate, timeout: float):
+        '''
+        wait until `predicate` holds, re-checking it whenever the log
+        or the commit index change
+        '''
+        with self.__changed:
+            self.__changed.wait_for(predicate, timeout)
+
+    def entries_from(self, index: int, limit: int) -> list:
+        '''
+        :returns: up to `limit` entries of the log, from `index` on; None
+                  if the entry at `index` was dropped after a snapshot.
+                  Entries older than the cached ones are read from the
+                  write-ahead log
+        :rtype: list
+        '''
+        with self.__lock:
+            first = self.entries.first_index
+            if index >= first:
+                return self.entries.slice(index, limit)
+            cached = self.entries.slice(first, limit - (first - index))
+        if index < self.log.first_commit_id:
+            return None
+        committed = self.log.since(index - 1, min(limit, first - index))
+        if not committed or committed[0]['commit_id'] != index:
+            return None
+        if len(committed) < first - index:
+            return committed
+        return committed + cached
+
+    def __commit_to(self, index: int):
+        '''
+        commit the entries of the log up to `index`; must be called
+        with the store lock held
+        '''
+        index = min(index, self.last_index)
+        committed, proposals = list(), dict()
+        while self.commit_id < index:
+            entry, durable = self.__log_commit(self.entries.get(self.commit_id + 1))
+            committed.append(entry)
+            proposal = self.__proposals.pop(self.commit_id, None)
+            if proposal:
+                proposal.durable = durable
+                proposals[self.commit_id] = proposal
+        if not committed:
+            return
+        # all the entries committed at once go to the database in one batch
+        outcomes = self.__apply(committed)
+        self.__maybe_snapshot()
+        for commit_id, proposal in proposals.items():
+            proposal.commit_id = commit_id
+            proposal.succeeded = outcomes.get(commit_id)
+            proposal.accepted = True
+            proposal.wakeup.set()
 
-        :param confirmations: list of the confirmations (initialized to False)
-        :type confirmations: list
+    def __truncate(self, index: int):
+        '''
+        drop the uncommitted entries after `index`; the proposals
+        waiting for them fail
         '''
-        for i, peer in enumerate(transport.peers):
-            reply = transport.heartbeat(peer, message)
-            if reply and confirmations:
-                confirmations[i] = True
+        for dropped in range(max(index, self.commit_id) + 1, self.last_index + 1):
+            proposal = self.__proposals.pop(dropped, None)
+            if proposal:
+                proposal.accepted = False
+                proposal.wakeup.set()
+        self.entries.truncate(max(index, self.commit_id))
 
     def get(self, payload: dict):
         '''
@@ -171,73 +735,418 @@ class Store:
         :param payload: dictionary consisting the key using which the
                         data needs to be retrieved from the database
         :type payload: dict 
+
+        :returns: the payload with the `value`, its `version` (the commit
+                  id of its last write, 0 if it does not exist) and the
+                  `commit_id` it was read at
+        :rtype: dict
         '''
         namespace = payload.get('namespace', 'default')
         key = payload["key"]
-        value = self.db.get(key=key, namespace=namespace)
-        payload.update({'value': value})
+        # the value has everything committed up to here, or more
+        commit_id = self.commit_id
+        value, version = None, 0
+        if not self.__expiry.expired(namespace, key, time.time()):
+            value = self.db.get(key=key, namespace=namespace)
+            version = self.__versions.get((namespace, key), 0)
+        payload.update({'value': value, 'version': version, 'commit_id': commit_id})
         return payload
 
-    def delete(self, term: int, payload: dict, transport, majority: int):
+    def mget(self, payload: dict):
+        '''
+        retrieve the values of the `keys` in the payload from the
+        `namespace`, in one lookup
+
+        :returns: the payload with the `values`, a dict of the keys and
+                  their values (None if they do not exist), and the
+                  `commit_id` they were read at
+        :rtype: dict
+        '''
+        namespace = payload.get('namespace', 'default')
+        keys = payload['keys']
+        commit_id = self.commit_id
+        now = time.time()
+        live = [key for key in keys if not self.__expiry.expired(namespace, key, now)]
+        values = self.db.get_many(live, namespace=namespace)
+        payload.update({'values': {key: values.get(key) for key in keys}, 'commit_id': commit_id})
+        return payload
+
+    def scan(self, payload: dict):
+        '''
+        read a page of the keys of the `namespace` in key order: the keys
+        from `start` on and before `end`, or the keys starting with the
+        `prefix`. A page has up to `limit` (at most SCAN_PAGE_SIZE) keys
+        and about SCAN_PAGE_BYTES bytes at most; if there are more keys
+        the reply has a `token`, to send with the same request for the
+        next page
+
+        :returns: the payload with the (key, value) `items`, the `token`
+                  (None after the last page) and the `commit_id`
+        :rtype: dict
+
+        :raises ValueError: if the token is not valid
+        '''
         namespace = payload.get('namespace', 'default')
+        start, end = payload.get('start'), payload.get('end')
+        prefix = payload.get('prefix')
+        if prefix is not None:
+            start = prefix if start is None else max(start, prefix)
+            end = self.__prefix_end(prefix) if end is None else end
+        if payload.get('token'):
+            # the smallest key after the last key of the previous page
+            start = self.__decode_token(payload['token']) + '\0'
+        limit = max(1, min(int(payload.get('limit') or cfg.SCAN_PAGE_SIZE), cfg.SCAN_PAGE_SIZE))
+        commit_id = self.commit_id
+        now = time.time()
+        scanned = self.db.scan(namespace, start=start, end=end, limit=limit + 1)
+        items, size, last = list(), 0, None
+        for key, value in scanned[:limit]:
+            if size >= cfg.SCAN_PAGE_BYTES:
+                break
+            last = key
+            if self.__expiry.expired(namespace, key, now):
+                continue
+            items.append([key, value])
+            size += len(key) + len(dumps(value))
+        more = last is not None and (len(scanned) > limit or last != scanned[-1][0])
+        payload.update({'items': items, 'commit_id': commit_id,
+                        'token': self.__encode_token(last) if more else None})
+        return payload
+
+    @staticmethod
+    def __prefix_end(prefix: str) -> str:
+        '''
+        :returns: the smallest key after all the keys starting with
+                  `prefix`, None if there is none
+        '''
+        prefix = prefix.rstrip(chr(0x10ffff))
+        if not prefix:
+            return None
+        return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+    @staticmethod
+    def __encode_token(key: str) -> str:
+        return urlsafe_b64encode(dumps([key]).encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def __decode_token(token: str) -> str:
+        try:
+            key, = loads(urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+        except (ValueError, TypeError, UnicodeError):
+            raise ValueError(f'bad token {token}')
+        if not isinstance(key, str):
+            raise ValueError(f'bad token {token}')
+        return key
+
+    def watch(self, payload: dict) -> Watch:
+        '''
+        watch the changes of the `key`, of the keys starting with the
+        `prefix` or, with neither, of all the keys of the `namespace`
+        (see `raftnode.watch`). With `since`, the changes committed after
+        that commit id are replayed first
+
+        :returns: the watch, to be removed with `unwatch`
+        :rtype: Watch
+
+        :raises ValueError: if the payload has both a key and a prefix
+        '''
+        key, prefix = payload.get('key'), payload.get('prefix')
+        if key is not None and prefix is not None:
+            raise ValueError('watch a key or a prefix, not both')
         with self.__lock:
-            self.staged = payload
-            waited = 0
-            log_message = {
-                'term': term,
-                'addr': transport.addr,
-                'payload': payload,
-                'action': 'log',
-                'commit_id': self.commit_id
-            }
-            log_confirmations = [False] * len(transport.peers)
-            Thread(target=self.send_data, args=(
-                log_message, transport, log_confirmations,)).start()
-
-            while sum(log_confirmations) + 1 < majority:
-                waited += 0.0005
-                time.sleep(0.0005)
-                if waited > cfg.MAX_LOG_WAIT / 1000:
-                    logger.info(
-                        f"waited {cfg.MAX_LOG_WAIT} ms, update rejected:")
-                    return False
+            start = self.commit_id
+            since = payload.get('since')
+            position = start if since is None else int(since)
+            watch = Watch(payload.get('namespace', 'default'), key=key, prefix=prefix,
+                          position=position, start=start, backlog=self.__backlog)
+            self.watchers.add(watch)
+        logger.debug(f'[WATCH] {payload} from commit id {position}')
+        return watch
+
+    def unwatch(self, watch: Watch):
+        self.watchers.remove(watch)
+        watch.close()
+
+    def __backlog(self, index: int, limit: int) -> list:
+        '''
+        :returns: the (commit id, operations) of up to `limit` committed
+                  entries from `index` on, None if they were dropped (or
+                  if one is a transaction older than the last
+                  LOG_CACHE_ENTRIES entries)
+        :rtype: list
+        '''
+        entries = self.entries_from(index, limit)
+        if not entries:
+            return None
+        backlog = list()
+        for commit_id, entry in enumerate(entries, index):
+            succeeded = None
+            if entry.get('type') == 'txn':
+                # the outcome of older transactions is not known any more
+                succeeded = self.__outcomes.get(commit_id)
+                if succeeded is None:
+                    return None
+            backlog.append((commit_id, self.__operations(entry, succeeded)))
+        return backlog
+
+    def wait_durable(self, durable) -> bool:
+        '''
+        wait until the group the committed entry was written with
+        is durable (see `raftnode.wal`)
 
-            commit_message = {
-                "term": term,
-                "addr": transport.addr,
-                "payload": payload,
-                "action": "commit",
-                "commit_id": self.commit_id
-            }
-            Thread(target=self.send_data,
-                args=(commit_message, transport,)).start()
-            self.commit(namespace, delete=True)
-        logger.info(
-            "majority reached, replied to client, sending message to commit")
+        :returns: False if the entry could not be written to the log
+        :rtype: bool
+        '''
+        if durable:
+            durable.wait()
+        if self.log.error:
+            logger.info(f'[WAL] entry not written: {self.log.error}')
+            return False
         return True
 
-    def commit(self, namespace: str, delete: bool=False, **kwargs):
+    def commit(self, entry: dict):
         '''
-        commit the message to the database after getting
+        commit the entry to the log and the database after getting
         atleast `majority + 1` confirmations from the 
         follower nodes
+
+        :param entry: a put, or a delete if it has the `delete` flag set
+        :type entry: dict
+
+        :returns: event that is set once the entry is durable in
+                  the log, see `wait_durable`
+        :rtype: Event
+        '''
+        entry, durable = self.__log_commit(entry)
+        self.__apply([entry])
+        self.__maybe_snapshot()
+        return durable
+
+    def __log_commit(self, entry: dict):
+        '''
+        give the entry the next commit id and append it to the log; it
+        is applied to the database by the caller
+
+        :returns: the entry with its commit id and the event of `commit`
+        :rtype: tuple
         '''
         self.commit_id += 1
-        cid = kwargs.get('commit_id', self.commit_id)
-        # with self.__lock:
-        self.staged.update({'commit_id': cid})
-        if self.staged not in self.log:
-            logger.debug(f'[APPEND LOG] {self.staged}')
-            # self.log.append(self.staged)
-            self.__flush()
-            self.__session()
-            self.log = self.f['data']
-        key = self.staged['key']
-        if delete:
-            value = self.db.delete(key=key, namespace=namespace)
-            self.staged = None
-            logger.debug(f"[DELETE COMMAND] {self.staged}")
-            return value
-        value = self.staged['value']
-        self.staged = None
-        self.db.put(key, value, namespace=namespace)
\ No newline at end of file
+        self.last_term = entry.get('term', self.last_term)
+        if self.entries.last_index < self.commit_id:
+            # committed directly, not through the log
+            self.entries.append(entry)
+        self.entries.trim(self.commit_id - cfg.LOG_CACHE_ENTRIES)
+        # a copy: the entry may still be being sent to the followers
+        entry = dict(entry, commit_id=self.commit_id)
+        durable = None
+        if self.commit_id > self.log.last_commit_id:
+            logger.debug(f'[APPEND LOG] {entry}')
+            durable = self.log.append(entry)
+        return entry, durable
+
+    def __apply(self, entries: list, recovered: dict = None) -> dict:
+        '''
+        apply committed entries to the database, as one batch
+        (see `IDatastore.write_batch`), keep track of the TTLs and
+        versions and hand the changes to the watches
+
+        :param recovered: what a durable database has of the entries, on
+                          start (see `__recover`); those are only tracked
+        :type recovered: dict
+
+        :returns: whether the transactions among the entries succeeded,
+                  by commit id
+        :rtype: dict
+        '''
+        operations, changes, outcomes, kept = list(), list(), dict(), list()
+        written_up_to = recovered['namespaces'] if recovered else dict()
+        # the transactions compare with the writes of the batch before them
+        written = dict() if any(entry.get('type') == 'txn' for entry in entries) else None
+        for entry in entries:
+            commit_id, succeeded = entry['commit_id'], None
+            if entry.get('type') == 'txn':
+                namespace = entry.get('namespace', 'default')
+                if recovered and commit_id in recovered['outcomes']:
+                    succeeded = recovered['outcomes'][commit_id]
+                else:
+                    try:
+                        succeeded = self.__compare(entry, written)
+                    except (KeyError, TypeError, AttributeError) as e:
+                        logger.error(f'[APPLY] skipping malformed entry {commit_id}: {e!r}')
+                    if isinstance(namespace, str):
+                        kept.append((namespace, commit_id, succeeded))
+                # None for a malformed transaction
+                if succeeded is None:
+                    outcomes[commit_id] = self.__outcomes[commit_id] = False
+                    continue
+                outcomes[commit_id] = self.__outcomes[commit_id] = succeeded
+            applied = self.__operations(entry, succeeded)
+            if entry.get('type') in ('expire', 'evict'):
+                applied = self.__unchanged(entry, applied)
+            for operation, namespace, key, value in applied:
+                if operation == 'put' and 'expires_at' in entry:
+                    self.__expiry.set(namespace, key, entry['expires_at'])
+                else:
+                    self.__expiry.discard(namespace, key)
+                if operation == 'put':
+                    self.__versions[namespace, key] = commit_id
+                else:
+                    self.__versions.pop((namespace, key), None)
+                if written is not None:
+                    written[namespace, key] = (value, commit_id) if operation == 'put' else (None, 0)
+            if applied:
+                operations.extend(op for op in applied if commit_id > written_up_to.get(op[1], 0))
+                changes.append((commit_id, applied))
+        if operations or kept:
+            self.db.write_batch(operations, commit_id=entries[-1]['commit_id'], outcomes=kept)
+        while len(self.__outcomes) > cfg.LOG_CACHE_ENTRIES:
+            self.__outcomes.popitem(last=False)
+        for commit_id, applied in changes:
+            self.watchers.publish(commit_id, applied)
+        return outcomes
+
+    def __unchanged(self, entry: dict, operations: list) -> list:
+        '''
+        :returns: the deletes of an 'expire' or 'evict' entry whose keys
+                  still have the version the leader saw when it picked
+                  them; a key put again since then is kept
+        :rtype: list
+        '''
+        if not operations:
+            return operations
+        # the entries of older nodes have no versions
+        versions = [key[2] if len(key) > 2 else None for key in entry['keys']]
+        return [op for op, version in zip(operations, versions)
+                if version is None or self.__versions.get((op[1], op[2]), 0) == version]
+
+    def __compare(self, entry: dict, written: dict) -> bool:
+        '''
+        evaluate the comparisons of a transaction against the database,
+        as of the time the leader took it in (`now`), so every node comes
+        to the same outcome; a key that expired by then does not exist
+
+        :returns: True if all the comparisons hold
+        :rtype: bool
+        '''
+        namespace = entry.get('namespace', 'default')
+        for compare in entry['compare']:
+            key = compare['key']
+            if (namespace, key) in written:
+                value, version = written[namespace, key]
+            elif self.__expiry.expired(namespace, key, entry['now']):
+                value, version = None, 0
+            else:
+                value = self.db.get(key=key, namespace=namespace)
+                version = self.__versions.get((namespace, key), 0)
+            if 'version' in compare:
+                if version != compare['version']:
+                    return False
+            elif value != compare.get('value'):
+                return False
+        return True
+
+    @staticmethod
+    def __operations(entry: dict, succeeded: bool = None) -> list:
+        '''
+        :param succeeded: for a transaction, whether its comparisons held
+        :type succeeded: bool
+
+        :returns: the ('put' | 'delete', namespace, key, value) operations
+                  of a committed entry. A malformed entry has none: it is
+                  skipped on every node instead of stopping the apply, and
+                  the replay of the log
+        :rtype: list
+        '''
+        try:
+            operations = Store.__read_operations(entry, succeeded)
+            for _, namespace, key, _ in operations:
+                if not isinstance(namespace, str) or not isinstance(key, str):
+                    raise ValueError(f'key {key!r} of namespace {namespace!r}')
+        except (KeyError, TypeError, AttributeError, ValueError) as e:
+            logger.error(f'[APPLY] skipping malformed entry {entry.get("commit_id")}: {e!r}')
+            return []
+        return operations
+
+    @staticmethod
+    def __read_operations(entry: dict, succeeded: bool) -> list:
+        kind = entry.get('type')
+        if kind == 'noop':
+            return []
+        if kind in ('expire', 'evict'):
+            return [('delete', namespace, key, None) for namespace, key, *_ in entry['keys']]
+        namespace = entry.get('namespace', 'default')
+        if kind == 'mdelete':
+            return [('delete', namespace, key, None) for key in entry['keys']]
+        if kind == 'mput':
+            return [('put', namespace, key, value) for key, value in entry['items'].items()]
+        if kind == 'txn':
+            return [('delete', namespace, op['key'], None) if op.get('delete', False)
+                    else ('put', namespace, op['key'], op['value'])
+                    for op in entry['success' if succeeded else 'failure']]
+        if entry.get('delete', False):
+            logger.debug(f"[DELETE COMMAND] {entry}")
+            return [('delete', namespace, entry['key'], None)]
+        return [('put', namespace, entry['key'], entry['value'])]
+
+    def __maybe_snapshot(self):
+        '''
+        start a snapshot in the background once enough entries, or
+        bytes of log, were committed since the last one. Only capturing
+        the state of the database happens on the write path
+        '''
+        if self.__snapshotter and self.__snapshotter.is_alive():
+            return
+        entries = self.commit_id - self.snapshot_id
+        size = self.log.appended_bytes - self.__snapshot_bytes
+        if not ((cfg.SNAPSHOT_ENTRIES and entries >= cfg.SNAPSHOT_ENTRIES)
+                or (cfg.SNAPSHOT_BYTES and size >= cfg.SNAPSHOT_BYTES)):
+            return
+        self.__snapshot_bytes = self.log.appended_bytes
+        self.__snapshotter = Thread(
+            target=self.__write_snapshot,
+            args=(self.commit_id, self.last_term, self.__snapshot_items()), daemon=True)
+        self.__snapshotter.start()
+
+    def __snapshot_items(self):
+        '''
+        the items of the database, the expiration times and the
+        versions, as of now
+        '''
+        times = ((EXPIRY_NAMESPACE, list(k), t) for k, t in self.__expiry.items())
+        versions = ((VERSION_NAMESPACE, list(k), v) for k, v in list(self.__versions.items()))
+        return chain(self.db.snapshot(), times, versions)
+
+    def __write_snapshot(self, commit_id: int, term: int, items):
+        try:
+            # a restart keeps the database and replays the log from the
+            # snapshot: the database must not lose what the entries
+            # before it wrote
+            self.db.sync()
+            self.snapshots.write(commit_id, term, items)
+        except OSError:
+            logger.exception(f'[SNAPSHOT] failed to write the snapshot at commit id {commit_id}')
+            return
+        with self.__lock:
+            if commit_id <= self.snapshot_id:
+                return
+            self.snapshot_id, self.snapshot_term = commit_id, term
+        self.log.compact(commit_id)
+        self.db.compact(commit_id)
+
+
+class Proposal:
+
+    '''
+    an entry proposed by a client, waiting to be committed; `accepted`
+    is None until the entry is committed or dropped. The proposer sleeps
+    on `wakeup` until then
+    '''
+
+    def __init__(self, entry: dict):
+        self.entry = entry
+        self.accepted = None
+        self.durable = None
+        # set once committed; `succeeded` only for transactions
+        self.commit_id = None
+        self.succeeded = None
+        self.wakeup = Event()
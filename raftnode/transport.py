@@ -1,10 +1,196 @@
+import codecs
+import re
+import selectors
 import socket
 import time
-from queue import Queue
+from queue import Full, Queue
 from json import JSONDecodeError, dumps, loads
 from threading import Lock, Thread
 
 from raftnode import cfg, logger
+from raftnode.codec import choose_codec
+from raftnode.pool import ConnectionPool
+from raftnode.protocol import (MAGIC, FrameBuffer, decode_payload,
+                               encode_payload, send_frame)
+
+
+# the characters that matter to find the end of a JSON object, outside
+# and inside of its strings
+_STRUCTURE = re.compile(r'[{}"]')
+_STRING = re.compile(r'["\\]')
+_NON_SPACE = re.compile(r'\S')
+
+
+class MessageBuffer:
+
+    '''
+    Buffers the bytes received on a connection, so that messages split
+    across several reads (or several messages in one read) are handled
+    correctly
+
+    The received text is scanned once, for the braces outside of strings,
+    and a message is decoded once its closing brace is in; the state of
+    the scan is kept between reads, so a message split over many reads
+    costs time linear in its size
+    '''
+
+    def __init__(self):
+        self.__chunks = list()
+        self.__size = 0
+        self.__depth = 0
+        self.__in_string = False
+        self.__escaped = False
+        self.__utf8 = codecs.getincrementaldecoder('utf-8')()
+
+    def feed(self, data: bytes) -> list:
+        '''
+        add the received bytes to the buffer and return the complete
+        messages. None is returned if the data is not a JSON object
+        '''
+        text = self.__utf8.decode(data)
+        messages, pos = list(), 0
+        while pos < len(text):
+            if not self.__chunks:
+                match = _NON_SPACE.search(text, pos)
+                if match is None:
+                    break
+                if match.group() != '{':
+                    return None
+                pos = match.start()
+            end = self.__scan(text, pos)
+            self.__chunks.append(text[pos:end])
+            self.__size += len(self.__chunks[-1])
+            if self.__size > cfg.MAX_MESSAGE_SIZE:
+                return None
+            if end is None:
+                break
+            raw = ''.join(self.__chunks)
+            self.__chunks, self.__size = list(), 0
+            try:
+                messages.append(loads(raw))
+            except JSONDecodeError:
+                return None
+            pos = end
+        return messages
+
+    def __scan(self, text: str, pos: int) -> int:
+        '''
+        :returns: the index in `text` right after the closing brace of
+                  the message being received, None if it is not in yet
+        :rtype: int
+        '''
+        if self.__escaped:
+            self.__escaped = False
+            pos += 1
+        while True:
+            if self.__in_string:
+                match = _STRING.search(text, pos)
+                if match is None:
+                    return None
+                if match.group() == '\\':
+                    if match.end() == len(text):
+                        self.__escaped = True
+                        return None
+                    pos = match.end() + 1
+                    continue
+                self.__in_string = False
+            else:
+                match = _STRUCTURE.search(text, pos)
+                if match is None:
+                    return None
+                if match.group() == '"':
+                    self.__in_string = True
+                elif match.group() == '{':
+                    self.__depth += 1
+                else:
+                    self.__depth -= 1
+                    if self.__depth == 0:
+                        return match.end()
+            pos = match.end()
+
+
+class Connection(MessageBuffer):
+
+    '''
+    A client or peer connection accepted by the server. Peers talk the
+    framed protocol (see `raftnode.protocol`), hand-written clients send
+    plain JSON; which one it is, is decided by the first byte received
+
+    :param sock: accepted socket
+    :type sock: socket.socket
+    '''
+
+    def __init__(self, sock: socket.socket):
+        super().__init__()
+        self.sock = sock
+        self.closed = False
+        self.framed = None
+        self.frames = FrameBuffer()
+        self.__lock = Lock()
+
+    def read(self) -> list:
+        '''
+        read whatever is available on the connection and return the complete
+        messages received so far, as (request, message) pairs. The request is
+        the (request id, codec) pair of a frame, or None for plain JSON messages
+
+        :returns: the messages, None if the other end closed the connection
+        :rtype: list
+
+        :raises ValueError: if the data is neither a frame nor a JSON object
+        '''
+        if not self.frames.recv_into(self.sock):
+            return None
+        if self.framed is None:
+            self.framed = bytes(self.frames.peek(1)) == MAGIC[:1]
+        if not self.framed:
+            messages = self.feed(self.frames.take())
+            if messages is None:
+                raise ValueError('not a JSON object')
+            return [(None, msg) for msg in messages]
+        messages = list()
+        frame = self.frames.next_frame()
+        while frame:
+            codec, request_id, payload = frame
+            msg = decode_payload(payload, codec)
+            if not isinstance(msg, dict):
+                raise ValueError('not a JSON object')
+            messages.append(((request_id, codec), msg))
+            frame = self.frames.next_frame()
+        return messages
+
+    def reply(self, request: tuple, msg: dict) -> bool:
+        '''
+        send the reply to the `request`, in the format and
+        with the codec the request came in
+        '''
+        if request is None:
+            return self.send(bytes(dumps(msg), encoding='utf-8'))
+        request_id, codec = request
+        payload = encode_payload(msg, codec)
+        with self.__lock:
+            if self.closed:
+                return False
+            try:
+                send_frame(self.sock, request_id, payload, codec)
+                return True
+            except OSError:
+                return False
+
+    def send(self, data: bytes) -> bool:
+        with self.__lock:
+            if self.closed:
+                return False
+            try:
+                self.sock.sendall(data)
+                return True
+            except OSError:
+                return False
+
+    def close(self):
+        with self.__lock:
+            self.closed = True
+            self.sock.close()
 
 
 class Transport:
@@ -14,12 +200,30 @@ class Transport:
         self.port = int(self.port)
         self.addr = my_ip
         self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.server.bind((self.host, self.port))
         self.server.listen()
         self.peers = list()
         self.lock = Lock()
         self.q = queue
-        Thread(target=self.ping, args=(timeout,)).start()
+        self.pool = ConnectionPool()
+        self.__peer_jobs = Queue()
+        self.__client_jobs = Queue(maxsize=cfg.CLIENT_BACKLOG)
+        self.__closing = Queue()
+        self.__wakeup = socket.socketpair()
+        self.start_ping(timeout)
+
+    def start_ping(self, timeout: float):
+        '''
+        start pinging the peers every `timeout` seconds
+        '''
+        Thread(target=self.ping, args=(timeout,), daemon=True).start()
+
+    def submit(self, fn, *args):
+        '''
+        run `fn(*args)` in the background
+        '''
+        Thread(target=fn, args=args, daemon=True).start()
 
     def serve(self):
         '''
@@ -27,8 +231,10 @@ class Transport:
         :type election: Election
 
         This function starts a socket server and listen endlessly to
-        the clients. It also checks the message types and delegates the 
-        message handling responsibility accordingly.
+        the clients. All the connections are multiplexed on one selector;
+        the messages read from them are handed over to the worker threads
+        (see `start_workers`), which delegate the message handling
+        responsibility according to the message type.
 
         Message types supported are:
 
@@ -58,81 +264,225 @@ class Transport:
             to the client
         * get: 
             message with type get is received from the client connected
-            to this cluster. If this node is the leader, it will retrieve
-            the data from the database and give it back to the client. If
-            it's not the leader, it will redirect the request to the leader node
-            and send the leader's response back to the client
+            to this cluster. Any node retrieves the data from its own
+            database and gives it back to the client; for a linearizable
+            get a follower first waits until it has applied up to the read
+            index of the leader (see `raftnode.reads`). With FOLLOWER_READS
+            off, linearizable gets are redirected to the leader
+        * read_index:
+            a follower asks the leader for its read index, to serve a
+            linearizable read; it is handled by the peer workers, so it
+            does not wait behind the client writes
+        * watch:
+            message with type watch is received from a client that wants
+            the changes of a key, a prefix or a namespace. Any node serves
+            it; the changes are pushed on the connection as they are
+            committed, until the client goes away (see `watch_replies`)
         * data: 
             this type of message is sent by the leader to the follower
             nodes along with the heartbeat. It contains the current term
             and the latest commit_id
         '''
         self.election = self.q.get()['election']
+        self.start_workers()
+        self.selector = selectors.DefaultSelector()
+        self.server.setblocking(False)
+        self.selector.register(self.server, selectors.EVENT_READ)
+        self.selector.register(self.__wakeup[0], selectors.EVENT_READ)
         while True:
-            if not self.q.empty():
-                election = self.q.get()
-                if bool(election):
-                    self.election = election
-            if isinstance(self.election, dict):
-                self.election = self.election['election']
-            logger.debug(
-                f'current membership status of this node: {self.election.status}')
-            client, address = self.server.accept()
-            try:
-                msg = client.recv(1024).decode('utf-8')
-            except ConnectionResetError as e:
-                continue
-            msg = self.decode_json(msg)
-            if isinstance(msg, dict):
-                msg_type = msg['type']
-                if msg_type == 'add_peer':
-                    all_peers = self.peers.copy()
-                    msg.update({'sender': self.addr})
-                    self.add_peer(msg)
-                    client.send(self.encode_json(
-                        {'type': 'add_peer', 'payload': all_peers}))
-                elif msg_type == 'heartbeat':
-                    term, commit_id = self.election.heartbeat_handler(
-                        message=msg)
-                    client.send(self.encode_json(
-                        {'type': 'heartbeat', 'term': term, 'commit_id': commit_id}))
-                elif msg_type == 'vote_request':
-                    choice, term = self.election.decide_vote(
-                        msg['term'], msg['commit_id'], msg['staged'])
-                    client.send(self.encode_json(
-                        {'type': 'vote_request', 'term': term, 'choice': choice}))
-                elif msg_type == 'ping':
-                    msg.update({'is_alive': True, 'addr': self.addr})
-                    client.send(self.encode_json(msg))
-                elif msg_type == 'peers':
-                    if self.election.status == cfg.LEADER:
-                        peers_response = {'type': 'peers'}
-                        peers_response.update({'peers': self.peers})
-                        client.send(self.encode_json(peers_response))
-                    else:
-                        reply = self.redirect_to_leader(self.encode_json(msg))
-                        client.send(bytes(reply, encoding='utf-8'))
+            self.refresh_election()
+            peer_jobs, client_jobs = list(), list()
+            for key, _ in self.selector.select():
+                if key.fileobj is self.server:
+                    self.__accept()
+                elif key.fileobj is self.__wakeup[0]:
+                    self.__close_pending()
                 else:
-                    reply = self.__resolve_msg(msg)
-                    if reply:
-                        client.send(self.encode_json(reply))
-            else:
-                send_msg = 'hey there; from {}'.format(self.addr)
-                client.send(bytes(self.addr, encoding='utf-8'))
-            client.close()
+                    for request, msg in self.__read(key.data):
+                        if msg.get('type') in cfg.PEER_MESSAGES:
+                            peer_jobs.append((key.data, request, msg))
+                        else:
+                            client_jobs.append((key.data, request, msg))
+            # peer traffic of this round is queued before any client traffic
+            for job in peer_jobs:
+                self.__peer_jobs.put(job)
+            for conn, request, msg in client_jobs:
+                try:
+                    self.__client_jobs.put_nowait((conn, request, msg))
+                except Full:
+                    logger.info(f'[SERVER BUSY] rejecting {msg.get("type")} request')
+                    conn.reply(request, {'type': msg.get('type'), 'data': 'server busy'})
+
+    def refresh_election(self):
+        '''
+        pick up the election instance published on the queue
+        '''
+        if not self.q.empty():
+            election = self.q.get()
+            if bool(election):
+                self.election = election
+        if isinstance(self.election, dict):
+            self.election = self.election['election']
+        logger.debug(
+            f'current membership status of this node: {self.election.status}')
+
+    def start_workers(self):
+        '''
+        start the worker threads that handle the messages read by `serve`.
+        Peer messages (heartbeats, votes, pings, ...) have their own workers,
+        so they are never queued behind slow client writes waiting for a quorum
+        '''
+        for _ in range(cfg.PEER_WORKERS):
+            Thread(target=self.__work, args=(self.__peer_jobs,), daemon=True).start()
+        for _ in range(cfg.CLIENT_WORKERS):
+            Thread(target=self.__work, args=(self.__client_jobs,), daemon=True).start()
+
+    def __work(self, jobs: Queue):
+        while True:
+            conn, request, msg = jobs.get()
+            if msg.get('type') == 'watch':
+                # a watch keeps a thread of its own for as long as it streams
+                self.submit(self.__stream, conn, request, msg)
+                continue
+            try:
+                reply = self.handle_message(msg)
+            except Exception as e:
+                logger.exception(f'failed to handle message {msg}')
+                reply = None
+            if reply is None or not conn.reply(request, reply):
+                self.__close_later(conn)
+
+    def __stream(self, conn, request: tuple, msg: dict):
+        replies = self.watch_replies(msg)
+        for reply in replies:
+            if not conn.reply(request, reply):
+                break
+        replies.close()
+
+    def watch_replies(self, msg: dict):
+        '''
+        the replies of a watch (see `raftnode.watch`), sent on the
+        connection of the watch until it ends or the connection is lost.
+        Every reply has the changes taken out of the watch since the last
+        one; an empty one is sent every WATCH_KEEPALIVE ms, to find out
+        if the client is still there
+
+        :param msg: the watch message
+        :type msg: dict
+
+        :returns: generator of the replies
+        :rtype: generator
+        '''
+        watch = self.election.handle_watch(msg)
+        if isinstance(watch, str):
+            yield {'type': 'watch', 'data': watch}
+            return
+        try:
+            while True:
+                data = watch.take()
+                yield {'type': 'watch', 'data': data}
+                if 'error' in data:
+                    return
+                watch.wait(cfg.WATCH_KEEPALIVE / 1000)
+        finally:
+            self.election.store.unwatch(watch)
+
+    def __accept(self):
+        while True:
+            try:
+                client, address = self.server.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            client.setblocking(True)
+            conn = Connection(client)
+            self.selector.register(client, selectors.EVENT_READ, conn)
+
+    def __read(self, conn) -> list:
+        '''
+        read whatever is available on the connection and return the
+        complete messages received so far
+        '''
+        try:
+            messages = conn.read()
+        except OSError:
+            messages = None
+        except ValueError as e:
+            conn.send(bytes(self.addr, encoding='utf-8'))
+            messages = None
+        if messages is None:
+            self.__close(conn)
+            return []
+        return messages
+
+    def __close_later(self, conn):
+        self.__closing.put(conn)
+        self.__wakeup[1].send(b'\0')
+
+    def __close_pending(self):
+        self.__wakeup[0].recv(4096)
+        while not self.__closing.empty():
+            self.__close(self.__closing.get())
+
+    def __close(self, conn):
+        try:
+            self.selector.unregister(conn.sock)
+        except (KeyError, ValueError):
+            pass
+        conn.close()
+
+    def handle_message(self, msg: dict) -> dict:
+        '''
+        handle one message and return the reply. None means that
+        there is nothing to reply and the connection should be closed
+
+        :param msg: decoded message
+        :type msg: dict
+
+        :returns: reply to be sent back on the connection
+        :rtype: dict
+        '''
+        msg_type = msg['type']
+        if msg_type == 'add_peer':
+            all_peers = self.peers.copy()
+            msg.update({'sender': self.addr})
+            self.add_peer(msg)
+            return {'type': 'add_peer', 'payload': all_peers}
+        elif msg_type == 'heartbeat':
+            term, commit_id, last_index, result = self.election.heartbeat_handler(message=msg)
+            return dict({'type': 'heartbeat', 'term': term, 'commit_id': commit_id,
+                         'last_index': last_index}, **(result or {}))
+        elif msg_type == 'vote_request':
+            choice, term = self.election.decide_vote(
+                msg['term'], msg.get('last_term', 0), msg.get('last_index', 0))
+            return {'type': 'vote_request', 'term': term, 'choice': choice}
+        elif msg_type == 'ping':
+            msg.update({'is_alive': True, 'addr': self.addr})
+            return msg
+        elif msg_type == 'hello':
+            return {'type': 'hello', 'codec': choose_codec(msg.get('codecs', []))}
+        elif msg_type == 'read_index':
+            return {'type': 'read_index', 'read_index': self.election.leader_read_index()}
+        elif msg_type == 'peers':
+            if self.election.status == cfg.LEADER:
+                peers_response = {'type': 'peers'}
+                peers_response.update({'peers': self.peers})
+                return peers_response
+            return self.redirect_to_leader(msg)
+        return self.__resolve_msg(msg)
 
     def __resolve_msg(self, msg: dict):
         try:
             msg_type = msg['type']
-            if self.election.status == cfg.LEADER:
+            local = msg_type in ('get', 'mget', 'scan', 'prefix') and (
+                cfg.FOLLOWER_READS or msg.get('consistency', 'linearizable') != 'linearizable')
+            if self.election.status == cfg.LEADER or local:
                 client_response = {'type': msg_type}
                 handler = getattr(self.election, f'handle_{msg_type}')
                 reply = handler(msg)
                 client_response.update({'data': reply})
                 return client_response
             else:
-                reply = self.redirect_to_leader(self.encode_json(msg))
-                return self.decode_json(reply)
+                return self.redirect_to_leader(msg)
         except Exception as e:
             raise e
 
@@ -148,29 +498,18 @@ class Transport:
         try:
             logger.info(
                 f'[LEADER REDIRECT] redirecting to leader at address {self.election.leader}')
-            leader_host, leader_port = (self.election.leader).split(':')
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            s.connect((leader_host, int(leader_port)))
-            s.send(message)
-            leader_reply = s.recv(1024).decode('utf-8')
+            leader_reply = self.request(self.election.leader, message)
+            if leader_reply is None:
+                return {'data': 'leader unavailable'}
             return leader_reply
-        except ConnectionRefusedError as e:
-            return {'data': 'leader unavailable'}
         except AttributeError as e:
             if "object has no attribute" in e.args[0]:
                 time.sleep(1)
-        except ConnectionResetError as e:
-            return {'data': 'connection reset by peer'}
 
     def __proxy_client(self, addr: str, message=None):
         if not message:
             message = {'type': 'echo', 'payload': 'whatsup?'}
-        client = self.reconnect(addr)
-        if not client:
-            return
-        client.send(self.encode_json(message))
-        msg = client.recv(1024).decode('utf-8')
-        client.close()
+        self.request(addr, message)
         return
 
     def req_add_peer(self, addr: str):
@@ -181,22 +520,17 @@ class Transport:
         :param addr: address of this node in the format ip:port
         :type addr: str
         '''
-        client = self.reconnect(addr)
-        if not client:
+        reply = self.request(addr, {'type': 'add_peer', 'payload': self.addr})
+        if not reply:
             logger.info(f'Could not connect to peer {addr}')
             return
-        message = self.encode_json({'type': 'add_peer', 'payload': self.addr})
-        client.send(message)
-        msg = client.recv(1024).decode('utf-8')
-        reply = self.decode_json(msg)
-        all_peers = reply['payload']
+        all_peers = reply['payload'] or []
         with self.lock:
-            self.peers.append(addr)
-        if all_peers:
-            with self.lock:
-                for peer in all_peers:
+            # the peer may know this node already; a node must never be its
+            # own peer, it would step down on its own heartbeats
+            for peer in [addr] + all_peers:
+                if peer != self.addr and peer not in self.peers:
                     self.peers.append(peer)
-        self.peers = list(set(self.peers))
 
     def add_peer(self, message: dict):
         '''
@@ -218,42 +552,75 @@ class Transport:
 
     def reconnect(self, addr: str):
         '''
-        This function tries to connect this node to the peer at address addr
-        20 times. If the peer is not connected in 20 tries, it returns False
+        This function gets a channel to the peer at address addr from the
+        connection pool. If the peer refuses the connection or times out, it
+        is removed from the list of peers and None is returned
 
         :param addr: address of the other peer 
         :type addr: str
         '''
-        i = 0
-        # while i < 20:
         try:
-            host, port = addr.split(':')
-            client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            client.connect((host, int(port)))
-            return client
+            return self.pool.acquire(addr)
         except ConnectionRefusedError:
-            client.close()
-            time.sleep(0.002)
             if addr in self.peers:
                 with self.lock:
                     self.peers.remove(addr)
-            del client
-        except TimeoutError as e:
+        except (TimeoutError, socket.timeout) as e:
             logger.info(f'Timeout error connecting to peer {addr}')
             logger.info(f'Removing peer {addr} from list of peers')
             if addr in self.peers:
                 with self.lock:
                     self.peers.remove(addr)
-            client.close()
-        except Exception as e:
-            client.close()
-            raise e
-        # finally:
-        #     i += 1
-    # else:
-    #     with self.lock:
-    #             self.peers.remove(addr)
-    #     return False
+
+    def request(self, peer: str, message: dict) -> dict:
+        '''
+        send the message to the peer over a pooled channel and return it's
+        reply. A channel the peer has closed in the meantime fails with a
+        connection error; in that case the request is retried once on a
+        fresh channel
+
+        :param peer: address of the peer in `ip:port` format
+        :type peer: str
+
+        :param message: message to be sent
+        :type message: dict
+
+        :returns: reply of the peer, None if the peer could not be reached
+        :rtype: dict
+        '''
+        for attempt in range(2):
+            channel = self.reconnect(peer)
+            if not channel:
+                return None
+            try:
+                return channel.request(message, self.pool.timeout)
+            except socket.timeout as e:
+                logger.info(f'[POOL] timeout waiting for peer {peer}')
+                return None
+            except OSError as e:
+                logger.debug(f'[POOL] lost connection to peer {peer}: {e}')
+                self.pool.discard(peer, channel)
+        return None
+
+    def send_request(self, peer: str, message: dict):
+        '''
+        send the message to the peer without waiting for it's reply, so
+        that many requests to the peer can be in flight at once
+
+        :returns: future of the reply, None if the peer could not be reached.
+                  The future fails with a connection error if the channel is
+                  lost before the reply arrives
+        :rtype: Future
+        '''
+        channel = self.reconnect(peer)
+        if not channel:
+            return None
+        try:
+            return channel.submit(message)
+        except OSError as e:
+            logger.debug(f'[POOL] lost connection to peer {peer}: {e}')
+            self.pool.discard(peer, channel)
+        return None
 
     def ping(self, timeout: float):
         '''
@@ -267,7 +634,7 @@ class Transport:
             if self.peers:
                 logger.debug(f'peers >>> {self.peers}')
                 for peer in self.peers:
-                    Thread(target=self.echo, args=(peer,)).start()
+                    self.submit(self.echo, peer)
             else:
                 logger.debug('ping  >>> no peers to ping')
             time.sleep(timeout)
@@ -279,22 +646,12 @@ class Transport:
 
         :param peer: address of the peer in `ip:port` format
         '''
-        try:
-            client = self.reconnect(peer)
-            if not client:
-                return
-            echo_msg = self.encode_json({'type': 'ping'})
-            client.send(echo_msg)
-            echo_reply = self.decode_json(client.recv(1024).decode('utf-8'))
-            client.close()
-            if echo_reply:
-                logger.debug('ping  >>> {}'.format(echo_reply))
-                if echo_reply['is_alive']:
-                    return True
-            return False
-        except ConnectionResetError as e:
-            logger.info(f'[ECHO]lost connection to peer {peer}')
-            return None
+        echo_reply = self.request(peer, {'type': 'ping'})
+        if echo_reply:
+            logger.debug('ping  >>> {}'.format(echo_reply))
+            if echo_reply['is_alive']:
+                return True
+        return False
 
     def heartbeat(self, peer: str, message: dict = None) -> dict:
         '''
@@ -311,21 +668,8 @@ class Transport:
         :returns: heartbeat message response as received from the follower
         :rtype: dict
         '''
-        try:
-            client = self.reconnect(peer)
-            if not client:
-                return
-            message.update({'type': 'heartbeat'})
-            heartbeat_message = self.encode_json(message)
-            client.send(heartbeat_message)
-            heartbeat_reply = client.recv(1024).decode('utf-8')
-            if bool(heartbeat_reply):
-                heartbeat_reply = self.decode_json(heartbeat_reply)
-            client.close()
-            return heartbeat_reply
-        except ConnectionResetError as e:
-            logger.info(f'[HEARTBEAT]lost connection to peer {peer}')
-            return None
+        message.update({'type': 'heartbeat'})
+        return self.request(peer, message)
 
     def vote_request(self, peer: str, message: dict = None):
         '''
@@ -342,44 +686,8 @@ class Transport:
         :returns: vote response as received from the voter node
         :rtype: dict
         '''
-        try:
-            client = self.reconnect(peer)
-            if not client:
-                return
-            message.update({'type': 'vote_request'})
-            vote_request_message = self.encode_json(message)
-            client.send(vote_request_message)
-            vote_reply = self.decode_json(client.recv(1024).decode('utf-8'))
-            client.close()
-            return vote_reply
-        except ConnectionResetError as e:
-            logger.info(f'[VOTE REQUEST]lost connection to peer {peer}')
-            return None
-
-    def send_data(self, peer=None, message: dict = None):
-        '''
-        sends heartbeat data to the peer and returns response to
-        this node
-
-        :param peer: address of the peer in `ip:port` format
-        :type peer: str
-
-        :param message: heartbeat data message; it contains term
-                        and latest commit_id
-        :type message: dict
-
-        :returns: vote response as received from the voter node
-        :rtype: dict
-        '''
-        client = self.reconnect(peer)
-        if not client:
-            return
-        message.update({'type': 'data'})
-        data_message = self.encode_json(message)
-        client.send(data_message)
-        data_reply = self.decode_json(client.recv(1024).decode('utf-8'))
-        client.close()
-        return data_reply
+        message.update({'type': 'vote_request'})
+        return self.request(peer, message)
 
     def encode_json(self, msg: dict) -> bytes:
         '''
@@ -0,0 +1,417 @@
+'''
+Segmented, append-only write-ahead log of the committed entries.
+
+The log is a directory of segment files, named after the commit id of their
+first entry. Every entry is written as one record::
+
+    +--------+-------+-----------+---------------------+
+    | length | crc32 | commit id | entry (JSON)        |
+    | 4 B    | 4 B   | 8 B       | `length` bytes      |
+    +--------+-------+-----------+---------------------+
+
+The crc covers the commit id and the entry. Appending an entry writes one
+record at the end of the last segment, so it costs the same however long
+the log is; when the segment grows past WAL_SEGMENT_SIZE a new one is
+started. The offset of every record is kept in memory, per segment, so an
+entry is read back with a single positioned read.
+
+Appended entries are written by a writer thread in groups: everything
+appended while the previous group was being written (or within
+WAL_BATCH_WAIT ms, up to WAL_BATCH_SIZE entries) goes to disk with one
+write and at most one fsync. When the fsync happens depends on WAL_FSYNC:
+
+* ``batch``: after every group, before the appenders are told the entries
+  are durable
+* ``interval``: at most every WAL_FSYNC_INTERVAL ms; entries written since
+  the last fsync are lost if the machine crashes
+* ``never``: left to the operating system
+
+When the log is opened the segments are scanned and the index rebuilt. A
+torn record at the end of the last segment (a crash in the middle of an
+append) is cut off; a bad record anywhere else is an error.
+
+Once a snapshot covers the start of the log, `compact` removes the segments
+that hold only entries covered by it. The log then starts at a later commit
+id; the segment being written to is never removed.
+'''
+import os
+import time
+from array import array
+from bisect import bisect_right
+from collections import deque
+from json import dumps, loads
+from struct import Struct
+from threading import Condition, Event, Thread
+from zlib import crc32
+
+from raftnode import cfg, logger
+
+RECORD = Struct('!IIQ')
+COMMIT_ID = Struct('!Q')
+SUFFIX = '.wal'
+FSYNC_POLICIES = ('batch', 'interval', 'never')
+fsync = getattr(os, 'fdatasync', os.fsync)
+
+
+class Segment:
+
+    '''
+    one file of the log, holding the entries from commit id `first` on
+
+    :param path: path of the segment file
+    :type path: str
+
+    :param first: commit id of the first entry of the segment
+    :type first: int
+    '''
+
+    def __init__(self, path: str, first: int):
+        self.path = path
+        self.first = first
+        self.offsets = array('Q')
+        self.size = 0
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    @property
+    def last(self) -> int:
+        return self.first + len(self.offsets) - 1
+
+    def load(self, tail: bool) -> bool:
+        '''
+        rebuild the offsets of the segment from the file
+
+        :param tail: True for the last segment, which may end with a torn record
+        :type tail: bool
+
+        :returns: False if the segment is empty
+        :rtype: bool
+        '''
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        offset, expected = 0, self.first
+        while offset < len(data):
+            record = self.read_record(data, offset, expected)
+            if record is None:
+                if not tail:
+                    raise ValueError(f'corrupt record at offset {offset} of {self.path}')
+                logger.info(f'[WAL] truncating torn record at offset {offset} of {self.path}')
+                os.ftruncate(self.fd, offset)
+                break
+            self.offsets.append(offset)
+            offset += RECORD.size + record
+            expected += 1
+        self.size = offset
+        return bool(self.offsets)
+
+    @staticmethod
+    def read_record(data: bytes, offset: int, commit_id: int) -> int:
+        '''
+        :returns: length of the entry of the record at `offset`, or None if
+                  the record is incomplete or does not check out
+        :rtype: int
+        '''
+        if offset + RECORD.size > len(data):
+            return None
+        length, crc, cid = RECORD.unpack_from(data, offset)
+        start = offset + RECORD.size
+        if cid != commit_id or start + length > len(data):
+            return None
+        if crc32(data[start:start + length], crc32(COMMIT_ID.pack(cid))) != crc:
+            return None
+        return length
+
+    def write(self, records: list):
+        '''
+        write the (commit id, entry) records at the end of the segment
+        with one system call
+        '''
+        chunks, offsets, offset = list(), list(), self.size
+        for commit_id, entry in records:
+            crc = crc32(entry, crc32(COMMIT_ID.pack(commit_id)))
+            chunks += [RECORD.pack(len(entry), crc, commit_id), entry]
+            offsets.append(offset)
+            offset += RECORD.size + len(entry)
+        os.pwrite(self.fd, b''.join(chunks), self.size)
+        self.offsets.extend(offsets)
+        self.size = offset
+
+    def sync(self):
+        fsync(self.fd)
+
+    def get(self, commit_id: int) -> dict:
+        offset = self.offsets[commit_id - self.first]
+        length, _, _ = RECORD.unpack(os.pread(self.fd, RECORD.size, offset))
+        return loads(os.pread(self.fd, length, offset + RECORD.size))
+
+    def close(self):
+        os.close(self.fd)
+
+
+class WriteAheadLog:
+
+    '''
+    Segmented append-only log of the committed entries of a node, see
+    the module documentation for the file format and the fsync policies.
+    The entries are dictionaries with consecutive `commit_id`s, starting at 1
+
+    :param directory: directory the segment files are kept in
+    :type directory: str
+
+    :param segment_size: size in bytes after which a new segment is started
+    :type segment_size: int
+
+    :param fsync: fsync policy; batch, interval or never
+    :type fsync: str
+
+    :param batch_size: maximum number of entries written at once
+    :type batch_size: int
+
+    :param batch_wait: how long (in ms) to wait for more entries before
+                       writing a group
+    :type batch_wait: float
+    '''
+
+    def __init__(self, directory: str, segment_size: int = cfg.WAL_SEGMENT_SIZE,
+                 fsync: str = cfg.WAL_FSYNC, batch_size: int = cfg.WAL_BATCH_SIZE,
+                 batch_wait: float = cfg.WAL_BATCH_WAIT):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f'unknown fsync policy {fsync}')
+        self.directory = directory
+        self.segment_size = segment_size
+        self.fsync = fsync
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait / 1000
+        self.segments = list()
+        self.error = None
+        self.closed = False
+        self.appended_bytes = 0
+        self.__firsts = list()
+        self.__retired = list()
+        self.__pending = deque()
+        self.__dirty = set()
+        self.__synced_at = time.time()
+        self.__cond = Condition()
+        os.makedirs(directory, exist_ok=True)
+        self.__open()
+        self.__writer = Thread(target=self.__write_groups, daemon=True)
+        self.__writer.start()
+
+    def __open(self):
+        names = sorted(n for n in os.listdir(self.directory) if n.endswith(SUFFIX))
+        for i, name in enumerate(names):
+            segment = Segment(os.path.join(self.directory, name), int(name[:-len(SUFFIX)]))
+            if segment.load(tail=i == len(names) - 1) or i == 0:
+                self.__add(segment)
+            else:
+                segment.close()
+                os.remove(segment.path)
+        self.__written = self.segments[-1].last if self.segments else 0
+        self.__appended = self.__written
+        logger.debug(f'[WAL] opened {self.directory}, last commit id {self.last_commit_id}')
+
+    def __add(self, segment: Segment):
+        if self.segments and segment.first != self.segments[-1].last + 1:
+            raise ValueError(f'segment {segment.path} does not follow the previous one')
+        self.segments.append(segment)
+        self.__firsts.append(segment.first)
+
+    @property
+    def first_commit_id(self) -> int:
+        return self.segments[0].first if self.segments else self.__written + 1
+
+    @property
+    def last_commit_id(self) -> int:
+        '''
+        commit id of the last appended entry, 0 if the log is empty
+        '''
+        return self.__appended
+
+    def __len__(self):
+        return self.last_commit_id - self.first_commit_id + 1
+
+    def append(self, entry: dict) -> Event:
+        '''
+        append the entry to the log; its `commit_id` must follow the
+        commit id of the last entry
+
+        :param entry: entry to be appended
+        :type entry: dict
+
+        :returns: event that is set once the entry is written (and
+                  fsynced, if the fsync policy is batch)
+        :rtype: Event
+        '''
+        commit_id = entry['commit_id']
+        data = bytes(dumps(entry), encoding='utf-8')
+        durable = Event()
+        with self.__cond:
+            if self.error:
+                raise self.error
+            if self.closed:
+                raise ValueError('log is closed')
+            if commit_id != self.__appended + 1:
+                raise ValueError(
+                    f'commit id {commit_id} does not follow {self.__appended}')
+            self.__pending.append((commit_id, data, entry, durable))
+            self.__appended = commit_id
+            self.appended_bytes += RECORD.size + len(data)
+            self.__cond.notify()
+        return durable
+
+    def __write_groups(self):
+        while True:
+            with self.__cond:
+                group = self.__next_group()
+                if group is None:
+                    break
+                if group and (not self.segments or self.segments[-1].size >= self.segment_size):
+                    self.__rotate(group[0][0])
+                segment = self.segments[-1] if self.segments else None
+            try:
+                if group and not self.error:
+                    segment.write([(commit_id, data) for commit_id, data, _, _ in group])
+                    self.__dirty.add(segment)
+                self.__sync()
+            except OSError as e:
+                logger.exception(f'[WAL] failed to write to {self.directory}')
+                with self.__cond:
+                    self.error = e
+            with self.__cond:
+                for _ in group:
+                    self.__pending.popleft()
+                if group and not self.error:
+                    self.__written = group[-1][0]
+                self.__cond.notify_all()
+            for _, _, _, durable in group:
+                durable.set()
+
+    def __next_group(self) -> list:
+        '''
+        wait for the next group of entries to write; an empty group
+        when an interval fsync is due, None when the log is closed
+        '''
+        while not self.__pending:
+            self.__close_retired()
+            if self.closed:
+                return None
+            if self.__dirty and self.fsync == 'interval':
+                due = self.__synced_at + cfg.WAL_FSYNC_INTERVAL / 1000 - time.time()
+                if due <= 0:
+                    return []
+                self.__cond.wait(due)
+            else:
+                self.__cond.wait()
+        deadline = time.time() + self.batch_wait
+        while len(self.__pending) < self.batch_size and not self.closed:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            self.__cond.wait(remaining)
+        return [self.__pending[i] for i in range(min(len(self.__pending), self.batch_size))]
+
+    def __close_retired(self):
+        '''
+        close the segments removed by `compact` or `reset`; only the writer
+        does, so it never syncs a closed segment
+        '''
+        for segment in self.__retired:
+            self.__dirty.discard(segment)
+            segment.close()
+        self.__retired.clear()
+
+    def __rotate(self, commit_id: int):
+        self.__add(Segment(
+            os.path.join(self.directory, f'{commit_id:020d}{SUFFIX}'), commit_id))
+
+    def __sync(self):
+        if self.fsync == 'never':
+            self.__dirty.clear()
+        if not self.__dirty:
+            return
+        now = time.time()
+        if self.fsync == 'interval' and now - self.__synced_at < cfg.WAL_FSYNC_INTERVAL / 1000:
+            return
+        for segment in self.__dirty:
+            segment.sync()
+        self.__dirty.clear()
+        self.__synced_at = now
+
+    def get(self, commit_id: int) -> dict:
+        '''
+        :returns: the entry with the given commit id, None if it is not in the log
+        :rtype: dict
+        '''
+        with self.__cond:
+            if not self.first_commit_id <= commit_id <= self.__appended:
+                return None
+            if commit_id > self.__written:
+                return self.__pending[commit_id - self.__written - 1][2]
+            # under the lock: `compact` may close the segment
+            segment = self.segments[bisect_right(self.__firsts, commit_id) - 1]
+            return segment.get(commit_id)
+
+    def since(self, commit_id: int, limit: int = None) -> list:
+        '''
+        :returns: the entries after the given commit id, oldest first;
+                  at most `limit` of them if a limit is given
+        :rtype: list
+        '''
+        start = max(commit_id + 1, self.first_commit_id)
+        stop = self.last_commit_id + 1
+        if limit is not None:
+            stop = min(stop, start + limit)
+        return [self.get(cid) for cid in range(start, stop)]
+
+    def compact(self, commit_id: int) -> int:
+        '''
+        remove the segments holding only entries up to `commit_id`,
+        once a snapshot covers them
+
+        :returns: number of segments removed
+        :rtype: int
+        '''
+        removed = 0
+        with self.__cond:
+            while len(self.segments) > 1 and self.segments[0].last <= commit_id:
+                self.__retire(self.segments.pop(0))
+                self.__firsts.pop(0)
+                removed += 1
+            self.__cond.notify()
+        if removed:
+            logger.info(f'[WAL] removed {removed} segments up to commit id {commit_id}')
+        return removed
+
+    def reset(self, commit_id: int):
+        '''
+        drop the whole log and continue it after `commit_id`, when a
+        snapshot taken at `commit_id` replaces it
+        '''
+        with self.__cond:
+            self.__cond.wait_for(lambda: self.__written == self.__appended or self.error)
+            for segment in self.segments:
+                self.__retire(segment)
+            self.segments, self.__firsts = list(), list()
+            self.__written = self.__appended = commit_id
+            self.__cond.notify()
+        logger.info(f'[WAL] log reset to continue after commit id {commit_id}')
+
+    def __retire(self, segment: Segment):
+        os.remove(segment.path)
+        self.__retired.append(segment)
+
+    def close(self):
+        '''
+        write and fsync the pending entries and close the segment files
+        '''
+        with self.__cond:
+            self.closed = True
+            self.__cond.notify()
+        self.__writer.join()
+        if self.fsync != 'never':
+            for segment in self.__dirty:
+                segment.sync()
+        with self.__cond:
+            self.__close_retired()
+            for segment in self.segments:
+                segment.close()
+            self.segments, self.__firsts = list(), list()
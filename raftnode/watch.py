@@ -0,0 +1,240 @@
+'''
+Change streams of keys, prefixes and namespaces.
+
+A client watches a key, the keys starting with a prefix or a whole
+namespace (see `Store.watch`) and the node pushes it the changes as they
+are applied to its database, on the connection the watch came in. The
+changes are fed from the commit path, so a follower streams them as well
+as the leader, in commit order, each with its commit id.
+
+A watch can resume from a commit id: the changes committed after it that
+are still in the log are replayed before the live ones. If they are not
+(the log was compacted after a snapshot) the watch ends with the
+`compacted` error and the client has to read the keys again.
+
+The changes wait in a buffer of WATCH_BUFFER changes until they are sent.
+When a client falls behind and the buffer fills up, only the latest change
+of every key is kept from then on (the changes are coalesced) until the
+buffer is drained; the changes sent from a coalesced buffer are flagged,
+as the client missed the changes in between. If even the latest changes
+do not fit, the watch ends with the `overflow` error; the client can
+resume it from the commit id of the last change it got.
+'''
+from collections import OrderedDict, deque
+from threading import Condition, Lock
+
+from raftnode import cfg
+
+COMPACTED, OVERFLOW, RESYNC = 'compacted', 'overflow', 'resync'
+
+
+def _change(commit_id: int, operation: str, key: str, value) -> dict:
+    change = {'commit_id': commit_id, 'key': key}
+    if operation == 'delete':
+        change['delete'] = True
+    else:
+        change['value'] = value
+    return change
+
+
+class Watch:
+
+    '''
+    a watch of a client. Exactly one of `key` and `prefix` is set, or
+    neither to watch the whole namespace
+
+    :param position: commit id of the last change the client has
+    :type position: int
+
+    :param start: commit id the watch was registered at; the changes up
+                  to it are replayed with `backlog`
+    :type start: int
+
+    :param backlog: function returning the (commit id, operations) of
+                    the committed entries from an index on, up to a limit;
+                    None if they are no longer in the log
+    :type backlog: callable
+    '''
+
+    def __init__(self, namespace: str, key: str = None, prefix: str = None,
+                 position: int = 0, start: int = 0, backlog=None):
+        self.namespace = namespace
+        self.key = key
+        self.prefix = prefix
+        self.position = position
+        self.error = None
+        # called on every change, by the thread applying it
+        self.listener = None
+        self.__start = start
+        self.__backlog = backlog
+        self.__changes = deque()
+        self.__latest = None
+        self.__cond = Condition(Lock())
+
+    def matches(self, key: str) -> bool:
+        if self.key is not None:
+            return key == self.key
+        return self.prefix is None or key.startswith(self.prefix)
+
+    @property
+    def replaying(self) -> bool:
+        '''
+        True while the changes before the watch was registered are
+        being replayed from the log
+        '''
+        return self.error is None and self.position < self.__start
+
+    @property
+    def ready(self) -> bool:
+        '''
+        True if `take` has something to return
+        '''
+        return (self.error is not None or self.replaying
+                or bool(self.__changes) or bool(self.__latest))
+
+    def offer(self, commit_id: int, operation: str, key: str, value):
+        '''
+        buffer a change of a key this watch matches
+        '''
+        change = _change(commit_id, operation, key, value)
+        with self.__cond:
+            if self.error is not None or commit_id <= max(self.position, self.__start):
+                return
+            if self.__latest is not None:
+                self.__latest.pop(key, None)
+                self.__latest[key] = change
+                if len(self.__latest) > cfg.WATCH_BUFFER:
+                    self.__fail(OVERFLOW)
+            elif len(self.__changes) < cfg.WATCH_BUFFER:
+                self.__changes.append(change)
+            else:
+                self.__latest = OrderedDict()
+                for pending in self.__changes:
+                    self.__latest.pop(pending['key'], None)
+                    self.__latest[pending['key']] = pending
+                self.__changes.clear()
+                self.__latest[key] = change
+            self.__cond.notify_all()
+        if self.listener:
+            self.listener()
+
+    def close(self, error: str = None):
+        '''
+        end the watch; `take` returns the error, if there is one
+        '''
+        with self.__cond:
+            self.__fail(error)
+            self.__cond.notify_all()
+        if self.listener:
+            self.listener()
+
+    def __fail(self, error: str):
+        if self.error is None:
+            self.error = error or ''
+        self.__changes.clear()
+        self.__latest = None
+
+    @property
+    def closed(self) -> bool:
+        return self.error is not None
+
+    def wait(self, timeout: float):
+        '''
+        wait until `take` has something to return, at most `timeout` seconds
+        '''
+        with self.__cond:
+            self.__cond.wait_for(lambda: self.ready, timeout)
+
+    def take(self, limit: int = None) -> dict:
+        '''
+        take up to `limit` changes (WATCH_BATCH by default) out of the
+        buffer, or out of the log while replaying
+
+        :returns: the `changes`, the `commit_id` of the last one (of the
+                  last change the client has if there are none) and
+                  whether they were `coalesced`; or the `error` that
+                  ended the watch
+        :rtype: dict
+        '''
+        limit = limit or cfg.WATCH_BATCH
+        if self.replaying:
+            return self.__replay(limit)
+        with self.__cond:
+            if self.error is not None:
+                return {'error': self.error, 'commit_id': self.position}
+            coalesced = self.__latest is not None
+            pending = self.__latest.values() if coalesced else self.__changes
+            changes = [change for change, _ in zip(pending, range(limit))]
+            if coalesced:
+                for change in changes:
+                    del self.__latest[change['key']]
+                if not self.__latest:
+                    self.__latest = None
+            else:
+                for _ in changes:
+                    self.__changes.popleft()
+            if changes:
+                self.position = changes[-1]['commit_id']
+            return {'changes': changes, 'commit_id': self.position, 'coalesced': coalesced}
+
+    def __replay(self, limit: int) -> dict:
+        entries = self.__backlog(self.position + 1, min(limit, self.__start - self.position))
+        if not entries:
+            self.close(COMPACTED)
+            return {'error': COMPACTED, 'commit_id': self.position}
+        changes = list()
+        for commit_id, operations in entries:
+            for operation, namespace, key, value in operations:
+                if namespace == self.namespace and self.matches(key):
+                    changes.append(_change(commit_id, operation, key, value))
+        self.position = entries[-1][0]
+        return {'changes': changes, 'commit_id': self.position, 'coalesced': False}
+
+
+class Watchers:
+
+    '''
+    the watches of a node, by namespace
+    '''
+
+    def __init__(self):
+        self.__watches = dict()
+        self.__lock = Lock()
+
+    def __len__(self):
+        return sum(len(watches) for watches in self.__watches.values())
+
+    def add(self, watch: Watch):
+        with self.__lock:
+            self.__watches.setdefault(watch.namespace, set()).add(watch)
+
+    def remove(self, watch: Watch):
+        with self.__lock:
+            watches = self.__watches.get(watch.namespace)
+            if watches is not None:
+                watches.discard(watch)
+                if not watches:
+                    del self.__watches[watch.namespace]
+
+    def publish(self, commit_id: int, operations: list):
+        '''
+        hand the ('put' | 'delete', namespace, key, value) operations
+        of the entry committed at `commit_id` to the watches they match
+        '''
+        if not self.__watches:
+            return
+        with self.__lock:
+            for operation, namespace, key, value in operations:
+                for watch in self.__watches.get(namespace, ()):
+                    if watch.matches(key):
+                        watch.offer(commit_id, operation, key, value)
+
+    def close(self, error: str):
+        '''
+        end all the watches with the `error`
+        '''
+        with self.__lock:
+            watches = [watch for group in self.__watches.values() for watch in group]
+            self.__watches = dict()
+        for watch in watches:
+            watch.close(error)
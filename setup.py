@@ -37,6 +37,10 @@ setup(
     install_requires=requirements,
     extras_require={
         'rocksdb': ['rocksdb==0.7.0'],
+        # column families (ROCKSDB_NAMESPACES=column_families) came with the
+        # python-rocksdb fork, which installs the same rocksdb module
+        'rocksdb-column-families': ['python-rocksdb>=0.8.0rc3'],
+        'msgpack': ['msgpack'],
     },
     license="MIT license",
     long_description=readme + '\n\n' + history,
@@ -0,0 +1,200 @@
+"""
+An in-memory stand-in for the parts of python-rocksdb that
+`raftnode.datastore.rocks` uses, so its tests run without the binding.
+
+Like rocksdb, a database can only be opened once at a time, a closed
+handle can not be used and the writes that were not synced (written with
+``sync=True``, which syncs all the writes before it) are lost by `crash`.
+The column family calls are those of python-rocksdb 0.8.
+"""
+import os
+from bisect import bisect_left
+from copy import deepcopy
+
+# the contents of every database by path, as written and as synced
+_written = dict()
+_synced = dict()
+# the open handle of every database by path
+_open = dict()
+
+
+def reset():
+    '''
+    forget all the databases
+    '''
+    _written.clear()
+    _synced.clear()
+    _open.clear()
+
+
+def crash():
+    '''
+    drop the handles and the writes that were not synced, like a
+    machine that went down
+    '''
+    for handle in list(_open.values()):
+        handle.closed = True
+    _open.clear()
+    _written.clear()
+    _written.update(deepcopy(_synced))
+
+
+def opened(path: str = None):
+    '''
+    :returns: the open handle of the database at `path`, or the paths of
+              all the open databases
+    '''
+    return sorted(_open) if path is None else _open.get(path)
+
+
+class Options:
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class ColumnFamilyOptions(Options):
+    pass
+
+
+class CompressionType:
+
+    no_compression = 'no_compression'
+    snappy_compression = 'snappy_compression'
+    zlib_compression = 'zlib_compression'
+    lz4_compression = 'lz4_compression'
+    zstd_compression = 'zstd_compression'
+
+
+class BlockBasedTableFactory:
+
+    def __init__(self, **kwargs):
+        self.options = kwargs
+
+
+def BloomFilterPolicy(bits: int):
+    return ('bloom', bits)
+
+
+def LRUCache(size: int):
+    return ('lru', size)
+
+
+def list_column_families(path: str, options: Options) -> list:
+    return [bytes(name, encoding='utf-8') for name in _written[path]]
+
+
+class ColumnFamilyHandle:
+
+    def __init__(self, name: str):
+        self.name = name
+
+
+class WriteBatch:
+
+    def __init__(self):
+        self.operations = list()
+
+    def put(self, key, value: bytes):
+        self.operations.append((key, value))
+
+    def delete(self, key):
+        self.operations.append((key, None))
+
+
+class Iterator:
+
+    def __init__(self, items: dict, handle: ColumnFamilyHandle = None):
+        self.__keys = sorted(items)
+        self.__items = items
+        self.__handle = handle
+        self.__pos = 0
+
+    def seek_to_first(self):
+        self.__pos = 0
+
+    def seek(self, key: bytes):
+        # python-rocksdb takes the bare key, also for a column family
+        assert isinstance(key, bytes), key
+        self.__pos = bisect_left(self.__keys, key)
+
+    def __iter__(self):
+        while self.__pos < len(self.__keys):
+            key = self.__keys[self.__pos]
+            self.__pos += 1
+            yield ((self.__handle, key) if self.__handle else key), self.__items[key]
+
+
+class DB:
+
+    def __init__(self, path: str, options: Options, column_families: dict = None):
+        if path in _open:
+            raise RuntimeError(f'IO error: lock {path}/LOCK: already held by process')
+        if not os.path.isfile(os.path.join(path, 'CURRENT')):
+            os.makedirs(path, exist_ok=True)
+            open(os.path.join(path, 'CURRENT'), 'w').close()
+            _written[path] = {'default': dict()}
+            _synced[path] = deepcopy(_written[path])
+        self.path = path
+        self.closed = False
+        self.family_options = dict()
+        for name, family_options in (column_families or dict()).items():
+            name = name.decode('utf-8')
+            _written[path].setdefault(name, dict())
+            self.family_options[name] = family_options
+        _open[path] = self
+
+    @property
+    def __families(self) -> dict:
+        if self.closed:
+            raise RuntimeError(f'{self.path} is closed')
+        return _written[self.path]
+
+    def __locate(self, key) -> tuple:
+        if isinstance(key, tuple):
+            return self.__families[key[0].name], key[1]
+        return self.__families['default'], key
+
+    def get_column_family(self, name: bytes) -> ColumnFamilyHandle:
+        return ColumnFamilyHandle(name.decode('utf-8')) if name.decode('utf-8') in self.__families else None
+
+    def create_column_family(self, name: bytes, options: ColumnFamilyOptions) -> ColumnFamilyHandle:
+        self.__families[name.decode('utf-8')] = dict()
+        self.family_options[name.decode('utf-8')] = options
+        return ColumnFamilyHandle(name.decode('utf-8'))
+
+    def put(self, key, value: bytes):
+        items, key = self.__locate(key)
+        items[key] = value
+
+    def get(self, key) -> bytes:
+        items, key = self.__locate(key)
+        return items.get(key)
+
+    def multi_get(self, keys: list) -> dict:
+        return {key: self.get(key) for key in keys}
+
+    def delete(self, key):
+        items, key = self.__locate(key)
+        items.pop(key, None)
+
+    def write(self, batch: WriteBatch, sync: bool = False):
+        for key, value in batch.operations:
+            if value is None:
+                self.delete(key)
+            else:
+                self.put(key, value)
+        if sync:
+            _synced[self.path] = deepcopy(self.__families)
+
+    def snapshot(self) -> dict:
+        return deepcopy(self.__families)
+
+    def iteritems(self, family: ColumnFamilyHandle = None, snapshot: dict = None) -> Iterator:
+        families = self.__families if snapshot is None else snapshot
+        return Iterator(families[family.name if family else 'default'], family)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            _open.pop(self.path, None)
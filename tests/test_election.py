@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+
+"""Tests for the votes of the leader election."""
+
+
+import tempfile
+import unittest
+from queue import Queue
+from unittest import mock
+
+from raftnode.election import Election
+from raftnode.store import Store
+
+
+class TestVote(unittest.TestCase):
+    """Tests for `Election.decide_vote`."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = Store(data_dir=self.tmp.name, log_name='voter')
+        with mock.patch.object(Election, 'init_timeout'):
+            self.election = Election(mock.Mock(peers=[]), self.store, Queue())
+
+    def tearDown(self):
+        self.store.log.close()
+        self.tmp.cleanup()
+
+    def vote(self, term, last_term, last_index):
+        return self.election.decide_vote(term, last_term, last_index)[0]
+
+    def test_stale_candidate(self):
+        for i in range(2):
+            self.store.commit({'key': f'k{i}', 'value': i, 'term': 2})
+        # a longer log of an older term misses the entries of term 2
+        self.assertFalse(self.vote(3, 1, 5))
+        # a shorter log of the same term misses the last entry
+        self.assertFalse(self.vote(3, 2, 1))
+        self.assertEqual(self.election.term, 0)
+        self.assertTrue(self.vote(3, 2, 2))
+        # one vote per term
+        self.assertFalse(self.vote(3, 3, 9))
+        self.assertTrue(self.vote(4, 3, 1))
+
+    def test_uncommitted_tail(self):
+        self.store.commit({'key': 'a', 'value': 1, 'term': 2})
+        self.store.entries.append({'key': 'b', 'value': 2, 'term': 3})
+        self.assertEqual((self.store.last_log_term, self.store.last_index), (3, 2))
+        self.assertFalse(self.vote(4, 2, 5))
+        self.assertTrue(self.vote(4, 3, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+
+"""Tests for the in-memory index of the log."""
+
+
+import unittest
+
+from raftnode.entries import EntryLog
+
+
+class TestEntryLog(unittest.TestCase):
+    """Tests for `raftnode.entries`."""
+
+    def setUp(self):
+        self.log = EntryLog(10)
+        for i, term in enumerate([1, 1, 2, 2, 2, 5]):
+            self.log.append({'key': f'k{i + 11}', 'term': term})
+
+    def test_lookup(self):
+        self.assertEqual((self.log.first_index, self.log.last_index), (11, 16))
+        self.assertEqual(self.log.get(13)['key'], 'k13')
+        self.assertIsNone(self.log.get(10))
+        self.assertIsNone(self.log.get(17))
+        self.assertEqual([self.log.term_at(i) for i in range(10, 18)],
+                         [None, 1, 1, 2, 2, 2, 5, None])
+        self.assertEqual([e['key'] for e in self.log.slice(14, 10)], ['k14', 'k15', 'k16'])
+        self.assertEqual(self.log.slice(9, 1)[0]['key'], 'k11')
+
+    def test_terms(self):
+        self.assertEqual(self.log.first_index_of_term(2), 13)
+        self.assertEqual(self.log.last_index_of_term(2), 15)
+        self.assertEqual(self.log.last_index_of_term(5), 16)
+        self.assertIsNone(self.log.last_index_of_term(3))
+
+    def test_truncate_and_trim(self):
+        self.log.truncate(13)
+        self.assertEqual(self.log.last_index, 13)
+        self.assertIsNone(self.log.first_index_of_term(5))
+        self.assertEqual(self.log.append({'term': 3}), 14)
+        self.log.trim(12)
+        self.assertEqual(self.log.first_index, 13)
+        self.assertEqual(self.log.first_index_of_term(2), 13)
+        self.assertIsNone(self.log.term_at(12))
+        self.assertEqual(self.log.get(14)['term'], 3)
+        self.log.trim(20)
+        self.assertEqual((len(self.log), self.log.last_index), (0, 14))
+        self.assertEqual(self.log.append({'term': 3}), 15)
+
+
+if __name__ == '__main__':
+    unittest.main()
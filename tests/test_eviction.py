@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+"""Tests for the namespaces, memory accounting and eviction of the in-memory store."""
+
+
+import tempfile
+import unittest
+from unittest import mock
+
+from raftnode.datastore.memory import MemoryStore
+from raftnode.store import Store
+
+
+class TestEviction(unittest.TestCase):
+    """Tests for `raftnode.datastore.memory` and `Store.evict`."""
+
+    def test_namespaces(self):
+        db = MemoryStore()
+        db.put('k', 'a', namespace='one')
+        db.put('k', 'b', namespace='two')
+        self.assertEqual(db.get('k', namespace='one'), 'a')
+        self.assertEqual(db.get('k', namespace='two'), 'b')
+        db.write_batch([('delete', 'one', 'k', None), ('put', 'two', 'k', 'c')])
+        self.assertIsNone(db.get('k', namespace='one'))
+        self.assertEqual(db.memory(), {'two': len('k') + len('"c"')})
+
+    def test_policies(self):
+        lru = MemoryStore(config={'max_bytes': 50, 'eviction': 'lru'})
+        lfu = MemoryStore(config={'max_bytes': 50, 'eviction': 'lfu'})
+        for db in (lru, lfu):
+            for i in range(5):
+                db.put(f'k{i}', 'x' * 6)
+            db.get('k0')
+            db.get('k0')
+            db.get('k1')
+            self.assertEqual(db.evictions(), [])
+            db.put('k5', 'x' * 6)
+        # 60 bytes: the keys up to 95% of 50 bytes are evicted
+        self.assertEqual(lru.evictions(), [('default', 'k2'), ('default', 'k3')])
+        self.assertEqual(lfu.evictions(), [('default', 'k2'), ('default', 'k3')])
+        lfu.get('k2')
+        self.assertEqual(lfu.evictions(), [('default', 'k3'), ('default', 'k4')])
+
+    def test_replicated(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            leader = Store(data_dir=tmp, log_name='leader')
+            follower = Store(data_dir=tmp, log_name='follower')
+            for store in (leader, follower):
+                store.db = MemoryStore(config={'namespace_max_bytes': {'sessions': 100}})
+            for i in range(20):
+                leader.put(1, {'key': f's{i}', 'value': 'x' * 8, 'namespace': 'sessions'}, None, 1)
+                leader.put(1, {'key': f'k{i}', 'value': 'x' * 8}, None, 1)
+            self.assertLessEqual(leader.db.memory()['sessions'], 100)
+            self.assertEqual(leader.db.memory()['default'], 10 * 12 + 10 * 13)
+            follower.action_handler({
+                'action': 'append', 'prev_index': 0, 'payload': leader.entries_from(1, 1000),
+                'commit_index': leader.commit_id})
+            self.assertEqual(sorted(follower.db.snapshot()), sorted(leader.db.snapshot()))
+            leader.log.close()
+            follower.log.close()
+
+    def test_put_again_before_the_eviction(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = Store(data_dir=tmp, log_name='leader')
+            try:
+                store.put(1, {'key': 'a', 'value': 1}, None, 1)
+                store.put(1, {'key': 'b', 'value': 2}, None, 1)
+                store.entries.append({'key': 'a', 'value': 'again', 'term': 1})
+                victims = [('default', 'a'), ('default', 'b')]
+                with mock.patch.object(store.db, 'evictions', return_value=victims):
+                    store.evict(1)
+                self.assertEqual(store.commit_id, 4)
+                self.assertEqual(sorted(store.db.snapshot()), [('default', 'a', 'again')])
+                self.assertEqual(store.entries_from(4, 1)[0]['keys'], [['default', 'a', 1], ['default', 'b', 2]])
+            finally:
+                store.log.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+"""Tests for the key TTLs and their replicated expiration."""
+
+
+import tempfile
+import time
+import unittest
+
+from raftnode import cfg
+from raftnode.expiry import ExpiryTable
+from raftnode.store import Store
+
+
+class TestExpiry(unittest.TestCase):
+    """Tests for `raftnode.expiry` and `Store.sweep`."""
+
+    def test_table(self):
+        table = ExpiryTable()
+        table.set('default', 'a', 3)
+        table.set('default', 'b', 1)
+        table.set('default', 'b', 5)
+        table.set('other', 'a', 2)
+        self.assertTrue(table.expired('other', 'a', 2))
+        self.assertFalse(table.expired('default', 'b', 2))
+        self.assertEqual(table.due(4, 10), [('other', 'a'), ('default', 'a')])
+        self.assertEqual(table.due(4, 10), [])
+        table.discard('other', 'a')
+        table.rebuild()
+        self.assertEqual(table.due(6, 10), [('default', 'a'), ('default', 'b')])
+
+    def test_sweep(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            leader = Store(data_dir=tmp, log_name='leader')
+            follower = Store(data_dir=tmp, log_name='follower')
+            delete_batch, cfg.DELETE_BATCH_SIZE = cfg.DELETE_BATCH_SIZE, 40
+            try:
+                for i in range(100):
+                    leader.put(1, {'key': f'k{i}', 'value': i, 'ttl': 0.05 if i % 2 else 60}, None, 1)
+                leader.put(1, {'key': 'k1', 'value': 'kept'}, None, 1)
+                self.assertEqual(leader.get({'key': 'k3'})['value'], 3)
+                time.sleep(0.1)
+                # expired, but not deleted yet
+                self.assertIsNone(leader.get({'key': 'k3'})['value'])
+                self.assertEqual(leader.get({'key': 'k1'})['value'], 'kept')
+                last_index = leader.last_index
+                leader.sweep(1)
+                # 49 keys in two entries, committed together
+                self.assertEqual(leader.last_index, last_index + 2)
+                self.assertEqual(leader.commit_id, leader.last_index)
+                self.assertIsNone(leader.db.get('k3', namespace='default'))
+                follower.action_handler({
+                    'action': 'append', 'prev_index': 0, 'payload': leader.entries_from(1, 1000),
+                    'commit_index': leader.commit_id})
+                self.assertEqual(sorted(follower.db.snapshot()), sorted(leader.db.snapshot()))
+                self.assertEqual(len(list(leader.db.snapshot())), 51)
+            finally:
+                cfg.DELETE_BATCH_SIZE = delete_batch
+                leader.log.close()
+                follower.log.close()
+
+    def test_refreshed_before_the_sweep(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            leader = Store(data_dir=tmp, log_name='leader')
+            follower = Store(data_dir=tmp, log_name='follower')
+            try:
+                leader.put(1, {'key': 'a', 'value': 1, 'ttl': 0.01}, None, 1)
+                leader.put(1, {'key': 'b', 'value': 2, 'ttl': 0.01}, None, 1)
+                time.sleep(0.05)
+                # a put of the key comes before the delete in the log, but
+                # is not applied yet when the sweep picks the key
+                leader.entries.append({'key': 'a', 'value': 'fresh', 'term': 1})
+                leader.sweep(1)
+                self.assertEqual(leader.commit_id, 4)
+                self.assertEqual(leader.get({'key': 'a'})['value'], 'fresh')
+                self.assertIsNone(leader.db.get('b', namespace='default'))
+                follower.action_handler({
+                    'action': 'append', 'prev_index': 0, 'payload': leader.entries_from(1, 1000),
+                    'commit_index': leader.commit_id})
+                self.assertEqual(sorted(follower.db.snapshot()), [('default', 'a', 'fresh')])
+            finally:
+                leader.log.close()
+                follower.log.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+"""Tests for the framed wire protocol."""
+
+
+import socket
+import time
+import unittest
+from json import dumps
+from threading import Thread
+
+from raftnode import protocol
+from raftnode.codec import CODECS, JSON, BinaryCodec, choose_codec, preferred_codecs
+from raftnode.transport import Connection, MessageBuffer
+
+
+class TestProtocol(unittest.TestCase):
+    """Tests for `raftnode.protocol`."""
+
+    def setUp(self):
+        self.left, self.right = socket.socketpair()
+
+    def tearDown(self):
+        self.left.close()
+        self.right.close()
+
+    def test_frames_split_and_coalesced(self):
+        frames = protocol.FrameBuffer(size=64)
+        small = protocol.encode_payload({'type': 'heartbeat', 'term': 1})
+        large = protocol.encode_payload({'type': 'put', 'value': 'x' * 10000})
+        protocol.send_frame(self.left, 1, small)
+        protocol.send_frame(self.left, 2, large)
+        protocol.send_frame(self.left, 3, small)
+        received = list()
+        while len(received) < 3:
+            self.assertTrue(frames.recv_into(self.right))
+            frame = frames.next_frame()
+            while frame:
+                codec, request_id, payload = frame
+                received.append((request_id, protocol.decode_payload(payload, codec)))
+                frame = frames.next_frame()
+        self.assertEqual([request_id for request_id, _ in received], [1, 2, 3])
+        self.assertEqual(len(received[1][1]['value']), 10000)
+        self.assertEqual(received[2][1], {'type': 'heartbeat', 'term': 1})
+
+    def test_bad_magic(self):
+        frames = protocol.FrameBuffer()
+        self.left.sendall(b'{"type": "get", "key": "k"}')
+        frames.recv_into(self.right)
+        with self.assertRaises(ValueError):
+            frames.next_frame()
+
+    def test_json_messages_split(self):
+        msgs = [{'type': 'put', 'key': 'k}', 'value': 'a "{quoted}" \\ é'},
+                {'type': 'get', 'key': '{', 'nested': {'list': [{}, {'x': '}'}]}}]
+        data = ' \n'.join(dumps(msg, ensure_ascii=False) for msg in msgs).encode('utf-8') * 3
+        for size in (1, 2, 7, len(data)):
+            buffer, received = MessageBuffer(), list()
+            for i in range(0, len(data), size):
+                received.extend(buffer.feed(data[i:i + size]))
+            self.assertEqual(received, msgs * 3, size)
+        self.assertIsNone(MessageBuffer().feed(b'  [1, 2]'))
+        self.assertIsNone(MessageBuffer().feed(b'{"a": nope}'))
+
+    def test_large_json_message_linear(self):
+        def parse(size):
+            data = dumps({'type': 'put', 'key': 'k', 'value': 'x' * size}).encode('utf-8')
+            buffer, received = MessageBuffer(), list()
+            start = time.perf_counter()
+            for i in range(0, len(data), 4096):
+                received.extend(buffer.feed(data[i:i + 4096]))
+            self.assertEqual(len(received[0]['value']), size)
+            return time.perf_counter() - start
+
+        small, large = parse(1024 ** 2), parse(16 * 1024 ** 2)
+        # 16 times the data in 4096 byte reads; quadratic parsing takes 256 times as long
+        self.assertLess(large, 40 * small + 0.5)
+
+    def test_channel_multiplexes_requests(self):
+        channel = protocol.Channel(self.left)
+        frames = protocol.FrameBuffer()
+        done = list()
+
+        def request(n):
+            reply = channel.request({'n': n}, 5)
+            done.append((n, reply['echo']))
+
+        threads = [Thread(target=request, args=(n,)) for n in range(4)]
+        for t in threads:
+            t.start()
+        pending = list()
+        while len(pending) < 4:
+            frames.recv_into(self.right)
+            frame = frames.next_frame()
+            while frame:
+                codec, request_id, payload = frame
+                pending.append((request_id, protocol.decode_payload(payload, codec)))
+                frame = frames.next_frame()
+        # answer in reverse order; every thread still gets its own reply
+        for request_id, msg in reversed(pending):
+            protocol.send_frame(self.right, request_id,
+                                protocol.encode_payload({'echo': msg['n']}))
+        for t in threads:
+            t.join()
+        self.assertEqual(len(done), 4)
+        for n, echo in done:
+            self.assertEqual(n, echo)
+        channel.close()
+
+    def test_codecs_roundtrip(self):
+        msg = {'type': 'heartbeat', 'term': 3, 'addr': '127.0.0.1:5000',
+               'action': 'log', 'payload': {'key': 'k', 'value': [1, -300, 2.5, None, True]},
+               'commit_id': 123456789, 'data': 'é'}
+        for codec in CODECS.values():
+            self.assertEqual(codec.decode(codec.encode(msg)), msg, codec.name)
+
+    def test_corrupt_binary(self):
+        codec = BinaryCodec()
+        for payload in (b'', b'\x09\x05', b'\x06\x05ab', b'\x05\x00', b'\x03\xff',
+                        b'\x0f', b'\x09\x01\x08\x00\x00', b'\x08\x01' * 100000):
+            with self.assertRaises(ValueError, msg=payload[:8]):
+                codec.decode(payload)
+
+    def test_corrupt_frame_closes_connection(self):
+        conn = Connection(self.right)
+        protocol.send_frame(self.left, 1, b'\x09\x05', BinaryCodec.id)
+        with self.assertRaises(ValueError):
+            conn.read()
+        # a channel drops the connection and fails its pending requests
+        channel = protocol.Channel(self.left)
+        protocol.send_frame(self.right, 1, b'\x09\x05', BinaryCodec.id)
+        with self.assertRaises(ConnectionResetError):
+            channel.request({'type': 'ping'}, 5)
+        self.assertTrue(channel.closed)
+
+    def test_choose_codec(self):
+        self.assertEqual(choose_codec([JSON]), JSON)
+        self.assertEqual(choose_codec([]), JSON)
+        self.assertIn(choose_codec(preferred_codecs()), CODECS)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+"""Tests for the read index of linearizable reads."""
+
+
+import tempfile
+import time
+import unittest
+from threading import Thread
+
+from raftnode.reads import SharedRequest, consistency
+from raftnode.store import Store
+
+
+class TestReads(unittest.TestCase):
+    """Tests for `raftnode.reads` and `Store.read_index`."""
+
+    def test_shared_request(self):
+        calls = list()
+
+        def fetch():
+            calls.append(time.time())
+            time.sleep(0.05)
+            return len(calls)
+
+        shared = SharedRequest(fetch)
+        results = list()
+        threads = [Thread(target=lambda: results.append(shared.get())) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # the first caller runs a call; the others arrive while it runs
+        # and share the next one
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(sorted(results), [1] + [2] * 19)
+        self.assertEqual(shared.get(), 3)
+
+    def test_consistency(self):
+        self.assertEqual(consistency({}), ('linearizable', None))
+        self.assertEqual(consistency({'consistency': 'any'}), ('any', None))
+        self.assertEqual(consistency({'consistency': 'bounded(250)'}), ('bounded', 0.25))
+        with self.assertRaises(ValueError):
+            consistency({'consistency': 'bounded'})
+
+    def test_read_index(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = Store(data_dir=tmp, log_name='leader')
+            store.action_handler({
+                'action': 'append', 'prev_index': 0, 'commit_index': 1,
+                'payload': [{'key': 'a', 'value': 1, 'term': 1}, {'key': 'b', 'value': 2, 'term': 1}]})
+            # the entry of term 1 after the commit index may be committed already
+            self.assertIsNone(store.read_index(2, 0.01))
+            self.assertEqual(store.read_index(1, 0.01), 1)
+            store.start_replication(2, [], None, 1, lambda: False)
+            self.assertEqual(store.read_index(2, 0.01), 3)
+            store.log.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
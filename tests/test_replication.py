@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+
+"""Tests for the append handling and divergence detection of the log."""
+
+
+import tempfile
+import unittest
+from unittest import mock
+
+from raftnode.replication import Replicator
+from raftnode.store import Store
+
+
+def entries(*terms):
+    return [{'key': f'k{i}', 'value': f'v{i}', 'term': term} for i, term in enumerate(terms)]
+
+
+class TestReplication(unittest.TestCase):
+    """Tests for `Store.action_handler` and the log lookups of `raftnode.store`."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.leader = Store(data_dir=self.tmp.name, log_name='leader')
+        self.follower = Store(data_dir=self.tmp.name, log_name='follower')
+
+    def tearDown(self):
+        self.leader.log.close()
+        self.follower.log.close()
+        self.tmp.cleanup()
+
+    def append(self, store, prev_index, payload, commit_index=0):
+        return store.action_handler({
+            'action': 'append', 'prev_index': prev_index, 'prev_term': self.leader.term_at(prev_index),
+            'payload': payload, 'commit_index': commit_index})
+
+    def test_terms(self):
+        self.append(self.leader, 0, entries(1, 1, 2, 2, 2, 4), commit_index=2)
+        self.assertEqual(self.leader.commit_id, 2)
+        self.assertEqual([self.leader.term_at(i) for i in range(8)], [0, 1, 1, 2, 2, 2, 4, None])
+        self.assertEqual(self.leader.last_index_of_term(1), 2)
+        self.assertEqual(self.leader.last_index_of_term(2), 5)
+        self.assertIsNone(self.leader.last_index_of_term(3))
+
+    def test_divergence(self):
+        self.append(self.leader, 0, entries(1, 1, 3, 3, 3))
+        self.append(self.follower, 0, entries(1, 1, 2, 2, 2, 2, 2))
+        # the follower is longer, with entries of a term the leader does not have
+        reply = self.append(self.follower, 5, [])
+        self.assertEqual(reply, {'success': False, 'conflict_term': 2, 'conflict_index': 3})
+        self.assertIsNone(self.leader.last_index_of_term(2))
+        reply = self.append(self.follower, 2, self.leader.entries_from(3, 10), commit_index=5)
+        self.assertEqual(reply, {'success': True})
+        self.assertEqual(self.follower.last_index, 5)
+        self.assertEqual(self.follower.commit_id, 5)
+        self.assertEqual([self.follower.term_at(i) for i in range(1, 6)], [1, 1, 3, 3, 3])
+
+    def test_short_follower(self):
+        self.append(self.leader, 0, entries(1, 1, 1, 1))
+        self.append(self.follower, 0, entries(1))
+        reply = self.append(self.follower, 4, [])
+        self.assertEqual(reply, {'success': False, 'conflict_index': 2})
+
+    def test_multi_key(self):
+        items = {f'k{i}': i for i in range(100)}
+        self.assertTrue(self.leader.mput(1, {'items': items, 'namespace': 'ns'}, None, 1))
+        self.assertTrue(self.leader.mdelete(1, {'keys': ['k1', 'k2', 'none'], 'namespace': 'ns'}, None, 1))
+        # one entry per write
+        self.assertEqual(self.leader.commit_id, 2)
+        reply = self.append(self.follower, 0, self.leader.entries_from(1, 10), commit_index=2)
+        self.assertEqual(reply, {'success': True})
+        for store in (self.leader, self.follower):
+            values = store.mget({'keys': ['k0', 'k1', 'k99'], 'namespace': 'ns'})['values']
+            self.assertEqual(values, {'k0': 0, 'k1': None, 'k99': 99})
+
+
+    def test_bad_put(self):
+        for payload in ({'key': 1, 'value': 'x'}, {'key': 'k'}, {'key': 'k', 'value': 1, 'namespace': 2}):
+            with self.assertRaises(ValueError):
+                self.leader.put(1, payload, None, 1)
+        with self.assertRaises(ValueError):
+            self.leader.delete(1, {'key': None}, None, 1)
+        # nothing was committed
+        self.assertEqual(self.leader.commit_id, 0)
+
+
+    def test_bad_multi_key(self):
+        for payload in ({'items': [['a', 1]]}, {'items': {'a': 1}, 'namespace': None}):
+            with self.assertRaises(ValueError):
+                self.leader.mput(1, payload, None, 1)
+        for payload in ({'keys': 'ab'}, {'keys': ['a', 1]}):
+            with self.assertRaises(ValueError):
+                self.leader.mdelete(1, payload, None, 1)
+        self.assertEqual(self.leader.commit_id, 0)
+
+    def test_malformed_entry_skipped(self):
+        # entries a node without the checks may have committed
+        bad = [{'type': 'mput', 'namespace': 'default', 'items': [['a', 1]], 'term': 1},
+               {'key': 1, 'value': 'x', 'term': 1}, {'key': 'b', 'term': 1}]
+        reply = self.append(self.follower, 0, bad + entries(1), commit_index=4)
+        self.assertEqual(reply, {'success': True})
+        self.assertEqual(self.follower.get({'key': 'k0'})['value'], 'v0')
+        self.follower.log.close()
+        self.follower = Store(data_dir=self.tmp.name, log_name='follower')
+        self.assertEqual(self.follower.commit_id, 4)
+        self.assertEqual(self.follower.get({'key': 'k0'})['value'], 'v0')
+
+    def test_no_snapshot(self):
+        transport = mock.Mock(peers=['peer'], addr='leader')
+        replicator = Replicator(self.leader, transport, 'peer', 1, lambda: True)
+        self.assertIsNone(self.leader.snapshots.latest)
+        # the follower gets the snapshot once there is one
+        replicator.send_snapshot()
+        transport.send_request.assert_not_called()
+        with mock.patch.object(type(self.leader.snapshots), 'latest', 'gone.snapshot'):
+            replicator.send_snapshot()
+        transport.send_request.assert_not_called()
+        self.assertEqual(replicator.snapshot_offset, (None, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
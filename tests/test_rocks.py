@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+
+"""Tests for the rocksdb datastore."""
+
+
+import sys
+import tempfile
+import time
+import unittest
+from os import path
+from unittest import mock
+
+from raftnode import cfg
+from raftnode.store import Store
+from tests import fake_rocksdb
+
+try:
+    import rocksdb
+except ImportError:
+    rocksdb = None
+
+if rocksdb is None:
+    # the module imports python-rocksdb; without it, it is imported with the
+    # fake, which the tests below patch in anyway
+    sys.modules['rocksdb'] = fake_rocksdb
+    from raftnode.datastore import rocks
+    del sys.modules['rocksdb']
+else:
+    from raftnode.datastore import rocks
+RockStore = rocks.RockStore
+
+
+class FakeRocksDB:
+    """Runs the tests of a class against `tests.fake_rocksdb`."""
+
+    def setUp(self):
+        fake_rocksdb.reset()
+        self.addCleanup(fake_rocksdb.reset)
+        patcher = mock.patch.object(rocks, 'rocksdb', fake_rocksdb)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        super().setUp()
+
+
+class RockStoreTests:
+    """Tests for `RockStore` with a database per namespace."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = RockStore(self.tmp.name, config={'max_open_dbs': 2})
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def test_eviction(self):
+        for i in range(6):
+            self.assertTrue(self.db.put('k', f'v{i}', f'ns{i}'))
+        for i in range(6):
+            self.assertEqual(self.db.get('k', f'ns{i}'), f'v{i}')
+        self.db.write_batch([('put', f'ns{i}', 'b', i * 'x') for i in range(6)])
+        self.assertEqual(self.db.get_many(['k', 'b'], 'ns5'), {'k': 'v5', 'b': 5 * 'x'})
+
+    def test_values(self):
+        self.db.write_batch([('put', 'a', 'int', 1), ('put', 'a', 'list', [1, None]), ('put', 'a', 'none', None)])
+        self.assertEqual(self.db.get_many(['int', 'list', 'none'], 'a'), {'int': 1, 'list': [1, None], 'none': None})
+
+    def test_snapshot(self):
+        for i in range(6):
+            self.db.put('k', f'v{i}', f'ns{i}')
+        snapshot = self.db.snapshot()
+        # more databases are opened than fit while the snapshot is pending
+        for i in range(6):
+            self.db.put('k', 'changed', f'ns{i}')
+            self.db.get('k', f'other{i}')
+        self.assertEqual(sorted(snapshot), [(f'ns{i}', 'k', f'v{i}') for i in range(6)])
+        self.db.snapshot().close()
+        self.assertEqual(self.db.get('k', 'ns0'), 'changed')
+
+    def test_restore(self):
+        self.db.restore([(f'ns{i}', 'k', f'v{i}') for i in range(6)], commit_id=7)
+        self.assertEqual(sorted(self.db.snapshot()), [(f'ns{i}', 'k', f'v{i}') for i in range(6)])
+        self.assertEqual(self.db.applied(), {'namespaces': {f'ns{i}': 7 for i in range(6)}, 'outcomes': {}})
+
+    def test_applied(self):
+        self.db.put('old', 'x', 'legacy')
+        self.db.write_batch([('put', 'a', 'k', 'x'), ('put', 'b', 'k', 'y')], commit_id=3,
+                            outcomes=[('a', 2, True)])
+        self.db.write_batch([('delete', 'b', 'k', None)], commit_id=5, outcomes=[('c', 4, False)])
+        applied = self.db.applied()
+        self.assertEqual(applied['namespaces'], {'a': 3, 'b': 5, 'c': 5, 'legacy': None})
+        self.assertEqual(applied['outcomes'], {2: True, 4: False})
+        # the commit ids and outcomes are not keys of the namespaces
+        self.assertEqual(self.db.scan('a'), [('k', 'x')])
+        self.assertEqual(self.db.scan('b'), [])
+        self.assertEqual(sorted(self.db.snapshot()), [('a', 'k', 'x'), ('legacy', 'old', 'x')])
+        self.db.compact(2)
+        self.assertEqual(self.db.applied()['outcomes'], {4: False})
+
+
+class TestRockStore(FakeRocksDB, RockStoreTests, unittest.TestCase):
+    pass
+
+
+@unittest.skipUnless(rocksdb, 'needs python-rocksdb')
+class TestRockStoreBinding(RockStoreTests, unittest.TestCase):
+    pass
+
+
+class TestHandleCache(FakeRocksDB, unittest.TestCase):
+    """Tests for the open databases of `RockStore`."""
+
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db = RockStore(self.tmp.name, config={'max_open_dbs': 2})
+        self.addCleanup(self.db.close)
+
+    def opened(self) -> list:
+        return [name.rsplit('/', 1)[-1] for name in fake_rocksdb.opened()]
+
+    def test_least_recently_used(self):
+        for i in range(4):
+            self.db.put('k', f'v{i}', f'ns{i}')
+        self.assertEqual(self.opened(), ['ns2', 'ns3'])
+        self.db.get('k', 'ns2')
+        self.db.get('k', 'ns0')
+        self.assertEqual(self.opened(), ['ns0', 'ns2'])
+        self.assertIsNone(self.db.get('k', 'missing'))
+        self.assertEqual(self.opened(), ['ns0', 'ns2'])
+
+    def test_pinned_by_a_batch(self):
+        # all the databases of a batch stay open until it is written
+        self.db.write_batch([('put', f'ns{i}', 'k', f'v{i}') for i in range(5)])
+        self.assertEqual(len(self.opened()), 2)
+        self.assertEqual([self.db.get('k', f'ns{i}') for i in range(5)], [f'v{i}' for i in range(5)])
+
+    def test_pinned_by_a_snapshot(self):
+        for i in range(5):
+            self.db.put('k', f'v{i}', f'ns{i}')
+        snapshot = self.db.snapshot()
+        self.assertEqual(len(self.opened()), 5)
+        self.assertEqual(next(snapshot), ('ns0', 'k', 'v0'))
+        self.db.put('k', 'x', 'ns9')
+        # ns0 is still being read
+        self.assertIn('ns0', self.opened())
+        self.assertEqual(len(list(snapshot)), 4)
+        self.assertEqual(len(self.opened()), 2)
+        # a snapshot that is dropped unpins its databases
+        snapshot = self.db.snapshot()
+        self.assertEqual(len(self.opened()), 6)
+        del snapshot
+        self.assertEqual(len(self.opened()), 2)
+
+    def test_close(self):
+        for i in range(4):
+            self.db.write_batch([('put', f'ns{i}', 'k', f'v{i}')])
+        self.db.close()
+        self.assertEqual(self.opened(), [])
+        # the databases are synced before they are closed
+        fake_rocksdb.crash()
+        self.assertEqual([self.db.get('k', f'ns{i}') for i in range(4)], [f'v{i}' for i in range(4)])
+
+
+class ColumnFamilyTests:
+    """Tests for `RockStore` with a column family per namespace."""
+
+    config = {'namespaces': 'column_families',
+              'namespace_options': {'logs': {'write_buffer_size': 8388608, 'compression': 'zstd_compression'}}}
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_column_families(self):
+        db = RockStore(self.tmp.name, config=self.config)
+        try:
+            db.write_batch([('put', 'logs', 'a', 'x'), ('put', 'users', 'a', 'y'),
+                            ('put', 'users', 'b', 'z'), ('delete', 'users', 'b', None)])
+            self.assertEqual((db.get('a', 'logs'), db.get('a', 'users')), ('x', 'y'))
+            self.assertIsNone(db.get('b', 'users'))
+            self.assertEqual(db.namespaces(), ['default', 'logs', 'users'])
+            self.assertEqual(db.scan('users'), [('a', 'y')])
+            items = sorted(db.snapshot())
+            db.restore([('logs', 'c', 'w')])
+            self.assertIsNone(db.get('a', 'users'))
+            self.assertEqual(db.get('c', 'logs'), 'w')
+            db.restore(items)
+            self.assertEqual(sorted(db.snapshot()), items)
+        finally:
+            db.close()
+
+    def test_applied(self):
+        db = RockStore(self.tmp.name, config=self.config)
+        try:
+            db.write_batch([('put', 'logs', 'a', 'x')], commit_id=3, outcomes=[('logs', 2, True)])
+            db.write_batch([('put', 'users', 'a', 'y')], commit_id=5, outcomes=[('users', 4, False)])
+            self.assertEqual(db.applied(), {'namespaces': {'default': 0, 'logs': 3, 'users': 5},
+                                            'outcomes': {2: True, 4: False}})
+            self.assertEqual(db.scan('logs'), [('a', 'x')])
+            db.compact(3)
+            db.sync()
+            self.assertEqual(db.applied()['outcomes'], {4: False})
+        finally:
+            db.close()
+
+
+class TestColumnFamilies(FakeRocksDB, ColumnFamilyTests, unittest.TestCase):
+
+    def test_namespace_options(self):
+        db = RockStore(self.tmp.name, config=dict(self.config, write_buffer_size=1024))
+        try:
+            db.write_batch([('put', 'logs', 'a', 'x'), ('put', 'users', 'a', 'y')])
+            families = fake_rocksdb.opened(path.join(db.data_dir, 'column_families')).family_options
+            self.assertEqual(families['logs'].write_buffer_size, 8388608)
+            self.assertEqual(families['logs'].compression, fake_rocksdb.CompressionType.zstd_compression)
+            self.assertEqual(families['users'].write_buffer_size, 1024)
+            self.assertFalse(hasattr(families['users'], 'compression'))
+        finally:
+            db.close()
+        # the options are given to the column families that already exist
+        db = RockStore(self.tmp.name, config=self.config)
+        try:
+            self.assertEqual(db.get('a', 'users'), 'y')
+            families = fake_rocksdb.opened(path.join(db.data_dir, 'column_families')).family_options
+            self.assertEqual(families['logs'].write_buffer_size, 8388608)
+        finally:
+            db.close()
+
+    def test_config(self):
+        with self.assertRaises(ValueError):
+            RockStore(self.tmp.name, config={'namespaces': 'tables'})
+        # python-rocksdb 0.7 has no column families
+        with mock.patch.object(fake_rocksdb, 'ColumnFamilyOptions', None):
+            self.assertFalse(RockStore.supports_column_families())
+            with self.assertRaises(ValueError):
+                RockStore(self.tmp.name, config={'namespaces': 'column_families'})
+        self.assertEqual(fake_rocksdb.opened(), [])
+
+    def test_store_config(self):
+        with mock.patch.multiple(cfg, ROCKSDB_NAMESPACES='column_families',
+                                 ROCKSDB_NAMESPACE_OPTIONS={'logs': {'write_buffer_size': 8388608}}):
+            store = Store(store_type='database', data_dir=self.tmp.name)
+        try:
+            store.put(1, {'key': 'a', 'value': 'x'}, None, 1)
+            self.assertEqual(store.get({'key': 'a'})['value'], 'x')
+            self.assertEqual([name.rsplit('/', 1)[-1] for name in fake_rocksdb.opened()], ['column_families'])
+        finally:
+            store.log.close()
+            store.db.close()
+
+
+@unittest.skipUnless(rocksdb and RockStore.supports_column_families(), 'needs python-rocksdb 0.8 or later')
+class TestColumnFamiliesBinding(ColumnFamilyTests, unittest.TestCase):
+    pass
+
+
+class TestDurableRestart(FakeRocksDB, unittest.TestCase):
+    """Tests for restarting `Store` on a rocksdb database."""
+
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.entries = cfg.SNAPSHOT_ENTRIES
+        cfg.SNAPSHOT_ENTRIES = 10
+
+    def tearDown(self):
+        cfg.SNAPSHOT_ENTRIES = self.entries
+        self.tmp.cleanup()
+
+    def restart(self, store):
+        store.log.close()
+        store.db.close()
+        return Store(store_type='database', data_dir=self.tmp.name)
+
+    def test_restart_keeps_database(self):
+        store = Store(store_type='database', data_dir=self.tmp.name)
+        for i in range(12):
+            store.put(1, {'key': f'k{i % 5}', 'value': f'v{i}'}, None, 1)
+        deadline = time.time() + 5
+        while store.snapshot_id < 10 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertGreaterEqual(store.snapshot_id, 10)
+        txn = {'compare': [{'key': 'a', 'value': None}], 'success': [{'key': 'b', 'value': 'x'}]}
+        self.assertTrue(store.txn(1, txn, None, 1)['succeeded'])
+        store.put(1, {'key': 'a', 'value': 'y'}, None, 1)
+        with mock.patch.object(RockStore, 'restore', side_effect=AssertionError('restored')):
+            store = self.restart(store)
+        self.assertEqual(store.commit_id, 14)
+        self.assertEqual(store.get({'key': 'k1'})['value'], 'v11')
+        # the transaction is not evaluated again against the later writes
+        read = store.get({'key': 'b'})
+        self.assertEqual((read['value'], read['version']), ('x', 13))
+        store.put(1, {'key': 'a', 'value': 'z'}, None, 1)
+        store = self.restart(store)
+        self.assertEqual(store.get({'key': 'a'})['value'], 'z')
+        store.log.close()
+        store.db.close()
+
+    def test_crash_before_the_snapshot(self):
+        store = Store(store_type='database', data_dir=self.tmp.name)
+        # no snapshot replaces the log entries the database did not sync
+        with mock.patch.object(RockStore, 'sync', side_effect=OSError('sync failed')) as sync:
+            for i in range(12):
+                store.put(1, {'key': f'k{i % 5}', 'value': f'v{i}'}, None, 1)
+            deadline = time.time() + 5
+            while not sync.called and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertTrue(sync.called)
+        self.assertEqual(store.snapshot_id, 0)
+        fake_rocksdb.crash()
+        store.log.close()
+        store = Store(store_type='database', data_dir=self.tmp.name)
+        self.assertEqual(store.commit_id, 12)
+        self.assertEqual([store.get({'key': f'k{i}'})['value'] for i in range(5)],
+                         ['v10', 'v11', 'v7', 'v8', 'v9'])
+        # the next snapshot syncs the database before it drops the entries
+        for i in range(10):
+            store.put(1, {'key': 'a', 'value': f'v{i}'}, None, 1)
+        deadline = time.time() + 5
+        while not store.snapshot_id and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertGreater(store.snapshot_id, 12)
+        fake_rocksdb.crash()
+        store.log.close()
+        store = Store(store_type='database', data_dir=self.tmp.name)
+        self.assertEqual(store.get({'key': 'k1'})['value'], 'v11')
+        self.assertEqual(store.get({'key': 'a'})['value'], 'v9')
+        store.log.close()
+        store.db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
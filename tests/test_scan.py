@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+"""Tests for the ordered index and the paginated scans."""
+
+
+import random
+import tempfile
+import unittest
+
+from raftnode import cfg
+from raftnode.datastore.Idatastore import IDatastore
+from raftnode.datastore.index import SortedKeys
+from raftnode.datastore.memory import MemoryStore
+from raftnode.store import Store
+
+
+class TestScan(unittest.TestCase):
+    """Tests for `raftnode.datastore.index` and `Store.scan`."""
+
+    def test_sorted_keys(self):
+        index, keys = SortedKeys(load=4), set()
+        for _ in range(2000):
+            key = f'{random.randrange(300):03d}'
+            if random.random() < 0.6:
+                if key not in keys:
+                    index.add(key)
+                    keys.add(key)
+            else:
+                index.discard(key)
+                keys.discard(key)
+        self.assertEqual(len(index), len(keys))
+        self.assertEqual(list(index.irange()), sorted(keys))
+        self.assertEqual(list(index.irange('100', '150')),
+                         sorted(k for k in keys if '100' <= k < '150'))
+
+    def test_default_scan(self):
+        db = MemoryStore()
+        db.write_batch([('put', ns, f'{i:03d}', i) for i in random.sample(range(500), 500)
+                        for ns in ('a', 'b')])
+        for start, end, limit in ((None, None, 1000), ('100', '250', 20), ('490', None, 50)):
+            self.assertEqual(IDatastore.scan(db, 'a', start=start, end=end, limit=limit),
+                             db.scan('a', start=start, end=end, limit=limit))
+
+    def test_pages(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = Store(data_dir=tmp, log_name='leader')
+            store.mput(1, {'items': {f'user:{i:04d}': i for i in range(250)}}, None, 1)
+            store.mput(1, {'items': {'order:1': 'a', 'zzz': 'b'}}, None, 1)
+            store.mdelete(1, {'keys': ['user:0001']}, None, 1)
+            keys, token = list(), None
+            page_bytes, cfg.SCAN_PAGE_BYTES = cfg.SCAN_PAGE_BYTES, 500
+            try:
+                while True:
+                    page = store.scan({'prefix': 'user:', 'limit': 100, 'token': token})
+                    self.assertLessEqual(len(page['items']), 100)
+                    keys.extend(key for key, _ in page['items'])
+                    token = page['token']
+                    if token is None:
+                        break
+            finally:
+                cfg.SCAN_PAGE_BYTES = page_bytes
+            self.assertEqual(keys, [f'user:{i:04d}' for i in range(250) if i != 1])
+            page = store.scan({'start': 'order:', 'end': 'user:0003'})
+            self.assertEqual(page['items'], [['order:1', 'a'], ['user:0000', 0], ['user:0002', 2]])
+            self.assertIsNone(page['token'])
+            with self.assertRaises(ValueError):
+                store.scan({'token': 'not a token'})
+            store.log.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
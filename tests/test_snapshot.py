@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+"""Tests for snapshots and log compaction."""
+
+
+import os
+import tempfile
+import time
+import unittest
+
+from raftnode import cfg
+from raftnode.store import Store
+
+
+class TestSnapshot(unittest.TestCase):
+    """Tests for `raftnode.snapshot` and the snapshots of `raftnode.store`."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.entries = cfg.SNAPSHOT_ENTRIES
+        cfg.SNAPSHOT_ENTRIES = 10
+
+    def tearDown(self):
+        cfg.SNAPSHOT_ENTRIES = self.entries
+        self.tmp.cleanup()
+
+    def commit(self, store, count):
+        for i in range(store.commit_id, store.commit_id + count):
+            durable = store.commit({'key': f'k{i % 7}', 'value': f'v{i}', 'term': 1})
+        store.wait_durable(durable)
+
+    def wait_for_snapshot(self, store, commit_id):
+        deadline = time.time() + 5
+        while store.snapshot_id < commit_id and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertGreaterEqual(store.snapshot_id, commit_id)
+
+    def test_snapshot_and_restart(self):
+        store = Store(data_dir=self.tmp.name)
+        self.commit(store, 15)
+        self.wait_for_snapshot(store, 10)
+        self.commit(store, 10)
+        self.wait_for_snapshot(store, 20)
+        header = store.snapshots.header(store.snapshots.latest)
+        self.assertEqual(header['term'], 1)
+        store.log.close()
+        store = Store(data_dir=self.tmp.name)
+        self.assertEqual(store.commit_id, 25)
+        self.assertEqual(store.get({'key': 'k3'})['value'], 'v24')
+        self.assertEqual(store.get({'key': 'k2'})['value'], 'v23')
+        store.log.close()
+
+    def chunk(self, leader, fd, offset, size, last):
+        data = leader.snapshots.read_chunk(fd, offset, 64)
+        return {'action': 'snapshot', 'addr': 'leader:1', 'last_index': last['commit_id'],
+                'last_term': last['term'], 'offset': offset, 'payload': data.decode('utf-8'),
+                'done': offset + len(data) == size}
+
+    def test_install_snapshot_in_chunks(self):
+        leader = Store(data_dir=self.tmp.name, log_name='leader')
+        self.commit(leader, 12)
+        self.wait_for_snapshot(leader, 10)
+        snapshot = leader.snapshots.latest
+        header = leader.snapshots.header(snapshot)
+        fd = os.open(snapshot, os.O_RDONLY)
+        size = os.fstat(fd).st_size
+        follower = Store(data_dir=self.tmp.name, log_name='follower')
+        message = self.chunk(leader, fd, 0, size, header)
+        offset = follower.action_handler(message)['snapshot_offset']
+        self.assertEqual(offset, len(message['payload']))
+        # a chunk the follower does not expect tells the leader where it is
+        message = self.chunk(leader, fd, 0, size, header)
+        self.assertEqual(follower.action_handler(message)['snapshot_offset'], offset)
+        # the partial snapshot survives a restart
+        follower.log.close()
+        follower = Store(data_dir=self.tmp.name, log_name='follower')
+        while offset < size:
+            message = self.chunk(leader, fd, offset, size, header)
+            offset = follower.action_handler(message)['snapshot_offset']
+        os.close(fd)
+        self.assertEqual(follower.commit_id, header['commit_id'])
+        self.assertEqual(follower.log.first_commit_id, header['commit_id'] + 1)
+        follower.action_handler({
+            'action': 'append', 'prev_index': follower.commit_id,
+            'payload': leader.entries_from(follower.commit_id + 1, 10), 'commit_index': 12})
+        self.assertEqual(follower.commit_id, 12)
+        self.assertEqual(follower.get({'key': 'k4'})['value'], 'v11')
+        leader.log.close()
+        follower.log.close()
+
+if __name__ == '__main__':
+    unittest.main()
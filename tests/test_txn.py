@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+"""Tests for the transactions and compare-and-swap."""
+
+
+import tempfile
+import unittest
+
+from raftnode.codec import BinaryCodec
+from raftnode.store import Store
+
+
+class TestTxn(unittest.TestCase):
+    """Tests for `Store.txn` and `Store.cas`."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = Store(data_dir=self.tmp.name, log_name='leader')
+
+    def tearDown(self):
+        self.store.log.close()
+        self.tmp.cleanup()
+
+    def value(self, key):
+        return self.store.get({'key': key})['value']
+
+    def test_cas(self):
+        self.assertTrue(self.store.cas(1, {'key': 'a', 'value': 1, 'expected': None}, None, 1)['succeeded'])
+        self.assertFalse(self.store.cas(1, {'key': 'a', 'value': 2, 'expected': None}, None, 1)['succeeded'])
+        self.assertTrue(self.store.cas(1, {'key': 'a', 'value': 3, 'expected': 1}, None, 1)['succeeded'])
+        read = self.store.get({'key': 'a'})
+        self.assertEqual((read['value'], read['version']), (3, 3))
+        self.assertFalse(self.store.cas(1, {'key': 'a', 'value': 4, 'version': 1}, None, 1)['succeeded'])
+        result = self.store.cas(1, {'key': 'a', 'delete': True, 'version': 3}, None, 1)
+        self.assertEqual(result, {'succeeded': True, 'commit_id': 5})
+        self.assertEqual(self.store.get({'key': 'a'})['version'], 0)
+        with self.assertRaises(ValueError):
+            self.store.cas(1, {'key': 'a', 'value': 1}, None, 1)
+
+    def test_txn(self):
+        self.store.mput(1, {'items': {'from': 10, 'to': 0}}, None, 1)
+        transfer = {'compare': [{'key': 'from', 'value': 10}, {'key': 'to', 'version': 1}],
+                    'success': [{'key': 'from', 'value': 5}, {'key': 'to', 'value': 5}],
+                    'failure': [{'key': 'failed', 'value': True}]}
+        self.assertTrue(self.store.txn(1, transfer, None, 1)['succeeded'])
+        self.assertEqual((self.value('from'), self.value('to')), (5, 5))
+        self.assertFalse(self.store.txn(1, transfer, None, 1)['succeeded'])
+        self.assertEqual((self.value('from'), self.value('failed')), (5, True))
+        self.store.txn(1, {'success': [{'key': 'to', 'delete': True}]}, None, 1)
+        self.assertIsNone(self.value('to'))
+        with self.assertRaises(ValueError):
+            self.store.txn(1, {'compare': [{'key': 'a'}]}, None, 1)
+        with self.assertRaises(ValueError):
+            self.store.txn(1, {'success': [{'key': 'a'}]}, None, 1)
+
+    def test_replay(self):
+        self.store.put(1, {'key': 'a', 'value': 1}, None, 1)
+        self.store.cas(1, {'key': 'a', 'value': 2, 'expected': 1}, None, 1)
+        self.store.cas(1, {'key': 'a', 'value': 3, 'expected': 1}, None, 1)
+        self.store.log.close()
+        # the outcomes are the same when the log is applied again
+        self.store = Store(data_dir=self.tmp.name, log_name='leader')
+        read = self.store.get({'key': 'a'})
+        self.assertEqual((read['value'], read['version']), (2, 2))
+
+    def test_words(self):
+        self.assertLessEqual(len(BinaryCodec.WORDS), BinaryCodec.SMALL_INT - BinaryCodec.WORD)
+
+
+if __name__ == '__main__':
+    unittest.main()
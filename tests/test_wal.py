@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+"""Tests for the write-ahead log."""
+
+
+import os
+import tempfile
+import unittest
+
+from raftnode.wal import WriteAheadLog
+
+
+class TestWriteAheadLog(unittest.TestCase):
+    """Tests for `raftnode.wal`."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def fill(self, log, count):
+        for commit_id in range(log.last_commit_id + 1, log.last_commit_id + count + 1):
+            durable = log.append({'key': f'k{commit_id}', 'value': 'x' * 20, 'commit_id': commit_id})
+        durable.wait()
+
+    def test_segments_and_reopen(self):
+        log = WriteAheadLog(self.directory, segment_size=256, batch_size=4)
+        self.fill(log, 50)
+        self.assertGreater(len(log.segments), 1)
+        self.assertEqual(log.get(37)['key'], 'k37')
+        log.close()
+        log = WriteAheadLog(self.directory, segment_size=256)
+        self.assertEqual(len(log), 50)
+        self.assertEqual([e['commit_id'] for e in log.since(45)], [46, 47, 48, 49, 50])
+        with self.assertRaises(ValueError):
+            log.append({'key': 'k', 'commit_id': 52})
+        log.close()
+
+    def test_torn_tail_is_truncated(self):
+        log = WriteAheadLog(self.directory)
+        self.fill(log, 10)
+        path = log.segments[-1].path
+        log.close()
+        with open(path, 'r+b') as f:
+            f.truncate(os.path.getsize(path) - 3)
+        log = WriteAheadLog(self.directory)
+        self.assertEqual(log.last_commit_id, 9)
+        self.fill(log, 1)
+        self.assertEqual(log.get(10)['key'], 'k10')
+        log.close()
+
+    def test_pending_entries_are_readable(self):
+        log = WriteAheadLog(self.directory, fsync='interval', batch_wait=50)
+        log.append({'key': 'a', 'commit_id': 1})
+        self.assertEqual(log.get(1)['key'], 'a')
+        self.assertEqual(len(log.since(0)), 1)
+        log.close()
+        log = WriteAheadLog(self.directory)
+        self.assertEqual(log.get(1)['key'], 'a')
+        log.close()
+
+    def test_compact_and_reset(self):
+        log = WriteAheadLog(self.directory, segment_size=256, batch_size=4)
+        self.fill(log, 50)
+        segments = len(log.segments)
+        self.assertGreater(log.compact(30), 0)
+        self.assertLess(len(log.segments), segments)
+        self.assertLessEqual(log.first_commit_id, 31)
+        self.assertEqual(log.get(31)['key'], 'k31')
+        self.assertIsNone(log.get(1))
+        log.close()
+        log = WriteAheadLog(self.directory, segment_size=256)
+        self.assertEqual(log.last_commit_id, 50)
+        log.reset(80)
+        self.assertEqual(len(log), 0)
+        self.fill(log, 2)
+        log.close()
+        log = WriteAheadLog(self.directory)
+        self.assertEqual((log.first_commit_id, log.last_commit_id), (81, 82))
+        log.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
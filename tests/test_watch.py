@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+"""Tests for the watches of keys, prefixes and namespaces."""
+
+
+import tempfile
+import unittest
+
+from raftnode import cfg
+from raftnode.store import Store
+
+
+class TestWatch(unittest.TestCase):
+    """Tests for `raftnode.watch` and `Store.watch`."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = Store(data_dir=self.tmp.name, log_name='leader')
+
+    def tearDown(self):
+        self.store.log.close()
+        self.tmp.cleanup()
+
+    def test_changes(self):
+        key = self.store.watch({'key': 'a'})
+        prefix = self.store.watch({'prefix': 'user:'})
+        other = self.store.watch({'namespace': 'other'})
+        self.store.put(1, {'key': 'a', 'value': 1}, None, 1)
+        self.store.mput(1, {'items': {'user:1': 'x', 'user:2': 'y', 'b': 2}}, None, 1)
+        self.store.mdelete(1, {'keys': ['a', 'user:1']}, None, 1)
+        self.assertTrue(key.ready)
+        self.assertEqual(key.take(), {'changes': [
+            {'commit_id': 1, 'key': 'a', 'value': 1},
+            {'commit_id': 3, 'key': 'a', 'delete': True}], 'commit_id': 3, 'coalesced': False})
+        self.assertEqual([(c['commit_id'], c['key']) for c in prefix.take()['changes']],
+                         [(2, 'user:1'), (2, 'user:2'), (3, 'user:1')])
+        self.assertFalse(other.ready)
+        self.assertEqual(other.take(), {'changes': [], 'commit_id': 0, 'coalesced': False})
+        self.store.unwatch(key)
+        self.assertEqual(key.take()['error'], '')
+        with self.assertRaises(ValueError):
+            self.store.watch({'key': 'a', 'prefix': 'a'})
+
+    def test_resume(self):
+        for i in range(10):
+            self.store.put(1, {'key': f'k{i % 3}', 'value': i}, None, 1)
+        watch = self.store.watch({'since': 4})
+        self.assertTrue(watch.replaying)
+        self.store.put(1, {'key': 'k0', 'value': 10}, None, 1)
+        replayed = watch.take(limit=4)
+        self.assertEqual([c['value'] for c in replayed['changes']], [4, 5, 6, 7])
+        self.assertEqual(replayed['commit_id'], 8)
+        self.assertEqual([c['value'] for c in watch.take()['changes']], [8, 9])
+        self.assertEqual([c['value'] for c in watch.take()['changes']], [10])
+
+    def test_coalesce(self):
+        buffer, cfg.WATCH_BUFFER = cfg.WATCH_BUFFER, 4
+        try:
+            watch = self.store.watch({})
+            for i in range(12):
+                self.store.put(1, {'key': f'k{i % 3}', 'value': i}, None, 1)
+            batch = watch.take()
+            self.assertTrue(batch['coalesced'])
+            self.assertEqual([(c['key'], c['value']) for c in batch['changes']],
+                             [('k0', 9), ('k1', 10), ('k2', 11)])
+            self.store.put(1, {'key': 'k0', 'value': 12}, None, 1)
+            self.assertFalse(watch.take()['coalesced'])
+            for i in range(6):
+                self.store.put(1, {'key': f'n{i}', 'value': i}, None, 1)
+            self.assertEqual(watch.take(), {'error': 'overflow', 'commit_id': 13})
+        finally:
+            cfg.WATCH_BUFFER = buffer
+
+
+if __name__ == '__main__':
+    unittest.main()